@@ -0,0 +1,71 @@
+"""
+Compares the cell by cell formatters with the column formatters of
+:class:`~pynance.dkb.DKBFormatters` on generated DKB style columns.
+
+Run it from the repository root::
+
+    $> python benchmarks/formatters_benchmark.py
+"""
+from __future__ import print_function, absolute_import
+
+import os.path
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from pynance.dkb import DKBFormatters  # noqa: E402
+
+SIZES = [10**3, 10**4, 10**5]
+REPEAT = 3
+
+
+def make_columns(size, seed=0):
+    """DKB like string columns for dates, amounts and texts"""
+    rng = np.random.RandomState(seed)
+
+    days = rng.randint(0, 3650, size)
+    dates = (np.datetime64('2010-01-01') + days).astype('datetime64[D]')
+    datestrs = pd.Series(pd.to_datetime(dates).strftime("%d.%m.%Y"))
+
+    amounts = np.round(rng.normal(0, 2000, size), 2)
+    amountstrs = pd.Series(["{:,.2f}".format(a)
+                            .replace(",", "_")
+                            .replace(".", ",")
+                            .replace("_", ".") for a in amounts])
+
+    textstrs = pd.Series(["Verwendungszweck %d " % i for i in range(size)])
+
+    return {
+        np.datetime64: datestrs,
+        np.float64: amountstrs,
+        str: textstrs
+    }
+
+
+def best_time(func):
+    return min(timeit.repeat(func, number=1, repeat=REPEAT))
+
+
+def main():
+    scalar = DKBFormatters.formatter_map()
+    vectorized = DKBFormatters.column_formatter_map()
+
+    print("%-10s %8s %12s %12s %8s" %
+          ("type", "rows", "scalar [s]", "column [s]", "speedup"))
+
+    for size in SIZES:
+        columns = make_columns(size)
+        for col_type, column in columns.items():
+            t_scalar = best_time(lambda: column.apply(scalar[col_type]))
+            t_vector = best_time(lambda: vectorized[col_type](column))
+            print("%-10s %8d %12.4f %12.4f %7.1fx" %
+                  (col_type.__name__, size, t_scalar, t_vector,
+                   t_scalar / t_vector))
+
+
+if __name__ == "__main__":
+    main()
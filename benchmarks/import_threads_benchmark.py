@@ -0,0 +1,78 @@
+"""
+Measures how many rows per second :func:`~pynance.textimporter.read_csv`
+imports with several threads that share a description, like a threaded
+server does with concurrent uploads. The parser and the formatters of
+numbers and dates do not hold the GIL, so the throughput should grow with
+the threads, up to the number of CPUs.
+
+Run it from the repository root::
+
+    $> python benchmarks/import_threads_benchmark.py
+"""
+from __future__ import print_function, absolute_import
+
+import io
+import multiprocessing
+import os.path
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from pynance.dkb import SupportedCsvTypes  # noqa: E402
+from pynance.textimporter import read_csv  # noqa: E402
+
+THREADS = [1, 2, 4, 8]
+ROWS = 60000
+# files read by all threads together
+FILES = 16
+
+
+def make_content(rows):
+    """the DKB Cash sample file, with its transactions repeated"""
+    sample_file = os.path.join(os.path.dirname(__file__), os.pardir,
+                               "pynance", "test_data", "dkb_cash_sample.csv")
+    with open(sample_file, "rb") as f:
+        lines = f.read().splitlines(True)
+
+    preamble = lines[:7]
+    transactions = [line for line in lines[7:] if line.strip()]
+    repeats = rows // len(transactions)
+    return b"".join(preamble + transactions * repeats)
+
+
+def rows_per_second(content, n_rows, n_threads):
+    def read(n_files):
+        for _ in range(n_files):
+            read_csv(io.BytesIO(content), SupportedCsvTypes.DKBCash)
+
+    threads = [threading.Thread(target=read, args=(FILES // n_threads,))
+               for _ in range(n_threads)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return FILES * n_rows / (time.time() - start)
+
+
+def main():
+    content = make_content(ROWS)
+    n_rows = len(read_csv(io.BytesIO(content), SupportedCsvTypes.DKBCash))
+
+    print("%d CPUs, %d files of %d rows" %
+          (multiprocessing.cpu_count(), FILES, n_rows))
+    print("%8s %12s %8s" % ("threads", "rows/s", "speedup"))
+
+    single = None
+    for n_threads in THREADS:
+        throughput = rows_per_second(content, n_rows, n_threads)
+        if single is None:
+            single = throughput
+        print("%8d %12.0f %7.1fx" % (n_threads, throughput,
+                                     throughput / single))
+
+
+if __name__ == "__main__":
+    main()
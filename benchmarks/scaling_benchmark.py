@@ -0,0 +1,252 @@
+"""
+Measures the time and peak memory of the import and the figures on
+synthetic DKB exports of growing size, see :mod:`pynance.synthetic`.
+
+Run it from the repository root::
+
+    $> python benchmarks/scaling_benchmark.py --sizes 1000 100000 1000000
+
+With ``--save``, the results are written to benchmarks/results/<commit>.json,
+so that a later run can be compared with them::
+
+    $> python benchmarks/scaling_benchmark.py --compare <commit>
+
+The time is the best of several runs. The peak memory is the largest amount
+allocated at once during one more run, as traced by tracemalloc, which
+includes the buffers of numpy and pandas. Python 2 has no tracemalloc, so
+there is no peak memory.
+
+The generated exports are kept in the temp directory, as they are the same
+for each run.
+"""
+from __future__ import print_function, absolute_import
+
+import argparse
+import base64
+import datetime
+import io
+import itertools
+import json
+import multiprocessing
+import os.path
+import platform
+import subprocess
+import sys
+import tempfile
+import timeit
+
+import numpy as np
+import pandas as pd
+
+try:
+    import tracemalloc
+except ImportError:
+    # python 2
+    tracemalloc = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from pynance.dkb import SupportedCsvTypes  # noqa: E402
+from pynance.synthetic import write_dkb_cash, write_dkb_visa  # noqa: E402
+from pynance.textimporter import read_csv, amounts_to_balances  # noqa: E402
+from pynance.dash_viz.plot_flow import parse_contents, merge_uploads, \
+    make_cashflow_figure, make_line_figure, update_bar_chart, update_line, \
+    datasets  # noqa: E402
+from pynance.dash_viz.datasets import IndexedDataset  # noqa: E402
+
+SIZES = [10**3, 10**4, 10**5, 10**6]
+REPEAT = 3
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+DATA_DIR = os.path.join(tempfile.gettempdir(), "pynance-benchmark-data")
+
+
+def export_path(kind, rows):
+    """path of a synthetic export, written on first use"""
+    if not os.path.isdir(DATA_DIR):
+        os.makedirs(DATA_DIR)
+    path = os.path.join(DATA_DIR, "%s-%d.csv" % (kind, rows))
+    if not os.path.isfile(path):
+        write = write_dkb_cash if kind == "cash" else write_dkb_visa
+        # written under another name first, so that an interrupted run
+        # leaves no partial export behind
+        write(path + ".tmp", rows)
+        os.rename(path + ".tmp", path)
+    return path
+
+
+def uploaded(path):
+    """the content of a file like the upload component passes it"""
+    with open(path, "rb") as f:
+        content = base64.b64encode(f.read()).decode("ascii")
+    return "data:application/vnd.ms-excel;base64," + content
+
+
+def new_selection(callback, key, first_date):
+    """
+    a figure callback that selects all transactions with a date picker
+    range that starts one day earlier on each call, so that the figure is
+    not taken from the cache but made each time
+    """
+    days = itertools.count()
+    return lambda: callback(
+        key, None, str(first_date - pd.Timedelta(days=next(days))), None,
+        None)
+
+
+def benchmarks(rows):
+    """
+    the benchmarks for exports with `rows` transactions, as pairs of name
+    and a function without arguments. The inputs are prepared here, so
+    that only the benchmarked function is measured
+    """
+    cash_path = export_path("cash", rows)
+    visa_path = export_path("visa", rows)
+    cash = SupportedCsvTypes.DKBCash
+
+    amounts = np.random.RandomState(0).normal(0, 100, rows).round(2)
+    contents = uploaded(cash_path)
+    # the transactions of two accounts, like an upload of both exports
+    df = merge_uploads([parse_contents(uploaded(path), "auto")
+                        for path in [cash_path, visa_path]])
+    # the merged upload, like after start_upload, for the callbacks
+    key = "benchmark-%d" % rows
+    datasets.put(key, IndexedDataset(df))
+    first_date = datasets.get(key).date_range()[0]
+
+    return [
+        ("read_csv", lambda: read_csv(cash_path, cash)),
+        ("read_total_balance", lambda: cash.read_total_balance(cash_path)),
+        ("amounts_to_balances", lambda: amounts_to_balances(amounts, 0.0)),
+        ("parse_contents", lambda: parse_contents(contents, "auto")),
+        ("make_cashflow_figure", lambda: make_cashflow_figure(df)),
+        ("make_line_figure", lambda: make_line_figure(df)),
+        ("IndexedDataset", lambda: IndexedDataset(df)),
+        ("update_bar_chart", new_selection(update_bar_chart, key,
+                                           first_date)),
+        ("update_line", new_selection(update_line, key, first_date)),
+    ]
+
+
+def peak_bytes(func):
+    """the most memory allocated at once while func runs"""
+    if tracemalloc is None:
+        return None
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(sizes, repeat=REPEAT):
+    results = []
+    for rows in sizes:
+        for name, func in benchmarks(rows):
+            seconds = min(timeit.repeat(func, number=1, repeat=repeat))
+            results.append({"benchmark": name,
+                            "rows": rows,
+                            "seconds": seconds,
+                            "peak_bytes": peak_bytes(func)})
+            print_result(results[-1])
+    return results
+
+
+def git_commit():
+    """the current commit, marked as dirty if there are changes"""
+    root = os.path.join(os.path.dirname(__file__), os.pardir)
+    try:
+        commit = subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=root)
+        changes = subprocess.check_output(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=root)
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    commit = commit.decode("ascii").strip()
+    return commit + "-dirty" if changes.strip() else commit
+
+
+def save(results, commit):
+    if not os.path.isdir(RESULTS_DIR):
+        os.makedirs(RESULTS_DIR)
+    path = os.path.join(RESULTS_DIR, "%s.json" % commit)
+    with open(path, "w") as f:
+        json.dump({"commit": commit,
+                   "date": datetime.datetime.now().isoformat(),
+                   "python": platform.python_version(),
+                   "numpy": np.__version__,
+                   "pandas": pd.__version__,
+                   "cpus": multiprocessing.cpu_count(),
+                   "results": results}, f, indent=1, sort_keys=True)
+    return path
+
+
+def load(commit_or_path):
+    path = commit_or_path
+    if not os.path.isfile(path):
+        path = os.path.join(RESULTS_DIR, "%s.json" % commit_or_path)
+    with io.open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def print_header(compared=False):
+    columns = ("benchmark", "rows", "time [s]", "peak [MB]")
+    line = "%-22s %10s %12s %10s" % columns
+    if compared:
+        line += " %8s %8s" % ("time", "memory")
+    print(line)
+
+
+def print_result(result, baseline=None):
+    peak = result["peak_bytes"]
+    line = "%-22s %10d %12.5f %10s" % (
+        result["benchmark"], result["rows"], result["seconds"],
+        "-" if peak is None else "%.1f" % (peak / 1024.0**2))
+    if baseline is not None:
+        line += " %7.2fx" % (result["seconds"] / baseline["seconds"])
+        if peak is not None and baseline["peak_bytes"]:
+            line += " %7.2fx" % (float(peak) / baseline["peak_bytes"])
+    print(line)
+
+
+def compare(results, baseline):
+    """prints the results relative to the ones of an earlier run"""
+    previous = dict(((r["benchmark"], r["rows"]), r)
+                    for r in baseline["results"])
+    print("\ncompared to %s (ratios > 1 are slower or larger)"
+          % baseline["commit"])
+    print_header(compared=True)
+    for result in results:
+        key = (result["benchmark"], result["rows"])
+        if key in previous:
+            print_result(result, previous[key])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES,
+                        help="numbers of transactions per export")
+    parser.add_argument("--repeat", type=int, default=REPEAT,
+                        help="runs per benchmark, the best time is kept")
+    parser.add_argument("--save", action="store_true",
+                        help="write the results to %s" % RESULTS_DIR)
+    parser.add_argument("--compare", metavar="COMMIT",
+                        help="commit or path of saved results to compare "
+                             "with")
+    args = parser.parse_args(argv)
+
+    baseline = load(args.compare) if args.compare else None
+    commit = git_commit()
+    print("commit %s, %d CPUs" % (commit, multiprocessing.cpu_count()))
+    print_header()
+    results = run(args.sizes, repeat=args.repeat)
+
+    if args.save:
+        print("\nsaved to %s" % save(results, commit))
+    if baseline is not None:
+        compare(results, baseline)
+
+
+if __name__ == "__main__":
+    main()
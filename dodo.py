@@ -12,6 +12,21 @@ def task_test():
     }
 
 
+def task_benchmark():
+    return {
+        'actions': [['python', 'benchmarks/formatters_benchmark.py'],
+                    ['python', 'benchmarks/import_threads_benchmark.py']],
+        'verbosity': 2
+    }
+
+
+def task_benchmark_scaling():
+    return {
+        'actions': [['python', 'benchmarks/scaling_benchmark.py', '--save']],
+        'verbosity': 2
+    }
+
+
 def task_graphviz():
     graph_dir = os.path.join(*["docs", "graphs"])
     graph_dot_files = glob.glob(os.path.join(graph_dir, "*.dot"))
@@ -34,6 +49,14 @@ def task_dash_app():
     }
 
 
+def task_serve_dash():
+    return {
+        'actions': [['gunicorn', '--workers', '4', '--threads', '4',
+                     '--bind', '0.0.0.0:8050', 'wsgi:application']],
+        'verbosity': 2
+    }
+
+
 def task_notebook():
     return {
         'actions': [['jupyter', 'notebook', '--notebook-dir=notebooks']],
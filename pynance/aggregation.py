@@ -0,0 +1,330 @@
+"""
+This module contains a materialized aggregation of transactions, so that
+reports like monthly sums per category do not group all transactions
+again and again, see use cases 4 and 6 in docs/usecases.md
+"""
+from __future__ import absolute_import
+
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# periods the transactions are aggregated to, as pandas frequency strings
+FREQUENCIES = ["D", "W", "M", "A"]
+
+# the columns a cube can be grouped by
+DIMENSIONS = ["origin", "category", "counterpart"]
+
+# the aggregated values of each cell and how cells are combined
+MEASURES = [("sum", "sum"),
+            ("count", "sum"),
+            ("min", "min"),
+            ("max", "max"),
+            ("incoming", "sum"),
+            ("outgoing", "sum")]
+
+_NS_PER_DAY = 24 * 3600 * 10**9
+
+# fmin and fmax ignore NaN, like pandas
+_REDUCERS = {"sum": np.add, "min": np.fmin, "max": np.fmax}
+_MEASURE_NAMES = [name for name, _ in MEASURES]
+
+
+# the cells of all transactions, the other views are rolled up from them
+_BASE_VIEW = ("D", tuple(DIMENSIONS))
+
+
+class AggregationCube():
+    """
+        Sums, counts, minimum and maximum amounts and the incoming and
+        outgoing sums of transactions per account (origin), category,
+        counterpart and day, rolled up to weeks, months and years
+
+        Queries are answered from materialized views, the cells of the
+        cube rolled up to a frequency and the dimensions a query needs.
+        A view is made on its first query and then kept up to date, so
+        e.g. a monthly report per category only groups a few cells per
+        month and category. The cube and its views are updated with the
+        new transactions of each import, only the periods of the new
+        transactions are aggregated again.
+    """
+
+    def __init__(self):
+        self._vocabularies = dict((dim, _Vocabulary()) for dim in DIMENSIONS)
+        self._views = {_BASE_VIEW: _empty_cells(DIMENSIONS)}
+
+    def update(self, df):
+        """
+        Adds transactions to the cube
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            transactions with the columns date, amount, origin, category,
+            sender_account and receiver_account. Compact frames are
+            supported. The counterpart of a transaction is its
+            sender_account, or its receiver_account if there is none
+
+        Returns
+        -------
+        AggregationCube : self
+        """
+        if len(df) == 0:
+            return self
+
+        day_cells = _combine(self._transaction_cells(df), DIMENSIONS)
+
+        for (freq, dims), cells in list(self._views.items()):
+            new_cells = _roll_up(day_cells, freq, dims)
+            self._views[freq, dims] = _merge(cells, new_cells, dims)
+
+        return self
+
+    def query(self,
+              freq="M",
+              by=("category",),
+              start=None,
+              end=None,
+              accounts=None,
+              categories=None,
+              counterparts=None):
+        """
+        Aggregates the transactions per period and the given dimensions
+
+        Parameters
+        ----------
+        freq : str
+            one of FREQUENCIES, days, weeks (starting on monday), months
+            or years
+        by : list of str
+            dimensions to group by, from DIMENSIONS. An empty list gives
+            the totals per period
+        start : numpy.datetime64 or str like '2018-12-01', optional
+            the period that contains this day is the first one
+        end : numpy.datetime64 or str like '2018-12-31', optional
+            the period that contains this day is the last one
+        accounts : list of str, optional
+            values of `origin` to include
+        categories : list of str, optional
+            values of `category` to include
+        counterparts : list of str, optional
+            counterpart accounts to include
+
+        Returns
+        -------
+        pandas.DataFrame : the columns period (start of the period), the
+            dimensions in `by` and sum, count, min, max, incoming and
+            outgoing, sorted by period and dimensions
+
+        Raises
+        ------
+        ValueError
+            if an unknown frequency or dimension is given
+        """
+        if freq not in FREQUENCIES:
+            raise ValueError("Unknown frequency: %r" % freq)
+        by = list(by)
+        unknown = [dim for dim in by if dim not in DIMENSIONS]
+        if unknown:
+            raise ValueError("Unknown dimensions: %s" % ", ".join(unknown))
+
+        filters = [(dim, values) for dim, values in [("origin", accounts),
+                                                     ("category", categories),
+                                                     ("counterpart",
+                                                      counterparts)]
+                   if values is not None]
+        cells = self._view(freq, set(by) | set(dim for dim, _ in filters))
+
+        # cells are sorted by period
+        periods = cells["period"].values
+        lo, hi = 0, len(cells)
+        if start is not None:
+            start = _period_starts(pd.DatetimeIndex([start]), freq)[0]
+            lo = np.searchsorted(periods, start, side="left")
+        if end is not None:
+            end = _period_starts(pd.DatetimeIndex([end]), freq)[0]
+            hi = max(lo, np.searchsorted(periods, end, side="right"))
+        cells = cells.iloc[lo:hi]
+
+        for dim, values in filters:
+            codes = self._vocabularies[dim].lookup(values)
+            cells = cells[np.isin(cells[dim].values, codes)]
+
+        result = _combine(cells, by)
+        for dim in by:
+            result[dim] = self._vocabularies[dim].decode(result[dim].values)
+
+        # by labels instead of codes
+        result = result.sort_values(["period"] + by).reset_index(drop=True)
+        return result[["period"] + by + _MEASURE_NAMES]
+
+    def __len__(self):
+        """number of cells per day, account, category and counterpart"""
+        return len(self._views[_BASE_VIEW])
+
+    def _view(self, freq, dims):
+        """the cells per period of freq and dims, made on first use"""
+        # in the order of DIMENSIONS, so that each view is made only once
+        dims = tuple(dim for dim in DIMENSIONS if dim in dims)
+        if (freq, dims) not in self._views:
+            self._views[freq, dims] = _roll_up(self._views[_BASE_VIEW],
+                                               freq, dims)
+        return self._views[freq, dims]
+
+    def _transaction_cells(self, df):
+        """one cell per transaction, with encoded dimensions"""
+        amounts = np.asarray(df["amount"], dtype=np.float64)
+        # missing amounts are counted, but not summed up
+        known_amounts = np.nan_to_num(amounts)
+
+        days = np.asarray(df["date"], dtype="datetime64[D]")
+
+        counterparts = np.array(df["sender_account"], dtype=object)
+        no_sender = pd.isna(counterparts)
+        counterparts[no_sender] = np.asarray(df["receiver_account"],
+                                             dtype=object)[no_sender]
+
+        vocabularies = self._vocabularies
+        cells = pd.DataFrame({
+            "period": days.astype("datetime64[ns]"),
+            "origin": vocabularies["origin"].encode(df["origin"]),
+            "category": vocabularies["category"].encode(df["category"]),
+            "counterpart": vocabularies["counterpart"].encode(counterparts),
+            "sum": known_amounts,
+            "count": np.ones(len(amounts), dtype=np.int64),
+            "min": amounts,
+            "max": amounts,
+            "incoming": np.where(amounts > 0, amounts, 0.0),
+            "outgoing": np.where(amounts < 0, amounts, 0.0)},
+            columns=["period"] + DIMENSIONS + _MEASURE_NAMES)
+        return cells
+
+
+class _Vocabulary():
+    """
+        Stable integer codes for the values of a dimension, -1 for missing
+        values
+    """
+
+    def __init__(self):
+        self._codes = {}
+        self._labels = []
+
+    def encode(self, values):
+        """codes of the values, new values are added"""
+        inverse, uniques = pd.factorize(np.asarray(values, dtype=object))
+
+        unique_codes = np.empty(len(uniques) + 1, dtype=np.int32)
+        for i, label in enumerate(uniques):
+            if label not in self._codes:
+                self._codes[label] = len(self._labels)
+                self._labels.append(label)
+            unique_codes[i] = self._codes[label]
+        # factorize gives -1 for missing values
+        unique_codes[-1] = -1
+
+        return unique_codes[inverse]
+
+    def lookup(self, values):
+        """codes of the known values"""
+        return np.array([self._codes[value] for value in values
+                         if value in self._codes], dtype=np.int32)
+
+    def decode(self, codes):
+        """the values of codes, NaN for -1"""
+        labels = np.array(self._labels + [np.nan], dtype=object)
+        return labels[codes]
+
+
+def _empty_cells(dims):
+    columns = OrderedDict([("period", np.array([], dtype="datetime64[ns]"))])
+    for dim in dims:
+        columns[dim] = np.array([], dtype=np.int32)
+    for name in _MEASURE_NAMES:
+        dtype = np.int64 if name == "count" else np.float64
+        columns[name] = np.array([], dtype=dtype)
+    return pd.DataFrame(columns)
+
+
+def _period_starts(dates, freq):
+    """the first day of the period each date is in"""
+    return pd.DatetimeIndex(dates).to_period(freq).start_time.values
+
+
+def _combine(cells, dims):
+    """combines the cells with equal period and dims, sorted by them"""
+    keys = [cells["period"].values.view(np.int64)]
+    keys += [cells[dim].values for dim in dims]
+
+    order = np.argsort(_composite_key(keys), kind="mergesort")
+    keys = [key[order] for key in keys]
+
+    # the first cell of each group
+    is_first = np.zeros(len(order), dtype=bool)
+    if len(order) > 0:
+        is_first[0] = True
+    for key in keys:
+        is_first[1:] |= key[1:] != key[:-1]
+    starts = np.flatnonzero(is_first)
+
+    columns = OrderedDict([("period", keys[0][starts].view("datetime64[ns]"))])
+    for dim, key in zip(dims, keys[1:]):
+        columns[dim] = key[starts]
+    for name, how in MEASURES:
+        values = cells[name].values[order]
+        if len(starts) == 0:
+            columns[name] = values
+        else:
+            columns[name] = _REDUCERS[how].reduceat(values, starts)
+    return pd.DataFrame(columns)
+
+
+def _composite_key(keys):
+    """
+    one int64 per cell that sorts like the keys, which is much faster to
+    sort than the keys themselves
+    """
+    if len(keys[0]) == 0:
+        return keys[0]
+
+    # days instead of nanoseconds, the periods start at midnight
+    days = keys[0] // _NS_PER_DAY
+    composite = days - days.min()
+    size = int(composite.max()) + 1
+    for key in keys[1:]:
+        # codes start at -1 for missing values
+        key_size = int(key.max()) + 2
+        size *= key_size
+        if size >= 2**62:
+            # too many combinations, sort by the keys instead
+            return np.lexsort(keys[::-1]).argsort(kind="mergesort")
+        composite = composite * key_size + (key + 1)
+    return composite
+
+
+def _roll_up(cells, freq, dims):
+    """combines day cells to cells per period of freq and dims"""
+    cells = cells[["period"] + list(dims) + _MEASURE_NAMES]
+    if freq != "D":
+        cells = cells.assign(period=_period_starts(cells["period"], freq))
+    return _combine(cells, dims)
+
+
+def _merge(cells, new_cells, dims):
+    """
+    adds new cells to cells sorted by period, only the cells in the
+    periods of the new cells are combined again
+    """
+    if len(cells) == 0:
+        return new_cells
+
+    periods = cells["period"].values
+    new_periods = new_cells["period"].values
+    lo = np.searchsorted(periods, new_periods[0], side="left")
+    hi = np.searchsorted(periods, new_periods[-1], side="right")
+
+    merged = _combine(pd.concat([cells.iloc[lo:hi], new_cells],
+                                ignore_index=True), dims)
+    return pd.concat([cells.iloc[:lo], merged, cells.iloc[hi:]],
+                     ignore_index=True)
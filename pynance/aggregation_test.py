@@ -0,0 +1,131 @@
+from __future__ import absolute_import
+
+import unittest
+
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+from numpy.testing import assert_array_equal, assert_array_almost_equal
+
+from .aggregation import AggregationCube, FREQUENCIES
+
+
+class AggregationCubeTestCase(unittest.TestCase):
+    def _df(self, n=2000, seed=0):
+        rng = np.random.RandomState(seed)
+        dates = np.datetime64("2016-01-01") + rng.randint(0, 3 * 365, n)
+        senders = rng.choice(["IBAN1", "IBAN2", None], n)
+        return pd.DataFrame({
+            "date": dates.astype("datetime64[ns]"),
+            "amount": rng.normal(0, 100, n).round(2),
+            "origin": rng.choice(["cash", "visa"], n),
+            "category": rng.choice(["rent", "food", "salary", np.nan], n),
+            "sender_account": senders,
+            "receiver_account": np.where(senders == None,  # noqa: E711
+                                         "IBAN3", None)})
+
+    def _expected(self, df, freq, by):
+        periods = pd.DatetimeIndex(df["date"]).to_period(freq).start_time
+        amounts = df["amount"]
+        df = df.assign(period=periods,
+                       counterpart=df["sender_account"].fillna(
+                           df["receiver_account"]),
+                       incoming=amounts.where(amounts > 0, 0.0),
+                       outgoing=amounts.where(amounts < 0, 0.0))
+        grouped = df.groupby(["period"] + by)
+        expected = pd.DataFrame({
+            "sum": grouped["amount"].sum(),
+            "count": grouped.size(),
+            "min": grouped["amount"].min(),
+            "max": grouped["amount"].max(),
+            "incoming": grouped["incoming"].sum(),
+            "outgoing": grouped["outgoing"].sum()})
+        return expected.reset_index()
+
+    def test_query_like_groupby(self):
+        df = self._df().dropna(subset=["category"])
+        cube = AggregationCube().update(df)
+
+        for freq in FREQUENCIES:
+            for by in [[], ["category"], ["origin", "counterpart"]]:
+                result = cube.query(freq, by)
+                expected = self._expected(df, freq, by)
+
+                self.assertListEqual(["period"] + by,
+                                     list(result.columns)[:len(by) + 1])
+                assert_array_equal(expected["period"].values,
+                                   result["period"].values)
+                for name in ["sum", "min", "max", "incoming", "outgoing"]:
+                    assert_array_almost_equal(expected[name].values,
+                                              result[name].values)
+                assert_array_equal(expected["count"].values,
+                                   result["count"].values)
+
+    def test_incremental_update(self):
+        df = self._df()
+        cube = AggregationCube().update(df)
+
+        # a view that exists before the update is kept up to date
+        cube.query("M", ["category"])
+        incremental = AggregationCube()
+        incremental.query("M", ["category"])
+        for part in np.array_split(np.arange(len(df)), 5):
+            incremental.update(df.iloc[part])
+
+        self.assertEqual(len(cube), len(incremental))
+        for freq, by in [("D", ["origin", "category", "counterpart"]),
+                         ("M", ["category"]),
+                         ("W", ["origin"])]:
+            assert_frame_equal(cube.query(freq, by),
+                               incremental.query(freq, by))
+
+    def test_missing_values(self):
+        df = pd.DataFrame({
+            "date": pd.to_datetime(["2018-12-03", "2018-12-04",
+                                    "2018-12-05"]),
+            "amount": [10.0, np.nan, -5.0],
+            "origin": "cash",
+            "category": [np.nan, np.nan, "food"],
+            "sender_account": np.nan,
+            "receiver_account": np.nan})
+
+        result = AggregationCube().update(df).query("A", ["category"])
+
+        self.assertEqual("food", result["category"][0])
+        self.assertTrue(pd.isna(result["category"][1]))
+        assert_array_equal([-5.0, 10.0], result["sum"].values)
+        assert_array_equal([1, 2], result["count"].values)
+        # the missing amount is counted, but ignored otherwise
+        self.assertEqual(10.0, result["max"][1])
+
+    def test_query_filters(self):
+        df = self._df()
+        cube = AggregationCube().update(df)
+
+        result = cube.query("M", ["category"], start="2017-03-15",
+                            end="2017-05-01", accounts=["visa"],
+                            categories=["food", "rent"])
+
+        selected = df[(df["date"] >= "2017-03-01") &
+                      (df["date"] < "2017-06-01") &
+                      (df["origin"] == "visa") &
+                      df["category"].isin(["food", "rent"])]
+        expected = self._expected(selected, "M", ["category"])
+        assert_array_equal(expected["category"].values,
+                           result["category"].values)
+        assert_array_almost_equal(expected["sum"].values,
+                                  result["sum"].values)
+
+        self.assertEqual(0, len(cube.query("M", accounts=["unknown"])))
+
+    def test_query_errors(self):
+        cube = AggregationCube()
+
+        self.assertRaises(ValueError, cube.query, "Q")
+        self.assertRaises(ValueError, cube.query, "M", ["text"])
+        self.assertEqual(0, len(cube.query()))
+
+
+def test_suite():
+    suite = unittest.makeSuite(AggregationCubeTestCase)
+    return suite
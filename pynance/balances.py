@@ -0,0 +1,164 @@
+"""
+This module contains the daily balances of accounts and their total, e.g.
+to show the net worth across all accounts over years of history
+"""
+from __future__ import absolute_import
+
+import numpy as np
+import pandas as pd
+
+
+class BalanceHistory():
+    """
+        The balance of each account at the end of each day with
+        transactions, which gives the balances of all accounts on a common
+        calendar by carrying the last balance forward
+
+        Before its first transaction, an account has its opening balance,
+        the balance before that transaction. The series of an account is
+        extended with the days of new transactions, only the days from the
+        first new one on are combined again.
+    """
+
+    def __init__(self):
+        # account -> (days, balance at the end of each day), by day
+        self._series = {}
+        # account -> balance before the first transaction
+        self._opening = {}
+
+    def update(self, df):
+        """
+        Adds transactions to the history
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            transactions of one or more accounts with the columns date,
+            amount, total_balance and origin. The transactions of each
+            account must be ordered like in the exports, the latest
+            performed transaction first. If a day is in the history
+            already, the balances of df replace the ones of that day
+
+        Returns
+        -------
+        BalanceHistory : self
+        """
+        n = len(df)
+        if n == 0:
+            return self
+
+        days = np.asarray(df["date"], dtype="datetime64[D]")
+        amounts = np.nan_to_num(np.asarray(df["amount"], dtype=float))
+        balances = np.asarray(df["total_balance"], dtype=float)
+        codes, accounts = pd.factorize(
+            pd.Series(np.asarray(df["origin"], dtype=object)).fillna(""))
+
+        # by account and day, a stable sort of the reversed rows keeps the
+        # order of the transactions of one account on the same day
+        day_numbers = days.view(np.int64)
+        keys = codes.astype(np.int64) * (int(np.ptp(day_numbers)) + 1) \
+            + (day_numbers - day_numbers.min())
+        order = n - 1 - np.argsort(keys[::-1], kind="mergesort")
+        keys = keys[order]
+
+        # the first transaction of each account and the last one of each day
+        first = np.r_[True, codes[order][1:] != codes[order][:-1]]
+        last = np.r_[keys[1:] != keys[:-1], True]
+
+        ends = np.flatnonzero(last)
+        starts = np.flatnonzero(first)
+        account_ends = np.searchsorted(ends, np.r_[starts[1:], n])
+        account_starts = np.r_[0, account_ends[:-1]]
+        for first_row, lo, hi in zip(order[starts], account_starts,
+                                     account_ends):
+            account = accounts[codes[first_row]]
+            self._extend(account,
+                         days[order[ends[lo:hi]]],
+                         balances[order[ends[lo:hi]]],
+                         balances[first_row] - amounts[first_row])
+
+        return self
+
+    def accounts(self):
+        """the accounts in the history, sorted"""
+        return sorted(self._series)
+
+    def frame(self, start=None, end=None, accounts=None, freq="D"):
+        """
+        The balances of the accounts and their total on a common calendar
+
+        Parameters
+        ----------
+        start : numpy.datetime64 or str like '2018-12-01', optional
+            first day, defaults to the first day of the history
+        end : numpy.datetime64 or str like '2018-12-31', optional
+            last day, defaults to the last day of the history
+        accounts : list of str, optional
+            accounts to include, defaults to all of them
+        freq : str
+            pandas frequency of the calendar, e.g. "D" for each day or "M"
+            for the last day of each month
+
+        Returns
+        -------
+        pandas.DataFrame : a column of balances per account and their sum
+            in the column total, indexed by date
+        """
+        if accounts is None:
+            accounts = self.accounts()
+        else:
+            accounts = sorted(a for a in accounts if a in self._series)
+
+        calendar = np.array([], dtype="datetime64[D]")
+        if accounts:
+            if start is None:
+                start = min(self._series[a][0][0] for a in accounts)
+            if end is None:
+                end = max(self._series[a][0][-1] for a in accounts)
+            calendar = pd.date_range(start, end, freq=freq).values \
+                .astype("datetime64[D]")
+
+        columns = {}
+        for account in accounts:
+            days, balances = self._series[account]
+            # the last day with transactions up to each calendar day
+            index = np.searchsorted(days, calendar, side="right") - 1
+            columns[account] = np.where(index >= 0,
+                                        balances[np.maximum(index, 0)],
+                                        self._opening[account])
+
+        df = pd.DataFrame(columns,
+                          index=pd.DatetimeIndex(calendar, name="date"),
+                          columns=accounts)
+        df["total"] = df.sum(axis=1)
+        return df
+
+    def _extend(self, account, days, balances, opening):
+        """adds the balances of an account at the end of days in order"""
+        if account not in self._series:
+            self._series[account] = (days, balances)
+            self._opening[account] = opening
+            return
+
+        old_days, old_balances = self._series[account]
+        if days[0] < old_days[0]:
+            self._opening[account] = opening
+
+        lo = np.searchsorted(old_days, days[0], side="left")
+        if lo == len(old_days):
+            # the usual case, a later export
+            self._series[account] = (np.r_[old_days, days],
+                                     np.r_[old_balances, balances])
+            return
+
+        # the new days come last, so they win on equal days
+        tail_days = np.r_[old_days[lo:], days]
+        tail_balances = np.r_[old_balances[lo:], balances]
+        order = np.argsort(tail_days, kind="mergesort")
+        tail_days = tail_days[order]
+        tail_balances = tail_balances[order]
+        last = np.r_[tail_days[1:] != tail_days[:-1], True]
+
+        self._series[account] = (np.r_[old_days[:lo], tail_days[last]],
+                                 np.r_[old_balances[:lo],
+                                       tail_balances[last]])
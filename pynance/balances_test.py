@@ -0,0 +1,81 @@
+from __future__ import absolute_import
+
+import unittest
+
+import numpy as np
+import pandas as pd
+from numpy.testing import assert_array_equal, assert_array_almost_equal
+
+from .balances import BalanceHistory
+from .textimporter import amounts_to_balances
+
+
+class BalanceHistoryTestCase(unittest.TestCase):
+    def setUp(self):
+        # latest transaction first, like in the exports
+        self.df = pd.DataFrame({
+            "date": pd.to_datetime(["2018-12-05", "2018-12-01",
+                                    "2018-12-04", "2018-12-02",
+                                    "2018-12-02"]),
+            "amount": [10.0, -5.0, 1.0, 2.0, 3.0],
+            "total_balance": [105.0, 95.0, 13.0, 12.0, 10.0],
+            "origin": ["a", "a", "b", "b", "b"]})
+
+    def test_frame(self):
+        history = BalanceHistory().update(self.df)
+        df = history.frame()
+
+        self.assertListEqual(["a", "b", "total"], list(df.columns))
+        assert_array_equal(pd.date_range("2018-12-01", "2018-12-05").values,
+                           df.index.values)
+        # b has its opening balance on the first day, and the balance
+        # after its latest transaction at the end of 2018-12-02
+        assert_array_equal([95.0, 95.0, 95.0, 95.0, 105.0], df["a"].values)
+        assert_array_equal([7.0, 12.0, 12.0, 13.0, 13.0], df["b"].values)
+        assert_array_equal(df["a"].values + df["b"].values,
+                           df["total"].values)
+
+    def test_frame_selection(self):
+        history = BalanceHistory().update(self.df)
+
+        df = history.frame(start="2018-11-30", end="2018-12-03",
+                           accounts=["b", "unknown"])
+        self.assertListEqual(["b", "total"], list(df.columns))
+        assert_array_equal([7.0, 7.0, 12.0, 12.0], df["total"].values)
+
+        df = history.frame(freq="M")
+        self.assertEqual(0, len(df))
+        df = history.frame(end="2019-02-01", freq="M")
+        assert_array_equal([118.0, 118.0], df["total"].values)
+
+        self.assertEqual(0, len(BalanceHistory().frame()))
+
+    def test_incremental_like_complete(self):
+        rng = np.random.RandomState(0)
+        n = 1000
+        dates = np.sort(np.datetime64("2015-01-01")
+                        + rng.randint(0, 4 * 365, n))[::-1]
+        amounts = rng.normal(0, 100, n).round(2)
+        df = pd.DataFrame({
+            "date": dates.astype("datetime64[ns]"),
+            "amount": amounts,
+            "total_balance": amounts_to_balances(amounts, 1000.0),
+            "origin": "cash"})
+
+        complete = BalanceHistory().update(df).frame()
+
+        # an older export, then a later one that overlaps with it
+        history = BalanceHistory().update(df.iloc[400:])
+        history.update(df.iloc[:500])
+        pd.testing.assert_frame_equal(complete, history.frame())
+
+        # a later export, then an earlier one
+        history = BalanceHistory().update(df.iloc[:500])
+        history.update(df.iloc[500:])
+        assert_array_almost_equal(complete["total"].values,
+                                  history.frame()["total"].values)
+
+
+def test_suite():
+    suite = unittest.makeSuite(BalanceHistoryTestCase)
+    return suite
@@ -0,0 +1,302 @@
+"""
+This module contains a cache for parsed csv files, so that files which are
+imported again and again are only parsed once.
+"""
+from __future__ import absolute_import
+
+import hashlib
+import io
+import json
+import os
+import os.path
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from .definitions import COLUMNS
+from .textimporter import read_csv_with_preamble
+from .compact import compact as compact_df
+
+try:
+    import pyarrow.feather as feather
+except ImportError:
+    feather = None
+
+# os.replace is atomic on all platforms, but missing in python 2
+_replace = getattr(os, 'replace', os.rename)
+
+# part of each key, must be increased whenever the stored frames change,
+# so that entries of older versions are not read anymore
+CACHE_FORMAT_VERSION = 1
+
+# files modified less than this many seconds ago are always hashed, as a
+# change within the resolution of their modification time would not be
+# noticed
+_RACY_SECONDS = 2.0
+
+# number of files whose key is remembered in the index
+_INDEX_SIZE = 1024
+
+
+class ParseCache():
+    """
+        A content addressed on-disk cache for the results of
+        :func:`~textimporter.read_csv`
+
+        Entries are keyed by a hash of the raw bytes of a file and the
+        fingerprint of the CsvFileDescription it was read with, so a changed
+        file or description never gives a stale result. The fingerprint
+        includes textimporter.PARSER_VERSION, the key includes
+        CACHE_FORMAT_VERSION.
+
+        Hashing a large file takes a good part of the time of a hit. So the
+        key of a file that is given by its path is remembered in an index,
+        together with the path, size, modification time and inode of the
+        file. As long as these do not change, the file is not read again.
+
+        Frames are stored as Arrow IPC (feather) files, or as pickles if
+        pyarrow is not installed. Reading an entry still converts it into
+        a new DataFrame. When the cache grows beyond `max_bytes`, the least
+        recently used entries are removed.
+    """
+
+    def __init__(self, directory, max_bytes=512 * 1024**2):
+        """
+        Parameters
+        ----------
+        directory : str
+            directory for the cache entries, created if it does not exist
+        max_bytes : int
+            upper bound for the total size of all entries
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._extension = ".arrow" if feather is not None else ".pkl"
+        self._index_path = os.path.join(directory, "index.json")
+
+    def read_csv(self, filepath_or_buffer, description, compact=False):
+        """
+        Like :func:`~textimporter.read_csv`, but returns the cached frame if
+        the same content was read with the same description before
+
+        Parameters
+        ----------
+        filepath_or_buffer : str, pathlib.Path, py._path.local.LocalPath or
+            any object with a read() method
+        description : CsvFileDescription
+        compact : bool
+            convert the result with :func:`~compact.compact`. Entries are
+            stored uncompacted, so both variants share them
+
+        Returns
+        -------
+        pandas.DataFrame
+        """
+        file_key = None
+        if hasattr(filepath_or_buffer, 'read'):
+            content = filepath_or_buffer.read()
+        else:
+            filepath = str(filepath_or_buffer)
+            stat = os.stat(filepath)
+            file_key = self._file_key(filepath, stat, description)
+
+            key = self._read_index().get(file_key)
+            df = None if key is None else self._load(self._entry_path(key))
+            if df is not None:
+                self.hits += 1
+                return compact_df(df) if compact else df
+
+            with open(filepath, 'rb') as f:
+                content = f.read()
+            if len(content) != stat.st_size \
+                    or time.time() - stat.st_mtime < _RACY_SECONDS:
+                # changed while it was read, or may change unnoticed
+                file_key = None
+
+        key = self.key(content, description)
+        path = self._entry_path(key)
+
+        df = self._load(path)
+        if df is None:
+            self.misses += 1
+            if isinstance(content, bytes):
+                buffer = io.BytesIO(content)
+            else:
+                buffer = io.StringIO(content)
+            df, _ = read_csv_with_preamble(buffer, description)
+            self._store(path, df)
+        else:
+            self.hits += 1
+
+        if file_key is not None:
+            self._remember(file_key, key)
+
+        if compact:
+            df = compact_df(df)
+
+        return df
+
+    @staticmethod
+    def key(content, description):
+        """
+        The cache key for raw file content read with a description
+
+        Parameters
+        ----------
+        content : bytes or str
+        description : CsvFileDescription
+
+        Returns
+        -------
+        str : hex digest
+        """
+        if not isinstance(content, bytes):
+            content = content.encode('utf-8')
+
+        content_hash = hashlib.sha256(content)
+        content_hash.update(description.fingerprint().encode('ascii'))
+        content_hash.update(b'\0%d' % CACHE_FORMAT_VERSION)
+        return content_hash.hexdigest()
+
+    @staticmethod
+    def _file_key(filepath, stat, description):
+        """
+        the key of a file in the index, it changes with the file and the
+        description
+        """
+        # python 2 has no modification times in nanoseconds
+        mtime = getattr(stat, 'st_mtime_ns', None) or repr(stat.st_mtime)
+        parts = [os.path.realpath(filepath), stat.st_size, mtime,
+                 stat.st_ino, description.fingerprint(),
+                 CACHE_FORMAT_VERSION]
+        return hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()
+
+    def _read_index(self):
+        """the keys of the files in the index"""
+        try:
+            with io.open(self._index_path, encoding='ascii') as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            # missing, or written by an incompatible version
+            return {}
+
+    def _remember(self, file_key, key):
+        """adds the key of a file to the index"""
+        index = self._read_index()
+        if index.get(file_key) == key:
+            return
+        index[file_key] = key
+        if len(index) > _INDEX_SIZE:
+            # keep the keys of the entries that still exist
+            index = dict(item for item in index.items()
+                         if os.path.exists(self._entry_path(item[1])))
+            while len(index) > _INDEX_SIZE:
+                index.popitem()
+
+        # other processes may update the index as well, the last one wins
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(index, f)
+            _replace(tmp_path, self._index_path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+    def size(self):
+        """total size of all entries in bytes"""
+        return sum(size for _, _, size in self._entries())
+
+    def clear(self):
+        """removes all entries"""
+        for path, _, _ in self._entries():
+            os.remove(path)
+        if os.path.exists(self._index_path):
+            os.remove(self._index_path)
+
+    def _entry_path(self, key):
+        return os.path.join(self.directory, key + self._extension)
+
+    def _entries(self):
+        """path, last use and size of all entries"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(self._extension):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # removed in the meantime
+                continue
+            entries.append((path, stat.st_mtime, stat.st_size))
+        return entries
+
+    def _load(self, path):
+        # text columns that contain None instead of NaN
+        null_columns = []
+        try:
+            if feather is not None:
+                table = feather.read_table(path)
+                df = table.to_pandas()
+                # the null counts are known without a pass over the column
+                null_columns = [name for i, name
+                                in enumerate(table.schema.names)
+                                if table.column(i).null_count > 0]
+            else:
+                df = pd.read_pickle(path)
+            # mark the entry as recently used
+            os.utime(path, None)
+        except (IOError, OSError, ValueError):
+            # missing or unreadable, pyarrow raises ValueErrors
+            return None
+
+        # arrow has no typed empty text columns, restore NaN instead of None
+        for col_name in null_columns:
+            if COLUMNS.get(col_name) is str:
+                col = df[col_name]
+                df[col_name] = col.where(col.notna(), np.nan)
+
+        return df
+
+    def _store(self, path, df):
+        # write to a temporary file first, so that no reader ever sees a
+        # partially written entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        os.close(fd)
+        try:
+            if feather is not None:
+                feather.write_feather(df.reset_index(drop=True), tmp_path)
+            else:
+                df.to_pickle(tmp_path)
+            _replace(tmp_path, path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+        self._evict()
+
+    def _evict(self):
+        entries = self._entries()
+        total = sum(size for _, _, size in entries)
+
+        # least recently used first
+        entries.sort(key=lambda entry: entry[1])
+        for path, _, size in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.evictions += 1
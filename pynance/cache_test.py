@@ -0,0 +1,138 @@
+from __future__ import absolute_import, print_function
+
+import unittest
+import os
+import os.path
+import shutil
+import tempfile
+
+from pandas.testing import assert_frame_equal
+
+from .cache import ParseCache
+from .textimporter import read_csv, CsvFileDescription
+from .dkb import SupportedCsvTypes
+
+
+class ParseCacheTestCase(unittest.TestCase):
+    cash_file = os.path.join("pynance", "test_data", "dkb_cash_sample.csv")
+    visa_file = os.path.join("pynance", "test_data", "dkb_visa_sample.csv")
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_hit_gives_same_frame(self):
+        cache = ParseCache(self.directory)
+        expected_df = read_csv(self.cash_file, SupportedCsvTypes.DKBCash)
+
+        first_df = cache.read_csv(self.cash_file, SupportedCsvTypes.DKBCash)
+        second_df = read_csv(self.cash_file, SupportedCsvTypes.DKBCash,
+                             cache=cache)
+
+        self.assertEqual(1, cache.misses)
+        self.assertEqual(1, cache.hits)
+        assert_frame_equal(expected_df, first_df)
+        assert_frame_equal(expected_df, second_df)
+
+    def test_shared_between_instances(self):
+        ParseCache(self.directory).read_csv(self.cash_file,
+                                            SupportedCsvTypes.DKBCash)
+
+        cache = ParseCache(self.directory)
+        with open(self.cash_file, "rb") as f:
+            cache.read_csv(f, SupportedCsvTypes.DKBCash)
+
+        self.assertEqual(1, cache.hits)
+
+    def test_key_depends_on_description(self):
+        dkbcash = SupportedCsvTypes.DKBCash
+        scalar_description = CsvFileDescription(
+            column_map=dkbcash.column_map,
+            csv_dialect=dkbcash.csv_dialect,
+            formatters=dkbcash.formatters,
+            skiprows=dkbcash.skiprows,
+            encoding=dkbcash.encoding,
+            total_balance_re_pattern=dkbcash.total_balance_re_pattern,
+            total_balance_formatter=dkbcash.total_balance_formatter)
+
+        self.assertNotEqual(dkbcash.fingerprint(),
+                            scalar_description.fingerprint())
+
+        cache = ParseCache(self.directory)
+        cache.read_csv(self.cash_file, dkbcash)
+        cache.read_csv(self.cash_file, scalar_description)
+
+        self.assertEqual(2, cache.misses)
+        self.assertEqual(0, cache.hits)
+
+    def test_lru_eviction(self):
+        cache = ParseCache(self.directory)
+        cache.read_csv(self.cash_file, SupportedCsvTypes.DKBCash)
+        entry_size = cache.size()
+
+        # room for a single entry only
+        cache.max_bytes = entry_size + entry_size // 2
+
+        # make the cash entry look old, then add the visa entry
+        for name in os.listdir(self.directory):
+            os.utime(os.path.join(self.directory, name), (0, 0))
+        cache.read_csv(self.visa_file, SupportedCsvTypes.DKBVisa)
+
+        self.assertEqual(1, cache.evictions)
+        self.assertEqual(1, len([name for name in os.listdir(self.directory)
+                                 if name != "index.json"]))
+
+        cache.read_csv(self.visa_file, SupportedCsvTypes.DKBVisa)
+        cache.read_csv(self.cash_file, SupportedCsvTypes.DKBCash)
+        self.assertEqual(1, cache.hits)
+        self.assertEqual(3, cache.misses)
+
+    def test_file_not_hashed_again(self):
+        hashed = []
+
+        class CountingCache(ParseCache):
+            @staticmethod
+            def key(content, description):
+                hashed.append(len(content))
+                return ParseCache.key(content, description)
+
+        path = os.path.join(self.directory, "cash.csv")
+        shutil.copy(self.cash_file, path)
+        # recently modified files are hashed each time
+        cache = CountingCache(os.path.join(self.directory, "cache"))
+        cache.read_csv(path, SupportedCsvTypes.DKBCash)
+        cache.read_csv(path, SupportedCsvTypes.DKBCash)
+        self.assertEqual(2, len(hashed))
+
+        os.utime(path, (1000000000, 1000000000))
+        cache.read_csv(path, SupportedCsvTypes.DKBCash)
+        first_df = cache.read_csv(path, SupportedCsvTypes.DKBCash)
+        self.assertEqual(3, len(hashed))
+        self.assertEqual(3, cache.hits)
+        assert_frame_equal(read_csv(self.cash_file,
+                                    SupportedCsvTypes.DKBCash), first_df)
+
+        # a changed file is read again, also with the same size
+        with open(path, "rb") as f:
+            content = f.read()
+        with open(path, "wb") as f:
+            f.write(content.replace(b"FLIXBUS", b"FLIXBAS"))
+        os.utime(path, (1000000001, 1000000001))
+        changed_df = cache.read_csv(path, SupportedCsvTypes.DKBCash)
+        self.assertEqual(4, len(hashed))
+        self.assertEqual(1, changed_df["text"].str.contains("FLIXBAS").sum())
+
+    def test_clear(self):
+        cache = ParseCache(self.directory)
+        cache.read_csv(self.cash_file, SupportedCsvTypes.DKBCash)
+        self.assertGreater(cache.size(), 0)
+
+        cache.clear()
+        self.assertEqual(0, cache.size())
+
+
+def test_suite():
+    suite = unittest.makeSuite(ParseCacheTestCase)
+    return suite
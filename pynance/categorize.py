@@ -0,0 +1,406 @@
+"""
+This module contains a rule based categorization of transactions, which
+fills the `category` column, see COLUMNS in definitions.py
+"""
+from __future__ import absolute_import
+
+import re
+
+import numpy as np
+import pandas as pd
+
+# number of regex rules merged into one pattern, python 2 supports at most
+# 100 groups per pattern
+_REGEX_BATCH_SIZE = 90
+
+# syntax that depends on the groups or flags of the whole pattern: numbered
+# backreferences and conditionals, named groups and their references, and
+# global inline flags. Escapes are matched first, so that e.g. \\1 is not
+# taken for a backreference
+_UNMERGEABLE_RE = re.compile(
+    r"(\\[1-9])|\\.|(\(\?(?:P[<=]|<(?![=!])|\(|[aiLmsux]+\)))", re.S)
+
+
+class Rule():
+    """
+        Assigns a category to the transactions that match one condition:
+
+        * substring: the text contains a string, ignoring case
+        * regex: the text matches a regular expression, see re.search
+        * account: the counterpart account, i.e. the sender_account or, if
+          there is none, the receiver_account, equals a string
+        * min_amount and/or max_amount: the amount is in a closed range
+    """
+
+    def __init__(self,
+                 name,
+                 category,
+                 substring=None,
+                 regex=None,
+                 account=None,
+                 min_amount=None,
+                 max_amount=None,
+                 priority=0):
+        """
+        Parameters
+        ----------
+        name : str
+            identifies the rule when explaining a categorization
+        category : str
+            category of the matching transactions
+        substring, regex, account, min_amount, max_amount :
+            the condition, see above. Only one kind of condition can be
+            given, but min_amount and max_amount can be combined
+        priority : int
+            if more than one rule matches a transaction, the rule with the
+            highest priority wins, and of those the first one in the rule
+            set
+
+        Raises
+        ------
+        ValueError
+            if not exactly one kind of condition is given
+        """
+        kinds = [kind for kind, given in [
+            ("substring", substring is not None),
+            ("regex", regex is not None),
+            ("account", account is not None),
+            ("amount", min_amount is not None or max_amount is not None)]
+            if given]
+        if len(kinds) != 1:
+            raise ValueError("Rule %r needs exactly one kind of condition, "
+                             "not %d" % (name, len(kinds)))
+        if substring is not None and not substring:
+            raise ValueError("Rule %r has an empty substring" % name)
+
+        self.name = name
+        self.category = category
+        self.kind = kinds[0]
+        self.substring = substring
+        self.regex = regex
+        self.account = account
+        self.min_amount = min_amount
+        self.max_amount = max_amount
+        self.priority = priority
+
+    def __repr__(self):
+        return "Rule(%r, %r, %s)" % (self.name, self.category, self.kind)
+
+
+class RuleSet():
+    """
+        A set of rules compiled into combined matchers, so that the cost of
+        a categorization grows with the number of transactions, but hardly
+        with the number of rules
+
+        * all substrings are merged into one regular expression that has
+          the shape of a trie. It finds every substring that occurs in a
+          text in a single scan of the text
+        * regular expressions are merged into alternatives in the order of
+          their priority, the first matching alternative is the best rule.
+          Each of them still scans the text, so substrings should be
+          preferred where they suffice. Expressions with backreferences,
+          named groups or global inline flags like (?i) would change their
+          meaning in a merged pattern, they are matched on their own
+        * accounts are looked up in a dict
+        * amount ranges are split into disjoint intervals, each amount is
+          found by binary search
+
+        Texts and accounts are matched once per distinct value, not once
+        per transaction.
+    """
+
+    def __init__(self, rules):
+        """
+        Parameters
+        ----------
+        rules : list of Rule
+        """
+        self.rules = list(rules)
+
+        # rank 0 is the best rule: highest priority, then first in the list
+        order = sorted(range(len(self.rules)),
+                       key=lambda i: (-self.rules[i].priority, i))
+        self._rank_to_rule = np.array(order + [-1], dtype=np.int64)
+        # rank of no matching rule
+        self._no_rank = len(self.rules)
+
+        by_rank = [self.rules[i] for i in order]
+        self._compile_substrings(by_rank)
+        self._compile_regexes(by_rank)
+        self._compile_accounts(by_rank)
+        self._compile_amounts(by_rank)
+
+    def match(self, df):
+        """
+        Finds the best matching rule for each transaction
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            transactions with the columns text, amount, sender_account and
+            receiver_account
+
+        Returns
+        -------
+        numpy.ndarray of int : the position of the matching rule in
+            `rules` for each transaction, -1 if no rule matches
+        """
+        best = self._text_ranks(df["text"])
+
+        counterparts = np.array(df["sender_account"], dtype=object)
+        no_sender = pd.isna(counterparts)
+        counterparts[no_sender] = np.asarray(df["receiver_account"],
+                                             dtype=object)[no_sender]
+        best = np.minimum(best, self._account_ranks(counterparts))
+
+        best = np.minimum(best, self._amount_ranks(df["amount"]))
+
+        return self._rank_to_rule[best]
+
+    def categorize(self, df, overwrite=False):
+        """
+        Fills the category column with the category of the best matching
+        rule
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            transactions with the columns text, amount, sender_account,
+            receiver_account and category
+        overwrite : bool
+            also change categories that are set already
+
+        Returns
+        -------
+        pandas.DataFrame : a copy of df with the new categories
+        """
+        matches = self.match(df)
+        categories = self._categories()[matches]
+
+        current = np.array(df["category"], dtype=object)
+        use_rule = matches >= 0
+        if not overwrite:
+            use_rule &= pd.isna(current)
+        current[use_rule] = categories[use_rule]
+
+        new_df = df.copy()
+        new_df["category"] = current
+        return new_df
+
+    def explain(self, df):
+        """
+        Tells which rule categorizes each transaction
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            transactions, see match
+
+        Returns
+        -------
+        pandas.Series : the name of the best matching rule for each
+            transaction, NaN if no rule matches
+        """
+        names = np.array([rule.name for rule in self.rules] + [np.nan],
+                         dtype=object)
+        return pd.Series(names[self.match(df)], index=df.index,
+                         name="rule")
+
+    def _categories(self):
+        """the category of each rule and NaN for -1"""
+        return np.array([rule.category for rule in self.rules] + [np.nan],
+                        dtype=object)
+
+    def _compile_substrings(self, by_rank):
+        # best rank of each substring and of all substrings it starts with
+        own_ranks = {}
+        for rank, rule in enumerate(by_rank):
+            if rule.kind == "substring":
+                own_ranks.setdefault(rule.substring.upper(), rank)
+
+        self._substring_ranks = {}
+        for word in sorted(own_ranks, key=len):
+            best = own_ranks[word]
+            for end in range(1, len(word)):
+                if word[:end] in own_ranks:
+                    best = min(best, own_ranks[word[:end]])
+            self._substring_ranks[word] = best
+
+        if own_ranks:
+            # the lookahead finds the longest substring at each position,
+            # also where they overlap
+            self._substring_re = re.compile(
+                "(?=(%s))" % _trie_pattern(own_ranks))
+        else:
+            self._substring_re = None
+
+    def _compile_regexes(self, by_rank):
+        regex_rules = [(rank, rule) for rank, rule in enumerate(by_rank)
+                       if rule.kind == "regex"]
+
+        # merged patterns of consecutive rules, with the rank of each
+        # marker group, and patterns of single rules, with their rank. They
+        # are kept in the order of the ranks
+        self._regexes = []
+        batch = []
+        for rank, rule in regex_rules:
+            if not _mergeable(rule.regex):
+                if batch:
+                    self._regexes.append(_merged_regexes(batch))
+                    batch = []
+                self._regexes.append((re.compile(rule.regex), None, rank))
+                continue
+            batch.append((rank, rule))
+            if len(batch) == _REGEX_BATCH_SIZE:
+                self._regexes.append(_merged_regexes(batch))
+                batch = []
+        if batch:
+            self._regexes.append(_merged_regexes(batch))
+
+    def _compile_accounts(self, by_rank):
+        self._account_ranks_map = {}
+        for rank, rule in enumerate(by_rank):
+            if rule.kind == "account":
+                self._account_ranks_map.setdefault(rule.account, rank)
+
+    def _compile_amounts(self, by_rank):
+        amount_rules = [(rank, rule) for rank, rule in enumerate(by_rank)
+                        if rule.kind == "amount"]
+
+        bounds = set()
+        for _, rule in amount_rules:
+            bounds.update(bound for bound in [rule.min_amount,
+                                              rule.max_amount]
+                          if bound is not None)
+        self._bounds = np.array(sorted(bounds), dtype=np.float64)
+
+        # the slots are the open intervals between the bounds and the
+        # bounds themselves: (-inf, b0), b0, (b0, b1), b1, ..., (bk, inf)
+        n_slots = 2 * len(self._bounds) + 1
+        self._slot_ranks = np.full(n_slots, self._no_rank, dtype=np.int64)
+        # the best rules come last, so that they are set last
+        for rank, rule in amount_rules[::-1]:
+            first, last = 0, n_slots - 1
+            if rule.min_amount is not None:
+                first = 2 * np.searchsorted(self._bounds, rule.min_amount) + 1
+            if rule.max_amount is not None:
+                last = 2 * np.searchsorted(self._bounds, rule.max_amount) + 1
+            self._slot_ranks[first:last + 1] = rank
+
+    def _text_ranks(self, texts):
+        """best rank of the text rules for each text"""
+        codes, uniques = pd.factorize(np.asarray(texts, dtype=object))
+
+        unique_ranks = np.full(len(uniques) + 1, self._no_rank,
+                               dtype=np.int64)
+        if self._substring_re is not None or self._regexes:
+            for i, text in enumerate(uniques):
+                unique_ranks[i] = self._text_rank(text)
+
+        # factorize gives -1 for missing texts
+        return unique_ranks[codes]
+
+    def _text_rank(self, text):
+        best = self._no_rank
+
+        if self._substring_re is not None:
+            upper_text = text.upper()
+            for match in self._substring_re.finditer(upper_text):
+                best = min(best, self._substring_ranks[match.group(1)])
+
+        for pattern, group_ranks, rank in self._regexes:
+            if group_ranks is None:
+                if pattern.search(text) is not None:
+                    return min(best, rank)
+                continue
+            match = pattern.match(text)
+            if match is not None:
+                # the batches are in the order of the ranks
+                return min(best, group_ranks[match.lastindex])
+
+        return best
+
+    def _account_ranks(self, accounts):
+        """best rank of the account rules for each account"""
+        codes, uniques = pd.factorize(accounts)
+        unique_ranks = np.array([self._account_ranks_map.get(account,
+                                                             self._no_rank)
+                                 for account in uniques] + [self._no_rank],
+                                dtype=np.int64)
+        return unique_ranks[codes]
+
+    def _amount_ranks(self, amounts):
+        """best rank of the amount rules for each amount"""
+        amounts = np.asarray(amounts, dtype=np.float64)
+        if len(self._bounds) == 0:
+            return np.full(len(amounts), self._slot_ranks[0], dtype=np.int64)
+
+        index = np.searchsorted(self._bounds, amounts)
+        is_bound = self._bounds[np.minimum(index, len(self._bounds) - 1)] \
+            == amounts
+        slots = 2 * index + is_bound
+
+        ranks = self._slot_ranks[slots]
+        ranks[np.isnan(amounts)] = self._no_rank
+        return ranks
+
+
+def _mergeable(regex):
+    """whether regex keeps its meaning as an alternative of a pattern"""
+    return not any(backreference or group
+                   for backreference, group
+                   in _UNMERGEABLE_RE.findall(regex))
+
+
+def _merged_regexes(rules):
+    """
+    Merges regex rules into one pattern that matches at the start of a
+    text, its lastindex is the marker group of the best matching rule
+
+    Returns
+    -------
+    tuple of pattern, dict of int: int, None : the pattern, the rank of
+        each marker group and no rank of a single rule
+    """
+    alternatives = []
+    group_ranks = {}
+    n_groups = 0
+    for rank, rule in rules:
+        n_groups += re.compile(rule.regex).groups + 1
+        group_ranks[n_groups] = rank
+        # the empty group marks the matching alternative
+        alternatives.append(r"(?=[\s\S]*?(?:%s))()" % rule.regex)
+    pattern = re.compile("^(?:%s)" % "|".join(alternatives))
+    return pattern, group_ranks, None
+
+
+def _trie_pattern(words):
+    """
+    a regular expression that matches the longest of the words at a
+    position, in time that depends on the length of the words but not on
+    their number
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        # marks the end of a word
+        node[""] = {}
+
+    def pattern(node):
+        alternatives = [re.escape(char) + pattern(child)
+                        for char, child in sorted(node.items()) if char]
+        if not alternatives:
+            return ""
+        if len(alternatives) == 1:
+            merged = alternatives[0]
+        else:
+            merged = "(?:%s)" % "|".join(alternatives)
+        if "" in node:
+            # a word ends here, longer words are tried first
+            merged = "(?:%s)?" % merged
+        return merged
+
+    return pattern(trie)
@@ -0,0 +1,181 @@
+from __future__ import absolute_import
+
+import unittest
+
+import numpy as np
+import pandas as pd
+from numpy.testing import assert_array_equal
+
+from .categorize import Rule, RuleSet
+
+
+class RuleSetTestCase(unittest.TestCase):
+    def setUp(self):
+        self.df = pd.DataFrame({
+            "text": ["PP . FLIXBUS, Ihr Einkauf bei FLIXBUS",
+                     "Miete 2017",
+                     "Vers.-Nr.0065435465",
+                     "Lidl sagt Danke",
+                     np.nan],
+            "amount": [-12.16, 120.0, -10.0, -25.0, np.nan],
+            "sender_account": [None, "DE63500105173984825797", None, None,
+                               None],
+            "receiver_account": ["DE39500105174461799382", None,
+                                 "DE75500105178797957724", None, None],
+            "category": [np.nan, np.nan, "insurance", np.nan, np.nan]})
+
+    def test_rule_kinds(self):
+        rules = RuleSet([
+            Rule("flixbus", "travel", substring="flixbus"),
+            Rule("rent", "rent", regex=r"^Miete \d{4}$"),
+            Rule("insurance", "insurance",
+                 account="DE75500105178797957724"),
+            Rule("small", "misc", min_amount=-30.0, max_amount=-20.0)])
+
+        assert_array_equal([0, 1, 2, 3, -1], rules.match(self.df))
+        self.assertListEqual(["flixbus", "rent", "insurance", "small"],
+                             rules.explain(self.df).tolist()[:4])
+        self.assertTrue(np.isnan(rules.explain(self.df).iloc[4]))
+
+    def test_priorities(self):
+        rules = RuleSet([
+            Rule("bus", "travel", substring="BUS"),
+            Rule("flix", "leisure", substring="flix"),
+            Rule("negative", "expenses", max_amount=0.0, priority=-1),
+            Rule("paypal", "online", account="DE39500105174461799382",
+                 priority=1)])
+
+        # the higher priority wins over the order of the rules, and the
+        # first of equal priority rules wins
+        assert_array_equal([3, -1, 2, 2, -1], rules.match(self.df))
+
+        rules = RuleSet([Rule("flixbus", "travel", substring="flixbus"),
+                         Rule("flix", "leisure", substring="flix",
+                              priority=1)])
+        self.assertEqual(1, rules.match(self.df)[0])
+
+        rules = RuleSet([Rule("flix", "leisure", substring="flix"),
+                         Rule("flixbus", "travel", substring="flixbus")])
+        self.assertEqual(0, rules.match(self.df)[0])
+
+    def test_amount_bounds_inclusive(self):
+        rules = RuleSet([Rule("low", "low", max_amount=-12.16),
+                         Rule("high", "high", min_amount=120.0)])
+        assert_array_equal([0, 1, -1, 0, -1], rules.match(self.df))
+
+    def test_categorize(self):
+        rules = RuleSet([Rule("all", "other", min_amount=-1000.0),
+                         Rule("rent", "rent", substring="miete",
+                              priority=1)])
+
+        categorized = rules.categorize(self.df)
+        self.assertListEqual(["other", "rent", "insurance", "other"],
+                             categorized["category"].tolist()[:4])
+        self.assertTrue(np.isnan(categorized["category"].iloc[4]))
+        # the original is unchanged
+        self.assertTrue(np.isnan(self.df["category"].iloc[0]))
+
+        categorized = rules.categorize(self.df, overwrite=True)
+        self.assertEqual("other", categorized["category"].iloc[2])
+
+    def test_invalid_rules(self):
+        self.assertRaises(ValueError, Rule, "none", "x")
+        self.assertRaises(ValueError, Rule, "two", "x", substring="a",
+                          regex="b")
+        self.assertRaises(ValueError, Rule, "empty", "x", substring="")
+
+    def _match_texts(self, rules, texts):
+        df = pd.DataFrame({"text": texts,
+                           "amount": np.nan,
+                           "sender_account": None,
+                           "receiver_account": None})
+        return RuleSet(rules).match(df)
+
+    def test_regex_backreferences(self):
+        # the numbers of the groups change in a merged pattern
+        rules = [Rule("group", "x", regex=r"(a)b"),
+                 Rule("double", "x", regex=r"(\w)\1"),
+                 Rule("named", "x", regex=r"(?P<c>\d)-(?P=c)"),
+                 Rule("conditional", "x", regex=r"(<)?z(?(1)>)$"),
+                 Rule("escaped", "x", regex=r"\\1")]
+        assert_array_equal([0, 1, 0, 2, -1, 3, 3, -1, 4],
+                           self._match_texts(rules, [
+                               "ab", "xyyx", "aab", "1-1", "1-2", "<z>",
+                               "z", "<z!", "a\\1"]))
+
+    def test_regex_named_groups(self):
+        # a name can only be given to one group of a pattern
+        rules = [Rule("first", "x", regex=r"(?P<word>foo)"),
+                 Rule("second", "x", regex=r"(?P<word>bar)"),
+                 Rule("plain", "x", regex=r"baz")]
+        assert_array_equal([0, 1, 2, -1],
+                           self._match_texts(rules, ["foo", "a bar",
+                                                     "baz", "qux"]))
+
+    def test_regex_inline_flags(self):
+        # global flags apply to a whole pattern, and python 3.11 rejects
+        # them elsewhere than at its start
+        rules = [Rule("case", "x", regex=r"case"),
+                 Rule("ignore", "x", regex=r"(?i)rent"),
+                 Rule("multiline", "x", regex=r"(?m)^b$"),
+                 Rule("after", "x", regex=r"CASE")]
+        assert_array_equal([-1, 0, 1, 1, 2, 3],
+                           self._match_texts(rules, ["Case", "case",
+                                                     "RENT", "rent",
+                                                     "a\nb", "CASE"]))
+
+    def test_unmergeable_regexes_keep_ranks(self):
+        rules = [Rule("r%d" % i, "x", regex="r%d$" % i) for i in range(200)]
+        rules[100] = Rule("flags", "x", regex="(?i)^R19", priority=1)
+        rules[150] = Rule("back", "x", regex=r"(1)\1")
+        assert_array_equal([100, 1, 150, 5, -1],
+                           self._match_texts(rules, ["R199", "r1", "x11",
+                                                     "r5", "x"]))
+
+    def test_many_rules_like_single_rules(self):
+        rng = np.random.RandomState(0)
+        words = ["".join(rng.choice(list("abcdef"), rng.randint(2, 5)))
+                 for _ in range(300)]
+        texts = ["".join(rng.choice(list("abcdef "), 20))
+                 for _ in range(500)]
+        df = pd.DataFrame({"text": texts,
+                           "amount": rng.normal(0, 100, 500).round(),
+                           "sender_account": rng.choice(["A", "B", "C"], 500),
+                           "receiver_account": None})
+
+        rules = [Rule("s%d" % i, "x", substring=word, priority=i % 7)
+                 for i, word in enumerate(words)]
+        rules += [Rule("r%d" % i, "y", regex=r"%s\s" % word, priority=i % 5)
+                  for i, word in enumerate(words[:150])]
+        rules += [Rule("a", "z", account="B", priority=3),
+                  Rule("m", "z", min_amount=50.0, max_amount=100.0,
+                       priority=4)]
+
+        # the best rule by checking each rule on its own
+        matches = np.zeros((len(rules), len(df)), dtype=bool)
+        for i, rule in enumerate(rules):
+            if rule.kind == "substring":
+                matches[i] = df["text"].str.upper().str.contains(
+                    rule.substring.upper(), regex=False)
+            elif rule.kind == "regex":
+                matches[i] = df["text"].str.contains(rule.regex)
+            elif rule.kind == "account":
+                matches[i] = df["sender_account"] == rule.account
+            else:
+                matches[i] = df["amount"].between(rule.min_amount,
+                                                  rule.max_amount)
+        expected = []
+        for row in range(len(df)):
+            matching = np.flatnonzero(matches[:, row])
+            if len(matching) == 0:
+                expected.append(-1)
+            else:
+                expected.append(min(matching,
+                                    key=lambda i: (-rules[i].priority, i)))
+
+        assert_array_equal(expected, RuleSet(rules).match(df))
+
+
+def test_suite():
+    suite = unittest.makeSuite(RuleSetTestCase)
+    return suite
@@ -0,0 +1,98 @@
+"""
+This module contains functions to store transaction DataFrames with less
+memory and to measure how much memory they need.
+"""
+from __future__ import absolute_import, division
+
+import numpy as np
+import pandas as pd
+
+from .definitions import COLUMNS, CATEGORICAL_COLUMNS
+
+
+def _text_dtype():
+    """
+    a string dtype that stores all strings of a column in one contiguous
+    arrow buffer, or None if pandas or pyarrow are too old for that
+    """
+    try:
+        import pyarrow  # noqa: F401
+        return pd.StringDtype("pyarrow")
+    except (ImportError, TypeError, ValueError):
+        return None
+
+
+def compact(df, float32=False):
+    """
+    Converts a transactions DataFrame into a representation that needs
+    less memory
+
+    * columns in CATEGORICAL_COLUMNS become categoricals
+    * other text columns use an arrow backed string dtype if available,
+      otherwise they become categoricals if their values repeat a lot
+    * numeric columns without any value become sparse, i.e. constant NaN
+      columns that take no memory until values are set
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        transactions with the columns defined in COLUMNS, as returned by
+        :func:`~textimporter.read_csv`
+    float32 : bool
+        also store the amounts and balances as float32. This halves their
+        memory, but only keeps about 7 significant digits
+
+    Returns
+    -------
+    pandas.DataFrame : a new DataFrame with the same values as `df`
+    """
+    text_dtype = _text_dtype()
+    new_df = pd.DataFrame(index=df.index)
+
+    for col_name in df.columns:
+        col = df[col_name]
+        col_type = COLUMNS.get(col_name)
+
+        if col_type is str:
+            if col_name in CATEGORICAL_COLUMNS or col.isna().all():
+                col = col.astype("category")
+            elif text_dtype is not None:
+                col = col.astype(text_dtype)
+            elif col.nunique() <= len(col) // 2:
+                col = col.astype("category")
+        elif col_type is np.float64:
+            if col.isna().all():
+                col = col.astype(pd.SparseDtype(np.float64, np.nan))
+            elif float32:
+                col = col.astype(np.float32)
+
+        new_df[col_name] = col
+
+    return new_df
+
+
+def memory_report(df):
+    """
+    Tells how much memory each column of a DataFrame needs
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+
+    Returns
+    -------
+    pandas.DataFrame : one row per column of `df` and a last row `total`,
+        with the columns `dtype`, `bytes` and `bytes_per_row`. Memory of
+        python objects, e.g. strings, is included
+    """
+    n_bytes = df.memory_usage(index=False, deep=True)
+    n_bytes["total"] = n_bytes.sum()
+
+    dtypes = df.dtypes.astype(str)
+    dtypes["total"] = ""
+
+    report = pd.DataFrame({"dtype": dtypes, "bytes": n_bytes},
+                          columns=["dtype", "bytes"])
+    report["bytes_per_row"] = report["bytes"] / max(len(df), 1)
+
+    return report
@@ -0,0 +1,92 @@
+from __future__ import absolute_import, print_function
+
+import unittest
+import os.path
+
+import numpy as np
+import pandas as pd
+from numpy.testing import assert_array_equal
+
+from .compact import compact, memory_report
+from .definitions import COLUMNS, CATEGORICAL_COLUMNS
+from .textimporter import read_csv
+from .dkb import SupportedCsvTypes
+
+
+class CompactTestCase(unittest.TestCase):
+    def read_dummy_file_dkbcash_small(self, **kwargs):
+        dummyfile_dkbcash_small = os.path.join("pynance",
+                                               "test_data",
+                                               "dkb_cash_sample.csv")
+        return read_csv(dummyfile_dkbcash_small,
+                        SupportedCsvTypes.DKBCash,
+                        **kwargs)
+
+    def test_compact_same_values(self):
+        df = self.read_dummy_file_dkbcash_small()
+        compact_df = compact(df)
+
+        self.assertListEqual(list(COLUMNS), list(compact_df.columns))
+        for col_name in COLUMNS:
+            self.assertListEqual(df[col_name].isna().tolist(),
+                                 compact_df[col_name].isna().tolist())
+            expected = df[col_name].dropna().tolist()
+            self.assertListEqual(expected,
+                                 compact_df[col_name].dropna().tolist())
+
+    def test_compact_dtypes(self):
+        compact_df = self.read_dummy_file_dkbcash_small(compact=True)
+
+        for col_name in CATEGORICAL_COLUMNS:
+            self.assertEqual("category", compact_df[col_name].dtype.name)
+
+        # columns with values keep their dtype
+        self.assertIsInstance(compact_df["amount"].dtype, np.dtype)
+        self.assertTrue(np.issubdtype(compact_df["date"].dtype,
+                                      np.datetime64))
+
+    def test_compact_empty_float_column(self):
+        df = pd.DataFrame({"amount": [np.nan] * 1000,
+                           "total_balance": np.arange(1000.0)})
+        compact_df = compact(df, float32=True)
+
+        self.assertEqual(0, compact_df["amount"].memory_usage(index=False))
+        self.assertEqual(np.float32, compact_df["total_balance"].dtype)
+        assert_array_equal(df["total_balance"].values,
+                           compact_df["total_balance"].values)
+
+    def test_compact_saves_memory(self):
+        n = 10000
+        df = pd.DataFrame({
+            "date": np.repeat(np.datetime64("2019-01-01"), n),
+            "sender_account": ["DE%020d" % (i % 10) for i in range(n)],
+            "receiver_account": [np.nan] * n,
+            "text": ["Miete %d" % (i % 100) for i in range(n)],
+            "amount": np.ones(n),
+            "total_balance": np.arange(n, dtype=np.float64),
+            "currency": ["EUR"] * n,
+            "category": [np.nan] * n,
+            "tags": [np.nan] * n,
+            "origin": ["DE95500105178154844163"] * n},
+            columns=list(COLUMNS))
+
+        before = memory_report(df)
+        after = memory_report(compact(df))
+
+        self.assertLess(after.loc["total", "bytes"],
+                        before.loc["total", "bytes"] / 4)
+
+    def test_memory_report(self):
+        df = pd.DataFrame({"a": np.ones(10), "b": np.ones(10, np.int8)})
+        report = memory_report(df)
+
+        self.assertListEqual(["a", "b", "total"], list(report.index))
+        self.assertListEqual([80, 10, 90], report["bytes"].tolist())
+        self.assertListEqual([8.0, 1.0, 9.0],
+                             report["bytes_per_row"].tolist())
+        self.assertEqual("float64", report.loc["a", "dtype"])
+
+
+def test_suite():
+    suite = unittest.makeSuite(CompactTestCase)
+    return suite
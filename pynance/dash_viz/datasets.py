@@ -0,0 +1,564 @@
+"""
+Server side storage for the datasets of the dash app. Callbacks only pass
+the key of a dataset through the browser, never the data itself.
+"""
+from __future__ import absolute_import
+
+import hashlib
+import os
+import os.path
+import pickle
+import re
+import stat
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from pynance.balances import BalanceHistory
+from pynance.dash_viz.downsample import DailyAmounts, daily_extremes
+
+
+def dataset_key(*parts):
+    """
+    Content hash that identifies a dataset, e.g. of the uploaded file
+    content and the csv type it is parsed with
+
+    Params:
+    -------
+    parts: str or bytes
+        everything that determines the content of the dataset
+
+    Returns:
+    --------
+    str
+        hex digest
+    """
+    key = hashlib.sha256()
+    for part in parts:
+        if not isinstance(part, bytes):
+            part = str(part).encode('utf-8')
+        key.update(part)
+        # separate the parts, so that ('ab', 'c') != ('a', 'bc')
+        key.update(b'\0')
+    return key.hexdigest()
+
+
+class DatasetCache():
+    """
+        Keeps the most recently used datasets in memory
+    """
+
+    def __init__(self, max_items=16):
+        """
+        Params:
+        -------
+        max_items: int
+            number of datasets to keep, the least recently used are dropped
+        """
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key):
+        """the dataset stored under key, or None"""
+        with self._lock:
+            if key not in self._items:
+                self._misses += 1
+                return None
+            self._hits += 1
+            dataset = self._items.pop(key)
+            # mark as most recently used
+            self._items[key] = dataset
+            return dataset
+
+    def put(self, key, dataset):
+        """stores a dataset under key"""
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = dataset
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def stats(self):
+        """number of lookups with get that found a dataset, and not"""
+        with self._lock:
+            return {"hits": self._hits, "misses": self._misses}
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._items
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
+
+
+# os.replace is atomic on all platforms, but missing in python 2
+_replace = getattr(os, 'replace', os.rename)
+
+# keys are hex digests or uuids, anything else is never a stored dataset
+_KEY_RE = re.compile(r'^[0-9a-f]+$')
+
+
+def private_directory(directory):
+    """
+    Creates a directory that only the current user can access, or checks
+    that an existing one is such a directory. Datasets are unpickled from
+    it, so anybody who could write to it could run code in the app
+
+    Params:
+    -------
+    directory: str
+
+    Returns:
+    --------
+    str
+        the directory
+
+    Raises:
+    -------
+    IOError
+        if the directory belongs to another user or others can write to it
+    """
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory, 0o700)
+        except OSError:
+            # created by another process in the meantime
+            if not os.path.isdir(directory):
+                raise
+
+    # there are no owners and modes like this on windows
+    if hasattr(os, 'getuid'):
+        status = os.lstat(directory)
+        if stat.S_ISLNK(status.st_mode) or status.st_uid != os.getuid():
+            raise IOError("The cache directory %r does not belong to the "
+                          "current user" % directory)
+        if status.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+            raise IOError("Other users can write to the cache directory %r"
+                          % directory)
+    return directory
+
+
+class DiskDatasetCache():
+    """
+        Keeps datasets as pickles in a directory, so that all processes of
+        a multi-worker server share them
+
+        When the directory grows beyond `max_bytes`, the least recently
+        used datasets are removed. The datasets this process used last are
+        kept in memory as well, so they are only unpickled once.
+    """
+
+    def __init__(self, directory, max_bytes=1024**3, memory_items=4):
+        """
+        Params:
+        -------
+        directory: str
+            directory for the datasets, created if it does not exist. It
+            must be private to the current user, see private_directory
+        max_bytes: int
+            upper bound for the total size of all stored datasets
+        memory_items: int
+            number of datasets that are kept in memory as well
+        """
+        self.directory = private_directory(directory)
+        self.max_bytes = max_bytes
+        self._memory = DatasetCache(max_items=memory_items)
+        # hits and misses of this process
+        self._stats_lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key):
+        """the dataset stored under key, or None"""
+        dataset = self._get(key)
+        with self._stats_lock:
+            if dataset is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+        return dataset
+
+    def _get(self, key):
+        path = self._path(key)
+        if path is None:
+            return None
+
+        dataset = self._memory.get(key)
+        try:
+            if dataset is None:
+                with open(path, 'rb') as f:
+                    dataset = pickle.load(f)
+                self._memory.put(key, dataset)
+            # mark as recently used for all processes
+            os.utime(path, None)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            # not stored, removed by another process or partially written
+            # by an older version
+            return dataset
+        return dataset
+
+    def put(self, key, dataset):
+        """stores a dataset under key"""
+        path = self._path(key)
+        if path is None:
+            raise ValueError("Invalid dataset key %r" % key)
+
+        # write to a temporary file first, so that no process ever reads
+        # a partially written dataset
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(dataset, f, protocol=pickle.HIGHEST_PROTOCOL)
+            _replace(tmp_path, path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+        self._memory.put(key, dataset)
+        self._evict()
+
+    def stats(self):
+        """
+        number of lookups with get that found a dataset, and not, in this
+        process
+        """
+        with self._stats_lock:
+            return {"hits": self._hits, "misses": self._misses}
+
+    def size(self):
+        """total size of all stored datasets in bytes"""
+        return sum(size for _, _, size in self._entries())
+
+    def __contains__(self, key):
+        path = self._path(key)
+        return path is not None and os.path.isfile(path)
+
+    def __len__(self):
+        return len(self._entries())
+
+    def _path(self, key):
+        if key is None or not _KEY_RE.match(key):
+            return None
+        return os.path.join(self.directory, key + ".pkl")
+
+    def _entries(self):
+        """path, last use and size of all stored datasets"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".pkl"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # removed in the meantime
+                continue
+            entries.append((path, stat.st_mtime, stat.st_size))
+        return entries
+
+    def _evict(self):
+        entries = self._entries()
+        total = sum(size for _, _, size in entries)
+
+        # least recently used first
+        entries.sort(key=lambda entry: entry[1])
+        for path, _, size in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+
+def make_cache(name, max_items=16, environ=None):
+    """
+    The cache for the datasets of the dash app, shared by all processes
+    if the environment variable PYNANCE_CACHE_DIR is set
+
+    Params:
+    -------
+    name: str
+        name of the cache, a subdirectory of PYNANCE_CACHE_DIR
+    max_items: int
+        number of datasets kept by a cache in memory
+    environ: dict, optional
+        defaults to os.environ. PYNANCE_CACHE_MAX_MB limits the size of
+        each cache on disk, 1024 MB by default
+
+    Returns:
+    --------
+    DiskDatasetCache or DatasetCache
+    """
+    if environ is None:
+        environ = os.environ
+
+    directory = environ.get("PYNANCE_CACHE_DIR")
+    if not directory:
+        return DatasetCache(max_items=max_items)
+
+    max_mb = int(environ.get("PYNANCE_CACHE_MAX_MB", 1024))
+    private_directory(directory)
+    return DiskDatasetCache(os.path.join(directory, name),
+                            max_bytes=max_mb * 1024**2)
+
+
+class IndexedDataset():
+    """
+        Transactions sorted by date, newest first like in the bank exports.
+        Date ranges are found by binary search, so slicing a dataset
+        does not scan the whole frame
+
+        The amounts per day and the balances of each account are prepared
+        once, so that the figures of a range are made from its days
+        instead of all of its transactions.
+    """
+
+    def __init__(self, df):
+        """
+        Params:
+        -------
+        df: pandas.DataFrame
+            transactions with at least a date column. Transactions of
+            different accounts are told apart by the origin column
+        """
+        self.frame = _sort_newest_first(df)
+        self._dates = _ascending_dates(self.frame)
+
+        # the transactions of each account, in the same order
+        self._accounts = {}
+        # positions of the transactions in frame, None for all accounts
+        positions = {None: np.arange(len(self.frame))}
+        if "origin" in self.frame:
+            groups = self.frame.groupby("origin", sort=True, observed=True)
+            for account, rows in groups.indices.items():
+                part = self.frame.iloc[rows]
+                self._accounts[account] = (part, _ascending_dates(part))
+                positions[account] = rows
+
+        # account -> incoming and outgoing DailyAmounts with the positions
+        # of their transactions, ascending by date
+        self._amounts = {}
+        if "amount" in self.frame:
+            amounts = self.frame["amount"].values
+            for account, rows in positions.items():
+                rows = rows[::-1]
+                self._amounts[account] = [
+                    _daily_amounts(rows[mask], self._dates, amounts)
+                    for mask in (amounts[rows] >= 0, amounts[rows] < 0)]
+
+        # account -> balances and the points to downsample them from,
+        # ascending by date like the dates of the account
+        self._balances = {}
+        self._history = None
+        if "total_balance" in self.frame:
+            balances = self.frame["total_balance"].values
+            for account, rows in positions.items():
+                if account is None and self._accounts:
+                    continue
+                dates = self._dates if account is None \
+                    else self._accounts[account][1]
+                account_balances = balances[rows[::-1]]
+                valid = np.flatnonzero(dates != np.iinfo(np.int64).min)
+                self._balances[account] = (
+                    account_balances,
+                    valid[daily_extremes(dates[valid].view("M8[ns]"),
+                                         account_balances[valid])])
+            if self._accounts and "amount" in self.frame:
+                self._history = BalanceHistory().update(self.frame)
+
+    def __getstate__(self):
+        # the accounts are rebuilt from the frame, not stored twice
+        return {"frame": self.frame}
+
+    def __setstate__(self, state):
+        self.__init__(state["frame"])
+
+    def accounts(self):
+        """the sorted values of the origin column"""
+        return sorted(self._accounts)
+
+    def date_range(self):
+        """first and last date of the transactions, None if there are none"""
+        dates = self._dates[self._dates != np.iinfo(np.int64).min]
+        if len(dates) == 0:
+            return None
+        return pd.Timestamp(dates[0]), pd.Timestamp(dates[-1])
+
+    def select(self, start=None, end=None, accounts=None):
+        """
+        The transactions in a date range, newest first
+
+        Params:
+        -------
+        start: date like, optional
+            first date to include, e.g. '2018-12-01'
+        end: date like, optional
+            last date to include
+        accounts: list of str, optional
+            origins to include, all transactions if None
+
+        Returns:
+        --------
+        pandas.DataFrame
+            the selected rows, a slice of `frame` if not more than one
+            account is selected
+        """
+        if accounts is None:
+            return _slice(self.frame, self._dates, start, end)
+
+        parts = []
+        for account in accounts:
+            if account in self._accounts:
+                part, dates = self._accounts[account]
+                parts.append(_slice(part, dates, start, end))
+
+        if not parts:
+            return self.frame.iloc[:0]
+        if len(parts) == 1:
+            return parts[0]
+        return _sort_newest_first(pd.concat(parts))
+
+    def daily_amounts(self, accounts=None):
+        """
+        The amounts of transactions summed up per day, by direction
+
+        Params:
+        -------
+        accounts: list of str, optional
+            origins to include, all transactions if None
+
+        Returns:
+        --------
+        list of two lists of tuples
+            for incoming and outgoing amounts, a DailyAmounts for each
+            account and the positions in `frame` of its transactions,
+            ascending by date. Transactions without date or amount are
+            left out
+        """
+        keys = [None] if accounts is None else \
+            [a for a in accounts if a in self._amounts]
+        return [[self._amounts[key][i] for key in keys] for i in (0, 1)]
+
+    def balances(self, start=None, end=None, accounts=None):
+        """
+        The balance after each transaction of the accounts in a date range
+
+        Params:
+        -------
+        start, end: date like, optional
+            first and last date to include
+        accounts: list of str, optional
+            origins to include, all of them if None
+
+        Returns:
+        --------
+        list of tuples
+            for each account with transactions in the range, sorted, the
+            account (None without origin column), the ascending dates as
+            datetime64, the balances and the indices of the daily lowest,
+            highest and last balances among them
+        """
+        if accounts is None:
+            accounts = sorted(self._accounts) if self._accounts else [None]
+        else:
+            accounts = sorted(accounts)
+        lines = []
+        for account in accounts:
+            if account not in self._balances:
+                continue
+            dates = self._dates if account is None \
+                else self._accounts[account][1]
+            lo, hi = _bounds(dates, start, end)
+            if lo == hi:
+                continue
+            balances, extremes = self._balances[account]
+            a, b = np.searchsorted(extremes, [lo, hi])
+            lines.append((account,
+                          dates[lo:hi].view("M8[ns]"),
+                          balances[lo:hi],
+                          extremes[a:b] - lo))
+        return lines
+
+    def total_balance(self, start, end, accounts):
+        """
+        The sum of the balances of accounts at the end of each day
+
+        Params:
+        -------
+        start, end: date like
+            first and last day
+        accounts: list of str
+
+        Returns:
+        --------
+        pandas.Series
+            the total, indexed by date, see BalanceHistory.frame
+        """
+        return self._history.frame(np.datetime64(start, "D"),
+                                   np.datetime64(end, "D"),
+                                   accounts)["total"]
+
+    def __len__(self):
+        return len(self.frame)
+
+
+def _date_values(df):
+    """dates of df as nanoseconds, NaT is the smallest value"""
+    return pd.to_datetime(df["date"], cache=False).values.view(np.int64)
+
+
+def _ascending_dates(df):
+    """the dates of a frame sorted newest first, as an ascending view"""
+    return _date_values(df)[::-1]
+
+
+def _sort_newest_first(df):
+    """stable sort by date, newest first, that keeps sorted frames as is"""
+    dates = _date_values(df)
+    if np.all(dates[:-1] >= dates[1:]):
+        return df
+
+    # a stable ascending sort of the reversed rows, reversed again, keeps
+    # the original order of transactions on the same day
+    n = len(df)
+    order = n - 1 - np.argsort(dates[::-1], kind="mergesort")
+    return df.iloc[order[::-1]]
+
+
+def _bounds(ascending_dates, start, end):
+    """first and after last index of the dates in [start, end]"""
+    lo, hi = 0, len(ascending_dates)
+    if start is not None:
+        lo = np.searchsorted(ascending_dates, pd.Timestamp(start).value,
+                             side="left")
+    if end is not None:
+        hi = np.searchsorted(ascending_dates, pd.Timestamp(end).value,
+                             side="right")
+    return lo, max(hi, lo)
+
+
+def _slice(df, ascending_dates, start, end):
+    """the rows of a frame sorted newest first with a date in [start, end]"""
+    n = len(df)
+    lo, hi = _bounds(ascending_dates, start, end)
+    return df.iloc[n - hi:n - lo]
+
+
+def _daily_amounts(rows, dates, amounts):
+    """
+    DailyAmounts of the rows of a frame sorted newest first, given
+    ascending, and the rows with a date
+    """
+    n = len(dates)
+    rows = rows[dates[n - 1 - rows] != np.iinfo(np.int64).min]
+    return (DailyAmounts(dates[n - 1 - rows].view("M8[ns]"), amounts[rows]),
+            rows)
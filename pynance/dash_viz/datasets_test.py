@@ -0,0 +1,242 @@
+from __future__ import absolute_import
+
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+from numpy.testing import assert_array_equal
+
+from .datasets import DatasetCache, DiskDatasetCache, IndexedDataset, \
+    dataset_key, make_cache
+
+
+class DatasetCacheTestCase(unittest.TestCase):
+    def test_dataset_key(self):
+        self.assertEqual(dataset_key("content", "DKBCash"),
+                         dataset_key(u"content", b"DKBCash"))
+        self.assertNotEqual(dataset_key("content", "DKBCash"),
+                            dataset_key("content", "DKBVisa"))
+        self.assertNotEqual(dataset_key("ab", "c"), dataset_key("a", "bc"))
+
+    def test_get_put(self):
+        cache = DatasetCache()
+        self.assertIsNone(cache.get("key"))
+
+        cache.put("key", [1, 2])
+        self.assertIn("key", cache)
+        self.assertEqual([1, 2], cache.get("key"))
+
+    def test_stats(self):
+        cache = DatasetCache()
+        cache.put("key", 1)
+        cache.get("key")
+        cache.get("key")
+        cache.get("other")
+        self.assertEqual({"hits": 2, "misses": 1}, cache.stats())
+
+    def test_lru(self):
+        cache = DatasetCache(max_items=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        # a is used more recently than b now
+        cache.get("a")
+        cache.put("c", 3)
+
+        self.assertEqual(2, len(cache))
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(1, cache.get("a"))
+        self.assertEqual(3, cache.get("c"))
+
+
+class DiskDatasetCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_shared_by_instances(self):
+        df = pd.DataFrame({"date": pd.to_datetime(["2018-12-04",
+                                                   "2018-12-03"]),
+                           "amount": [1.0, 2.0],
+                           "origin": ["a", "b"]})
+        DiskDatasetCache(self.directory).put("abc1", IndexedDataset(df))
+
+        # like another process with its own instance
+        other = DiskDatasetCache(self.directory)
+        self.assertIn("abc1", other)
+        dataset = other.get("abc1")
+        assert_array_equal([2.0], dataset.select(accounts=["b"])["amount"])
+
+    def test_get_missing(self):
+        cache = DiskDatasetCache(self.directory)
+
+        self.assertIsNone(cache.get("abc1"))
+        self.assertIsNone(cache.get(None))
+        # keys are never used as paths outside the directory
+        self.assertIsNone(cache.get("../abc1"))
+        self.assertNotIn("../abc1", cache)
+        self.assertRaises(ValueError, cache.put, "../abc1", 1)
+
+    def test_stats(self):
+        DiskDatasetCache(self.directory).put("abc1", 1)
+
+        # hits of datasets stored by other processes count as well
+        cache = DiskDatasetCache(self.directory)
+        cache.get("abc1")
+        cache.get("abc2")
+        cache.get("../abc1")
+        self.assertEqual({"hits": 1, "misses": 2}, cache.stats())
+
+    def test_eviction(self):
+        cache = DiskDatasetCache(self.directory, max_bytes=3000)
+        for i in range(3):
+            cache.put("%d" % i, np.zeros(100))
+        cache.get("0")
+
+        for i in range(3, 6):
+            cache.put("%d" % i, np.zeros(100))
+
+        self.assertLessEqual(cache.size(), 3000)
+        self.assertIn("5", cache)
+        self.assertNotIn("1", cache)
+
+    def test_make_cache(self):
+        self.assertIsInstance(make_cache("datasets", environ={}),
+                              DatasetCache)
+
+        cache = make_cache("datasets",
+                           environ={"PYNANCE_CACHE_DIR": self.directory,
+                                    "PYNANCE_CACHE_MAX_MB": "2"})
+        self.assertIsInstance(cache, DiskDatasetCache)
+        self.assertEqual(2 * 1024**2, cache.max_bytes)
+
+    def test_private_directory(self):
+        directory = os.path.join(self.directory, "cache")
+        DiskDatasetCache(directory)
+        if hasattr(os, "getuid"):
+            self.assertEqual(0o700, stat.S_IMODE(os.stat(directory).st_mode))
+
+    @unittest.skipUnless(hasattr(os, "getuid"), "no file modes")
+    def test_writable_by_others(self):
+        # anybody could put pickles there that would run code when loaded
+        os.chmod(self.directory, 0o777)
+        with self.assertRaises(IOError):
+            DiskDatasetCache(self.directory)
+        with self.assertRaises(IOError):
+            make_cache("datasets",
+                       environ={"PYNANCE_CACHE_DIR": self.directory})
+
+    @unittest.skipUnless(hasattr(os, "getuid"), "no file modes")
+    def test_symlink(self):
+        link = os.path.join(self.directory, "link")
+        os.symlink(tempfile.gettempdir(), link)
+        with self.assertRaises(IOError):
+            DiskDatasetCache(link)
+
+
+class IndexedDatasetTestCase(unittest.TestCase):
+    def _df(self, n=1000):
+        rng = np.random.RandomState(0)
+        dates = np.datetime64("2018-01-01") + rng.randint(0, 365, n)
+        return pd.DataFrame({"date": dates,
+                             "amount": np.arange(n, dtype=np.float64),
+                             "origin": rng.choice(["a", "b", "c"], n)})
+
+    def test_sorted_newest_first(self):
+        df = pd.DataFrame({"date": pd.to_datetime(["2018-12-03",
+                                                   "2018-12-04",
+                                                   "2018-12-03"]),
+                           "amount": [1.0, 2.0, 3.0]})
+        dataset = IndexedDataset(df)
+
+        # transactions on the same day keep their order
+        assert_array_equal([2.0, 1.0, 3.0], dataset.frame["amount"].values)
+        self.assertEqual(3, len(dataset))
+
+    def test_sorted_frame_is_kept(self):
+        df = self._df().sort_values("date", ascending=False)
+        self.assertIs(df, IndexedDataset(df).frame)
+
+    def test_select_like_mask(self):
+        df = self._df()
+        dataset = IndexedDataset(df)
+
+        for start, end, accounts in [(None, None, None),
+                                     ("2018-03-01", "2018-03-31", None),
+                                     ("2018-06-15", None, ["b"]),
+                                     (None, "2018-02-01", ["a", "c"]),
+                                     ("2018-05-01", "2018-04-01", None)]:
+            mask = np.ones(len(df), dtype=bool)
+            if start is not None:
+                mask &= df["date"] >= start
+            if end is not None:
+                mask &= df["date"] <= end
+            if accounts is not None:
+                mask &= df["origin"].isin(accounts)
+
+            result = dataset.select(start, end, accounts)
+
+            assert_array_equal(np.sort(df["amount"][mask].values),
+                               np.sort(result["amount"].values))
+            self.assertTrue(result["date"].is_monotonic_decreasing)
+
+    def test_select_unknown_account(self):
+        dataset = IndexedDataset(self._df())
+        self.assertEqual(0, len(dataset.select(accounts=["unknown"])))
+
+    def test_daily_amounts(self):
+        df = self._df()
+        df["amount"] -= 500
+        dataset = IndexedDataset(df)
+
+        for accounts in [None, ["a", "c"]]:
+            selected = dataset.select("2018-03-01", "2018-05-31", accounts)
+            incoming, outgoing = dataset.daily_amounts(accounts)
+            for parts, expected in [(incoming, selected["amount"] >= 0),
+                                    (outgoing, selected["amount"] < 0)]:
+                rows = []
+                for daily, positions in parts:
+                    lo, hi = daily.select("2018-03-01", "2018-05-31")
+                    rows.append(positions[daily.rows[lo]:daily.rows[hi]])
+                amounts = dataset.frame["amount"].values[np.concatenate(rows)]
+                assert_array_equal(
+                    np.sort(selected["amount"][expected].values),
+                    np.sort(amounts))
+
+    def test_balances(self):
+        df = self._df()
+        df["total_balance"] = df["amount"] * 2
+        dataset = IndexedDataset(df)
+
+        balances = dataset.balances("2018-03-01", "2018-05-31", ["c", "a"])
+
+        self.assertEqual(["a", "c"], [account for account, _, _, _
+                                      in balances])
+        for account, dates, values, extremes in balances:
+            part = dataset.select("2018-03-01", "2018-05-31", [account])
+            assert_array_equal(part["date"].values[::-1], dates)
+            assert_array_equal(part["total_balance"].values[::-1], values)
+            # the last balance of each day is one of the extremes
+            self.assertIn(len(dates) - 1, extremes)
+        self.assertEqual([], dataset.balances(accounts=["unknown"]))
+
+    def test_accounts_and_date_range(self):
+        df = self._df()
+        dataset = IndexedDataset(df)
+
+        self.assertEqual(["a", "b", "c"], dataset.accounts())
+        self.assertEqual((df["date"].min(), df["date"].max()),
+                         dataset.date_range())
+
+
+def test_suite():
+    suite = unittest.TestSuite()
+    suite.addTest(unittest.makeSuite(DatasetCacheTestCase))
+    suite.addTest(unittest.makeSuite(DiskDatasetCacheTestCase))
+    suite.addTest(unittest.makeSuite(IndexedDatasetTestCase))
+    return suite
@@ -0,0 +1,283 @@
+"""
+Reduces the number of points sent to the browser, so that figure payloads
+stay bounded no matter how long the history is.
+"""
+from __future__ import absolute_import, division
+
+import numpy as np
+import pandas as pd
+
+# frequencies for aggregated bars, from fine to coarse
+FREQUENCIES = [("D", np.timedelta64(1, 'D')),
+               ("W", np.timedelta64(7, 'D')),
+               ("M", np.timedelta64(31, 'D')),
+               ("A", np.timedelta64(366, 'D'))]
+
+
+def lttb(x, y, n_out):
+    """
+    Selects points of a line with the Largest-Triangle-Three-Buckets
+    algorithm, which keeps the visual shape including peaks
+
+    The point of each bucket forms the largest triangle with the point
+    selected in the previous bucket and the average of the next bucket.
+    Instead of going from bucket to bucket, all buckets are handled at
+    once twice: first with the average of the previous bucket in place of
+    its selected point, then with the points selected in the first pass.
+    So the cost grows with the number of points, not with n_out.
+
+    Params:
+    -------
+    x: array like of numbers or datetime64, sorted ascending
+    y: array like of numbers
+    n_out: int
+        number of points to select, at least 3
+
+    Returns:
+    --------
+    numpy.ndarray of int
+        sorted indices of the selected points, the first and the last
+        point are always selected
+    """
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        x = x.astype('datetime64[ns]').astype(np.int64)
+    x = x.astype(np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # buckets of the points between the first and the last one
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    sizes = np.diff(edges)
+    starts = edges[:-1]
+    inner_x = x[1:n - 1]
+    inner_y = y[1:n - 1]
+
+    # the average of each bucket, the last point follows the last bucket
+    avg_x = np.add.reduceat(inner_x, starts - 1) / sizes
+    avg_y = np.add.reduceat(inner_y, starts - 1) / sizes
+    next_x = np.r_[avg_x[1:], x[-1]]
+    next_y = np.r_[avg_y[1:], y[-1]]
+
+    prev_x = np.r_[x[0], avg_x[:-1]]
+    prev_y = np.r_[y[0], avg_y[:-1]]
+    for _ in range(2):
+        a_x = np.repeat(prev_x, sizes)
+        a_y = np.repeat(prev_y, sizes)
+        areas = np.abs((a_x - np.repeat(next_x, sizes)) * (inner_y - a_y) -
+                       (a_x - inner_x) * (np.repeat(next_y, sizes) - a_y))
+        selected = 1 + _bucket_argmax(areas, starts - 1, sizes)
+        prev_x = np.r_[x[0], x[selected[:-1]]]
+        prev_y = np.r_[y[0], y[selected[:-1]]]
+
+    return np.r_[0, selected, n - 1]
+
+
+def _bucket_argmax(values, starts, sizes):
+    """the index of the first largest value of each bucket"""
+    # NaN is never the largest value, unless a bucket has nothing else
+    values = np.where(np.isnan(values), -np.inf, values)
+    largest = np.maximum.reduceat(values, starts)
+    candidates = np.flatnonzero(values == np.repeat(largest, sizes))
+    buckets = np.repeat(np.arange(len(starts)), sizes)[candidates]
+    # the first candidate of each bucket
+    first = np.r_[True, buckets[1:] != buckets[:-1]]
+    return candidates[first]
+
+
+def daily_extremes(dates, values):
+    """
+    The lowest, the highest and the last point of each day, which are
+    enough to downsample a line with a lot of points per day
+
+    Params:
+    -------
+    dates: array like of datetime64, sorted ascending
+    values: array like of numbers
+
+    Returns:
+    --------
+    numpy.ndarray of int
+        sorted indices of the points
+    """
+    days = np.asarray(dates, dtype="datetime64[D]")
+    values = np.asarray(values, dtype=np.float64)
+    if len(days) == 0:
+        return np.arange(0)
+
+    starts = np.flatnonzero(np.r_[True, days[1:] != days[:-1]])
+    sizes = np.diff(np.r_[starts, len(days)])
+    return np.unique(np.r_[_bucket_argmax(-values, starts, sizes),
+                           _bucket_argmax(values, starts, sizes),
+                           starts + sizes - 1])
+
+
+def choose_frequency(start, end, max_bars):
+    """
+    The finest aggregation frequency that shows a time range with at most
+    max_bars bars
+
+    Params:
+    -------
+    start, end: numpy.datetime64
+        the visible range
+    max_bars: int
+
+    Returns:
+    --------
+    str
+        pandas frequency string, one of D, W, M and A
+    """
+    span = np.datetime64(end, 'D') - np.datetime64(start, 'D') + 1
+    for freq, period in FREQUENCIES:
+        if span <= period * max_bars:
+            return freq
+    return FREQUENCIES[-1][0]
+
+
+def aggregate_amounts(dates, amounts, freq):
+    """
+    Sums up amounts per period
+
+    Params:
+    -------
+    dates: array like of datetime64
+    amounts: array like of float
+    freq: str
+        pandas frequency string, e.g. one of FREQUENCIES
+
+    Returns:
+    --------
+    pandas.DataFrame
+        columns date (start of the period), amount (sum) and count,
+        sorted by date, only periods with transactions
+    """
+    periods = period_starts(pd.DatetimeIndex(dates).values, freq)
+    grouped = pd.Series(np.asarray(amounts, dtype=np.float64)) \
+        .groupby(periods)
+    sums = grouped.sum()
+
+    return pd.DataFrame({
+        "date": sums.index,
+        "amount": sums.values,
+        "count": grouped.count().values},
+        columns=["date", "amount", "count"])
+
+
+def period_starts(days, freq):
+    """
+    The first day of the period of each day, like the start_time of pandas
+    periods but without making a Period of each day
+
+    Params:
+    -------
+    days: array like of datetime64
+    freq: str
+        one of FREQUENCIES, weeks start on Monday
+
+    Returns:
+    --------
+    numpy.ndarray of datetime64[ns]
+    """
+    days = np.asarray(days, dtype="datetime64[D]")
+    if freq == "W":
+        # 1970-01-01 was a Thursday
+        starts = days - (days.view(np.int64) + 3) % 7
+    elif freq == "M":
+        starts = days.astype("datetime64[M]")
+    elif freq == "A":
+        starts = days.astype("datetime64[Y]")
+    else:
+        starts = days
+    return starts.astype("datetime64[ns]")
+
+
+class DailyAmounts():
+    """
+        Amounts of transactions summed up per day, so that the sums of a
+        date range are found by binary search instead of grouping all of
+        its transactions
+
+        The days are sorted and the period of each day is computed once for
+        each of the FREQUENCIES, so that the sums per week, month or year
+        of a range are rolled up from its days.
+    """
+
+    def __init__(self, dates, amounts):
+        """
+        Params:
+        -------
+        dates: array like of datetime64, sorted ascending
+        amounts: array like of float
+        """
+        days = np.asarray(dates, dtype="datetime64[D]")
+        amounts = np.asarray(amounts, dtype=np.float64)
+        n = len(days)
+
+        starts = np.flatnonzero(np.r_[True, days[1:] != days[:-1]])[:n]
+        self.days = days[starts]
+        self._day_values = self.days.astype("M8[ns]").view(np.int64)
+        self.sums = np.add.reduceat(amounts, starts) if n else amounts[:0]
+        self.counts = np.diff(np.r_[starts, n])
+        # number of transactions before each day
+        self.rows = np.r_[0, np.cumsum(self.counts)]
+        self._periods = dict((freq, period_starts(self.days, freq))
+                             for freq, _ in FREQUENCIES)
+
+    def select(self, start=None, end=None):
+        """
+        The days with transactions in a date range
+
+        Params:
+        -------
+        start, end: date like, optional
+            the days from start to end are included
+
+        Returns:
+        --------
+        tuple of int
+            the first day and the one after the last day, as positions in
+            `days`. The transactions of these days are the rows from
+            `rows[first]` to `rows[after_last]`
+        """
+        lo, hi = 0, len(self.days)
+        if start is not None:
+            lo = np.searchsorted(self._day_values, pd.Timestamp(start).value,
+                                 side="left")
+        if end is not None:
+            hi = np.searchsorted(self._day_values, pd.Timestamp(end).value,
+                                 side="right")
+        return lo, max(lo, hi)
+
+    def aggregate(self, lo, hi, freq):
+        """
+        The sums per period of the days from lo to hi, see select
+
+        Params:
+        -------
+        lo, hi: int
+        freq: str
+            one of FREQUENCIES
+
+        Returns:
+        --------
+        pandas.DataFrame
+            like aggregate_amounts
+        """
+        periods = self._periods[freq][lo:hi]
+        firsts = np.flatnonzero(np.r_[True, periods[1:] != periods[:-1]])
+        firsts = firsts[:len(periods)]
+        if len(periods) == 0:
+            sums = counts = np.array([], dtype=np.int64)
+        else:
+            sums = np.add.reduceat(self.sums[lo:hi], firsts)
+            counts = np.add.reduceat(self.counts[lo:hi], firsts)
+
+        return pd.DataFrame({
+            "date": periods[firsts],
+            "amount": np.asarray(sums, dtype=np.float64),
+            "count": counts},
+            columns=["date", "amount", "count"])
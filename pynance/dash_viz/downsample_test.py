@@ -0,0 +1,107 @@
+from __future__ import absolute_import
+
+import unittest
+
+import numpy as np
+import pandas as pd
+from numpy.testing import assert_array_equal
+
+from .downsample import lttb, choose_frequency, aggregate_amounts, \
+    daily_extremes, period_starts, DailyAmounts
+
+
+class DownsampleTestCase(unittest.TestCase):
+    def test_lttb_keeps_shape(self):
+        x = np.arange(10000)
+        y = np.sin(x / 500.0)
+        y[4321] = 100.0
+
+        selected = lttb(x, y, 500)
+
+        self.assertEqual(500, len(selected))
+        self.assertEqual(0, selected[0])
+        self.assertEqual(9999, selected[-1])
+        self.assertTrue(np.all(np.diff(selected) > 0))
+        # the peak is kept
+        self.assertIn(4321, selected)
+
+    def test_lttb_dates(self):
+        dates = np.datetime64("2010-01-01") + np.arange(1000)
+        selected = lttb(dates, np.random.RandomState(0).random_sample(1000),
+                        100)
+        self.assertEqual(100, len(selected))
+
+    def test_lttb_few_points(self):
+        assert_array_equal(np.arange(5), lttb(np.arange(5), np.ones(5), 10))
+
+    def test_choose_frequency(self):
+        start = np.datetime64("2018-01-01")
+        self.assertEqual("D", choose_frequency(
+            start, np.datetime64("2018-01-31"), 100))
+        self.assertEqual("W", choose_frequency(
+            start, np.datetime64("2018-12-31"), 100))
+        self.assertEqual("M", choose_frequency(
+            start, np.datetime64("2025-12-31"), 100))
+        self.assertEqual("A", choose_frequency(
+            start, np.datetime64("2025-12-31"), 10))
+
+    def test_aggregate_amounts(self):
+        dates = np.array(["2018-02-03", "2018-01-01", "2018-01-31"],
+                         dtype="datetime64[D]")
+        sums = aggregate_amounts(dates, [3.0, 1.0, 2.0], "M")
+
+        assert_array_equal(np.array(["2018-01-01", "2018-02-01"],
+                                    dtype="datetime64[ns]"),
+                           sums["date"].values)
+        assert_array_equal([3.0, 3.0], sums["amount"].values)
+        assert_array_equal([2, 1], sums["count"].values)
+
+    def test_period_starts(self):
+        days = np.datetime64("1999-12-01") + np.arange(800)
+        for freq in ["D", "W", "M", "A"]:
+            assert_array_equal(
+                pd.DatetimeIndex(days).to_period(freq).start_time.values,
+                period_starts(days, freq))
+
+    def test_daily_extremes(self):
+        dates = np.array(["2018-01-01", "2018-01-01", "2018-01-01",
+                          "2018-01-01", "2018-01-02", "2018-01-03",
+                          "2018-01-03"], dtype="datetime64[D]")
+        values = [5.0, 1.0, 9.0, 4.0, 3.0, 2.0, 2.0]
+
+        assert_array_equal([1, 2, 3, 4, 5, 6],
+                           daily_extremes(dates, values))
+
+    def test_daily_amounts_like_aggregate(self):
+        rng = np.random.RandomState(0)
+        dates = np.sort(np.datetime64("2018-01-01") +
+                        rng.randint(0, 800, 5000))
+        amounts = rng.random_sample(5000)
+        daily = DailyAmounts(dates, amounts)
+
+        lo, hi = daily.select("2018-03-15", "2019-07-31")
+        mask = (dates >= np.datetime64("2018-03-15")) & \
+            (dates <= np.datetime64("2019-07-31"))
+        self.assertEqual(mask.sum(), daily.rows[hi] - daily.rows[lo])
+        for freq in ["D", "W", "M", "A"]:
+            expected = aggregate_amounts(dates[mask], amounts[mask], freq)
+            result = daily.aggregate(lo, hi, freq)
+
+            assert_array_equal(expected["date"].values,
+                               result["date"].values)
+            np.testing.assert_allclose(expected["amount"].values,
+                                       result["amount"].values)
+            assert_array_equal(expected["count"].values,
+                               result["count"].values)
+
+    def test_daily_amounts_empty_range(self):
+        daily = DailyAmounts(np.array(["2018-01-01"], dtype="M8[D]"), [1.0])
+        lo, hi = daily.select("2018-02-01", "2018-01-01")
+
+        self.assertEqual(lo, hi)
+        self.assertEqual(0, len(daily.aggregate(lo, hi, "M")))
+
+
+def test_suite():
+    suite = unittest.makeSuite(DownsampleTestCase)
+    return suite
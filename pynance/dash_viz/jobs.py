@@ -0,0 +1,118 @@
+"""
+Background jobs of the dash app. Callbacks start a job and return at once,
+the progress of the job is polled by other callbacks.
+"""
+from __future__ import absolute_import
+
+import threading
+from multiprocessing.pool import ThreadPool
+
+
+class Job():
+    """
+        Applies a function to many items in a pool of threads and keeps
+        track of how many of them are finished
+    """
+
+    def __init__(self, func, items, names=None, workers=4, on_finished=None):
+        """
+        Params:
+        -------
+        func: function: item -> result
+            applied to each item, exceptions are recorded as failures
+        items: list
+            the items to process
+        names: list of str, optional
+            names of the items used in failures, e.g. file names.
+            Defaults to the positions of the items
+        workers: int
+            maximum number of threads
+        on_finished: function: list of results -> None, optional
+            called with the results of the successful items, in the order
+            of `items`, before the job is marked as finished
+        """
+        self.func = func
+        self.items = list(items)
+        if names is None:
+            names = [str(i) for i in range(len(self.items))]
+        self.names = list(names)
+        self.workers = workers
+        self.on_finished = on_finished
+
+        self._results = [None] * len(self.items)
+        self._done = 0
+        self._failures = []
+        # the error of on_finished
+        self._error = None
+        self._finished = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """runs the job in a background thread"""
+        self._thread = threading.Thread(target=self.run)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def run(self):
+        """runs the job in the calling thread"""
+        succeeded = []
+        try:
+            if self.items:
+                pool = ThreadPool(max(1, min(self.workers, len(self.items))))
+                try:
+                    # imap_unordered reports each item as soon as it is done
+                    for index, result, error in pool.imap_unordered(
+                            self._call, range(len(self.items))):
+                        with self._lock:
+                            self._done += 1
+                            if error is None:
+                                self._results[index] = result
+                                succeeded.append(index)
+                            else:
+                                self._failures.append((self.names[index],
+                                                       error))
+                finally:
+                    pool.close()
+                    pool.join()
+
+            if self.on_finished is not None:
+                self.on_finished([self._results[i] for i in sorted(succeeded)])
+        except Exception as e:
+            with self._lock:
+                self._error = e
+        finally:
+            self._finished.set()
+
+    def _call(self, index):
+        try:
+            return index, self.func(self.items[index]), None
+        except Exception as e:
+            return index, None, e
+
+    def wait(self, timeout=None):
+        """blocks until the job is finished, returns whether it is"""
+        return self._finished.wait(timeout)
+
+    @property
+    def finished(self):
+        return self._finished.is_set()
+
+    def progress(self):
+        """
+        Returns:
+        --------
+        dict
+            total and done number of items, the failures as list of
+            (name, error message), the message of the error of
+            on_finished or None and whether the job is finished
+        """
+        with self._lock:
+            return {"total": len(self.items),
+                    "done": self._done,
+                    "failures": [(name, str(error))
+                                 for name, error in self._failures],
+                    "error": (None if self._error is None
+                              else str(self._error)),
+                    "finished": self.finished}
@@ -0,0 +1,69 @@
+from __future__ import absolute_import
+
+import threading
+import unittest
+
+from .jobs import Job
+
+
+class JobTestCase(unittest.TestCase):
+    def test_run(self):
+        results = []
+
+        def fail_on_three(x):
+            if x == 3:
+                raise ValueError("three")
+            return x * 2
+
+        job = Job(fail_on_three, [1, 2, 3, 4], names=list("abcd"),
+                  on_finished=results.extend)
+        job.run()
+
+        self.assertTrue(job.finished)
+        self.assertEqual([2, 4, 8], results)
+        self.assertEqual({"total": 4,
+                          "done": 4,
+                          "failures": [("c", "three")],
+                          "error": None,
+                          "finished": True},
+                         job.progress())
+
+    def test_progress_while_running(self):
+        release = threading.Event()
+
+        def wait_for_release(x):
+            if x > 0:
+                release.wait(10)
+            return x
+
+        job = Job(wait_for_release, [0, 1], workers=2).start()
+        self.assertFalse(job.wait(0.1))
+        self.assertFalse(job.progress()["finished"])
+
+        release.set()
+        self.assertTrue(job.wait(10))
+        self.assertEqual(2, job.progress()["done"])
+
+    def test_on_finished_error(self):
+        def fail(results):
+            raise IOError("disk full")
+
+        job = Job(len, ["a"], on_finished=fail)
+        job.run()
+
+        progress = job.progress()
+        self.assertTrue(progress["finished"])
+        self.assertEqual([], progress["failures"])
+        self.assertEqual("disk full", progress["error"])
+
+    def test_no_items(self):
+        results = []
+        job = Job(len, [], on_finished=results.append).start()
+
+        self.assertTrue(job.wait(10))
+        self.assertEqual([[]], results)
+
+
+def test_suite():
+    suite = unittest.makeSuite(JobTestCase)
+    return suite
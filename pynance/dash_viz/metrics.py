@@ -0,0 +1,290 @@
+"""
+Metrics of the dash app, like the latency of its callbacks, in the text
+format that Prometheus scrapes, see
+https://prometheus.io/docs/instrumenting/exposition_formats/
+
+Metrics are kept in memory per process. A server with several worker
+processes, see wsgi.py, answers each scrape with the metrics of the worker
+that handles it.
+"""
+from __future__ import absolute_import
+
+import math
+import threading
+from bisect import bisect_left
+
+# content type of the text format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# upper bounds of the buckets for durations in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0, 30.0)
+# upper bounds of the buckets for sizes in bytes, 1 KiB to 256 MiB
+SIZE_BUCKETS = tuple(1024 * 4**i for i in range(10))
+# upper bounds of the buckets for rows per second
+RATE_BUCKETS = tuple(m * 10**e for e in range(1, 8) for m in (1, 3))
+
+
+class _Metric():
+    """values of a metric for each combination of label values"""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        """
+        Params:
+        -------
+        name: str
+            name of the metric, e.g. pynance_upload_bytes
+        documentation: str
+            one line that describes the metric
+        labelnames: list of str
+            names of the labels that each value must be given
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError("%s needs the labels %r, not %r"
+                             % (self.name, self.labelnames,
+                                tuple(sorted(labels))))
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """
+        The samples of the metric, one per combination of label values and
+        ordered by them. Metrics with more than one value per combination
+        override this
+
+        Returns:
+        --------
+        list of (name, dict of labels, float)
+        """
+        with self._lock:
+            values = sorted(self._values.items())
+        return [(self.name, dict(zip(self.labelnames, key)), value)
+                for key, value in values]
+
+    def exposition(self):
+        """the metric in the text format"""
+        lines = ["# HELP %s %s" % (self.name, _escape_help(
+                     self.documentation)),
+                 "# TYPE %s %s" % (self.name, self.kind)]
+        for name, labels, value in self.samples():
+            lines.append("%s%s %s" % (name, _format_labels(labels),
+                                      _format_value(value)))
+        return "\n".join(lines) + "\n"
+
+
+class Counter(_Metric):
+    """
+        A total that only grows, e.g. the number of cache hits
+    """
+
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        """adds amount to the value of the labels"""
+        if amount < 0:
+            raise ValueError("Counters can only grow, not by %r" % amount)
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        """the value of the labels, 0 if there is none yet"""
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    """
+        Counts observed values in buckets with fixed upper bounds, e.g. the
+        latency of requests, and keeps their sum
+
+        Observing a value takes a binary search over the bounds, so that
+        histograms are cheap enough for every request.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, buckets, labelnames=()):
+        """
+        Params:
+        -------
+        name, documentation, labelnames:
+            see Counter
+        buckets: list of float
+            increasing upper bounds of the buckets, a bucket for all
+            larger values is added
+        """
+        _Metric.__init__(self, name, documentation, labelnames)
+        buckets = [float(bound) for bound in buckets]
+        if any(a >= b for a, b in zip(buckets, buckets[1:])):
+            raise ValueError("Buckets must be increasing: %r" % buckets)
+        if not buckets or buckets[-1] != float("inf"):
+            buckets.append(float("inf"))
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        """counts value in its bucket"""
+        key = self._key(labels)
+        # le means less or equal, so the first bound that is not smaller
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # the bucket counts, the sum and the number of values
+                counts = self._values[key] = [[0] * len(self.buckets),
+                                              0.0, 0]
+            counts[0][index] += 1
+            counts[1] += value
+            counts[2] += 1
+
+    def count(self, **labels):
+        """number of values observed for the labels"""
+        with self._lock:
+            counts = self._values.get(self._key(labels))
+            return 0 if counts is None else counts[2]
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, (list(counts[0]), counts[1], counts[2]))
+                            for key, counts in self._values.items())
+
+        samples = []
+        for key, (bucket_counts, total, count) in values:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                bucket_labels = dict(labels, le=_format_value(bound))
+                samples.append((self.name + "_bucket", bucket_labels,
+                                cumulative))
+            samples.append((self.name + "_sum", labels, total))
+            samples.append((self.name + "_count", labels, count))
+        return samples
+
+
+class Registry():
+    """
+        The metrics of an app, rendered together for each scrape
+    """
+
+    def __init__(self):
+        self._metrics = []
+        # functions that return metrics made at scrape time
+        self._collectors = []
+
+    def counter(self, name, documentation, labelnames=()):
+        """a new Counter that is part of the registry"""
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, buckets, labelnames=()):
+        """a new Histogram that is part of the registry"""
+        return self.register(Histogram(name, documentation, buckets,
+                                       labelnames))
+
+    def register(self, metric):
+        """
+        Adds a metric to the registry
+
+        Raises:
+        -------
+        ValueError
+            if the registry has a metric with the same name
+        """
+        if any(m.name == metric.name for m in self._metrics):
+            raise ValueError("Duplicate metric %r" % metric.name)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collect):
+        """
+        Adds metrics that are read at scrape time, e.g. from counters that
+        an object keeps anyway
+
+        Params:
+        -------
+        collect: function: () -> list of metrics
+            called for each scrape
+        """
+        self._collectors.append(collect)
+
+    def exposition(self):
+        """all metrics in the text format"""
+        metrics = list(self._metrics)
+        for collect in self._collectors:
+            metrics.extend(collect())
+        return "".join(metric.exposition() for metric in metrics)
+
+
+def cache_collector(caches):
+    """
+    Collects the hits and misses of caches that keep them in `stats()`, see
+    pynance.dash_viz.datasets.DatasetCache
+
+    Params:
+    -------
+    caches: dict of str: cache
+        the caches by the names used as label
+
+    Returns:
+    --------
+    function: () -> list of metrics, see Registry.add_collector
+    """
+    def collect():
+        requests = Counter("pynance_cache_requests_total",
+                           "Lookups in the caches of the app, by result",
+                           ["cache", "result"])
+        for name, cache in sorted(caches.items()):
+            stats = cache.stats()
+            requests.inc(stats["hits"], cache=name, result="hit")
+            requests.inc(stats["misses"], cache=name, result="miss")
+        return [requests]
+
+    return collect
+
+
+class CountingReader():
+    """
+        Counts the bytes read from a binary stream, e.g. of an upload whose
+        size is not known up front because it is chunked
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+        self.n_bytes = 0
+
+    def read(self, size=-1):
+        data = self._stream.read(size)
+        self.n_bytes += len(data)
+        return data
+
+
+def _escape_help(text):
+    return text.replace("\\", r"\\").replace("\n", r"\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{%s}" % ",".join(
+        '%s="%s"' % (name, value.replace("\\", r"\\")
+                                .replace("\n", r"\n")
+                                .replace('"', r'\"'))
+        for name, value in sorted(labels.items()))
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        if math.isnan(value):
+            return "NaN"
+        return repr(value)
+    return str(value)
@@ -0,0 +1,100 @@
+from __future__ import absolute_import
+
+import io
+import threading
+import unittest
+
+from .datasets import DatasetCache
+from .metrics import Counter, Histogram, Registry, CountingReader, \
+    cache_collector
+
+
+class MetricsTestCase(unittest.TestCase):
+    def test_counter(self):
+        counter = Counter("requests_total", "Requests", ["route"])
+        counter.inc(route="/a")
+        counter.inc(2, route="/a")
+        counter.inc(route='say "hi"\n')
+
+        self.assertEqual(3, counter.value(route="/a"))
+        self.assertEqual(0, counter.value(route="/b"))
+        self.assertEqual('# HELP requests_total Requests\n'
+                         '# TYPE requests_total counter\n'
+                         'requests_total{route="/a"} 3\n'
+                         'requests_total{route="say \\"hi\\"\\n"} 1\n',
+                         counter.exposition())
+
+    def test_counter_errors(self):
+        counter = Counter("requests_total", "Requests", ["route"])
+        self.assertRaises(ValueError, counter.inc, -1, route="/a")
+        self.assertRaises(ValueError, counter.inc)
+        self.assertRaises(ValueError, counter.inc, route="/a", other="x")
+
+    def test_histogram(self):
+        histogram = Histogram("latency_seconds", "Latency", [0.1, 1.0])
+        for value in [0.05, 0.1, 0.5, 2.0]:
+            histogram.observe(value)
+
+        self.assertEqual(4, histogram.count())
+        # the bounds are inclusive and the buckets cumulative
+        self.assertEqual('# HELP latency_seconds Latency\n'
+                         '# TYPE latency_seconds histogram\n'
+                         'latency_seconds_bucket{le="0.1"} 2\n'
+                         'latency_seconds_bucket{le="1.0"} 3\n'
+                         'latency_seconds_bucket{le="+Inf"} 4\n'
+                         'latency_seconds_sum 2.65\n'
+                         'latency_seconds_count 4\n',
+                         histogram.exposition())
+
+    def test_histogram_buckets(self):
+        self.assertRaises(ValueError, Histogram, "h", "h", [1.0, 1.0])
+        histogram = Histogram("h", "h", [1, float("inf")])
+        self.assertEqual((1.0, float("inf")), histogram.buckets)
+
+    def test_histogram_threads(self):
+        histogram = Histogram("h", "h", [1.0], ["thread"])
+
+        def observe():
+            for _ in range(1000):
+                histogram.observe(0.5, thread="all")
+
+        threads = [threading.Thread(target=observe) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(8000, histogram.count(thread="all"))
+
+    def test_registry(self):
+        registry = Registry()
+        registry.counter("a_total", "A").inc()
+        registry.histogram("b", "B", [1.0]).observe(2.0)
+        self.assertRaises(ValueError, registry.counter, "a_total", "A")
+
+        cache = DatasetCache()
+        cache.put("key", 1)
+        cache.get("key")
+        cache.get("other")
+        registry.add_collector(cache_collector({"datasets": cache}))
+
+        lines = registry.exposition().splitlines()
+        self.assertIn("a_total 1", lines)
+        self.assertIn('b_bucket{le="+Inf"} 1', lines)
+        self.assertIn('pynance_cache_requests_total{cache="datasets",'
+                      'result="hit"} 1', lines)
+        self.assertIn('pynance_cache_requests_total{cache="datasets",'
+                      'result="miss"} 1', lines)
+
+    def test_counting_reader(self):
+        reader = CountingReader(io.BytesIO(b"0123456789"))
+        self.assertEqual(b"0123", reader.read(4))
+        self.assertEqual(b"456789", reader.read())
+        self.assertEqual(b"", reader.read(4))
+        self.assertEqual(10, reader.n_bytes)
+
+
+def test_suite():
+    """test suite for metrics"""
+    suite = unittest.makeSuite(MetricsTestCase)
+    return suite
@@ -1,36 +1,115 @@
 import base64
 import io
+import multiprocessing
+import timeit
+import uuid
+
+try:
+    from urllib.parse import parse_qs
+except ImportError:
+    # python 2
+    from urlparse import parse_qs
 
 import dash
 import flask
+import numpy as np
+import pandas as pd
 
 from dash.dependencies import Input, Output, State
+from dash.exceptions import PreventUpdate
 import dash_core_components as dcc
 import dash_html_components as html
 import plotly.graph_objs as go
 
-from pynance.textimporter import read_csv
-from pynance.dkb import SupportedCsvTypes
+from pynance.definitions import COLUMNS
+from pynance.textimporter import read_csv_with_preamble, read_csv_stream, \
+    csv_types, add_import_hook
+from pynance.transactions import content_hashes
+from pynance.balances import BalanceHistory
+# registers the DKB csv types in csv_types
+import pynance.dkb  # noqa: F401
+from pynance.dash_viz.datasets import DatasetCache, IndexedDataset, \
+    dataset_key, make_cache
+from pynance.dash_viz.jobs import Job
+from pynance.dash_viz.downsample import lttb, choose_frequency, \
+    aggregate_amounts
+from pynance.dash_viz.metrics import Registry, CountingReader, \
+    cache_collector, CONTENT_TYPE, LATENCY_BUCKETS, SIZE_BUCKETS, \
+    RATE_BUCKETS
 
 external_stylesheets = ['https://codepen.io/chriddyp/pen/bWLwgP.css']
 
+# csvtype value that lets pynance detect the type of the uploaded file
+AUTODETECT = 'auto'
+
+# upper bounds for the data sent to the browser per chart
+MAX_BARS = 500
+MAX_POINTS = 2000
+
+# parsed uploads, shared by all figure callbacks, and the figures made of
+# them. Shared by all processes if PYNANCE_CACHE_DIR is set, see wsgi.py
+datasets = make_cache("datasets")
+figures = make_cache("figures", max_items=64)
+# jobs that parse uploads in this process, under the key of the dataset
+# they create
+jobs = DatasetCache(max_items=64)
+
+# metrics of this process, served by the metrics route
+metrics = Registry()
+callback_seconds = metrics.histogram(
+    "pynance_callback_seconds",
+    "Time to answer a request for a dash callback",
+    LATENCY_BUCKETS, ["callback"])
+figure_bytes = metrics.histogram(
+    "pynance_figure_json_bytes",
+    "Size of the figures sent to the browser as json",
+    SIZE_BUCKETS, ["callback"])
+upload_bytes = metrics.histogram(
+    "pynance_upload_bytes",
+    "Size of the uploaded files, by the way they were uploaded",
+    SIZE_BUCKETS, ["route"])
+parse_rate = metrics.histogram(
+    "pynance_parse_rows_per_second",
+    "Rows per second of the csv imports",
+    RATE_BUCKETS)
+metrics.add_collector(cache_collector({"datasets": datasets,
+                                       "figures": figures}))
+
+
+def _record_import(report):
+    """adds an ImportReport of the textimporter to the metrics"""
+    if report.seconds > 0:
+        parse_rate.observe(report.rows / report.seconds)
+
+
+add_import_hook(_record_import)
+
+# number of files parsed at the same time per upload
+UPLOAD_WORKERS = multiprocessing.cpu_count()
+# milliseconds between two updates of the upload progress
+PROGRESS_INTERVAL = 500
+
 server = flask.Flask(__name__)
 app = dash.Dash(__name__,
                 external_stylesheets=external_stylesheets,
                 server=server)
 
 app.layout = html.Div([
+    # datasets uploaded to the upload route are shown with ?dataset=<key>
+    dcc.Location(id='url', refresh=False),
     html.H2("Incoming and outcoming cash"),
     html.Table([
         html.Tr([
             html.Td(dcc.Dropdown(
                 id='csvtype-selection',
-                options=[{'label': 'DKB Cash', 'value': 'DKBCash'},
+                options=[{'label': 'Detect automatically',
+                          'value': AUTODETECT},
+                         {'label': 'DKB Cash', 'value': 'DKBCash'},
                          {'label': 'DKB Visa', 'value': 'DKBVisa'}
                          ],
                 style={'width': 200},
                 placeholder="Select csv type",
-                value=None,
+                value=AUTODETECT,
                 searchable=False,
                 clearable=False)),
             html.Td(dcc.Upload(
@@ -49,13 +128,33 @@ app.layout = html.Div([
                     'textAlign': 'center',
                     'margin': '10px'
                 },
-                multiple=False,
+                multiple=True,
 
-            ))
+            )),
+            html.Td(html.Div(id='upload-progress')),
+        ]),
+        html.Tr([
+            html.Td(dcc.DatePickerRange(
+                id='date-range',
+                display_format='DD.MM.YYYY',
+                clearable=True)),
+            html.Td(dcc.Dropdown(
+                id='account-selection',
+                options=[],
+                multi=True,
+                placeholder="All accounts",
+                style={'width': 300})),
         ]),
     ]),
     dcc.Store(id='csvtype',
               storage_type='session'),
+    # key of the parsed upload in `datasets`
+    dcc.Store(id='dataset'),
+    # key of the job in `jobs` that parses the latest upload
+    dcc.Store(id='job'),
+    dcc.Interval(id='progress-interval',
+                 interval=PROGRESS_INTERVAL,
+                 disabled=True),
 
     dcc.Graph(
         figure=go.Figure(
@@ -85,150 +184,863 @@ def parse_contents(contents, csvtype_str):
         Output from the upload component. The first is file type description,
         second part the undecoded content of the file
     csvtype_str: str
-        name of a supported csv type, should be name of the attribute of
-        SupportedCsvTypes
+        name of a supported csv type, should be name of a type registered
+        in csv_types or AUTODETECT
 
     Returns:
     --------
     DataFrame
-        Data from the file, formatted as defined by CSV-Type
+        Data from the file, formatted as defined by CSV-Type. The origin
+        is the account given in the file
     """
-    csvtype_desc = csvtype_string2description(csvtype_str)
-
     try:
         content_string = contents.split(',')[1]
         byte_decoded = base64.b64decode(content_string)
-
-        encoding = csvtype_desc.encoding
-        decoded = byte_decoded.decode(encoding)
     except:
         raise IOError("Could not decode file.")
 
-    string_io = io.StringIO(decoded)
-    return read_csv(string_io, csvtype_desc)
+    # the importer decodes the bytes itself
+    byte_io = io.BytesIO(byte_decoded)
+
+    if csvtype_str == AUTODETECT:
+        csvtype_desc = csv_types.detect(byte_io)
+    else:
+        csvtype_desc = csvtype_string2description(csvtype_str)
+
+    df, preamble = read_csv_with_preamble(byte_io, csvtype_desc)
+    if preamble.account is not None:
+        df['origin'] = preamble.account
+    return df
+
+
+def base64_size(contents):
+    """
+    The size of the decoded file of the output of the upload component,
+    without decoding it
+
+    Params:
+    -------
+    contents: str
+        file type description and the base64 encoded content, see
+        parse_contents
+
+    Returns:
+    --------
+    int
+        bytes of the file
+    """
+    encoded = len(contents) - contents.find(',') - 1
+    padding = contents.endswith('=') + contents.endswith('==')
+    return max(encoded // 4 * 3 - padding, 0)
+
+
+def parse_stream(stream, csvtype_str):
+    """
+    Like parse_contents, for a csv file that is streamed to the server
+
+    Params:
+    -------
+    stream: binary file like
+        the content of the file, read only once
+    csvtype_str: str
+        name of a supported csv type, should be name of a type registered
+        in csv_types or AUTODETECT
+
+    Returns:
+    --------
+    DataFrame
+        Data from the file, formatted as defined by CSV-Type. The origin
+        is the account given in the file
+    """
+    if csvtype_str == AUTODETECT:
+        csvtype_desc, stream = csv_types.detect_stream(stream)
+    else:
+        csvtype_desc = csvtype_string2description(csvtype_str)
+
+    df, preamble = read_csv_stream(stream, csvtype_desc)
+    if preamble.account is not None:
+        df['origin'] = preamble.account
+    return df
+
+
+@server.route('/upload', methods=['POST'])
+def upload():
+    """
+    Parses csv files that are streamed to the server, instead of being
+    passed base64 encoded through a dash callback.
+
+    Either the file is the body of the request, which may use chunked
+    transfer encoding, e.g.::
+
+        curl --data-binary @export.csv -H "Content-Type: text/csv" \\
+            "http://localhost:8050/upload?csvtype=auto"
+
+    Such a file is parsed while it is received, so it is never held in
+    memory as a whole. Or one or more files are sent as
+    multipart/form-data, e.g.::
+
+        curl -F file=@cash.csv -F file=@visa.csv \\
+            http://localhost:8050/upload
+
+    Werkzeug reads the whole form before the files can be accessed,
+    larger files are buffered in temporary files. These files are only
+    parsed once the upload is complete.
+
+    The csv type is given by the query parameter csvtype and detected
+    automatically by default.
+
+    Returns:
+    --------
+    JSON response
+        the key of the dataset, its number of rows, the files that could
+        not be parsed and the url of the app that shows the dataset
+    """
+    request = flask.request
+    csvtype_str = request.args.get('csvtype', AUTODETECT)
+    if csvtype_str != AUTODETECT and csvtype_str not in csv_types:
+        return flask.jsonify(error="Unknown csv type %r" % csvtype_str), 400
+
+    if request.mimetype == 'multipart/form-data':
+        streams = [(storage.filename, storage.stream)
+                   for _, storage in request.files.items(multi=True)]
+    else:
+        streams = [(request.args.get('filename', 'upload'), request.stream)]
+
+    frames = []
+    failures = []
+    for name, stream in streams:
+        # chunked uploads have no content length
+        stream = CountingReader(stream)
+        try:
+            frames.append(parse_stream(stream, csvtype_str))
+        except IOError as e:
+            failures.append((name, str(e)))
+        upload_bytes.observe(stream.n_bytes, route="upload")
+
+    if not frames:
+        return flask.jsonify(error="No file could be parsed",
+                             failures=failures), 400
 
+    key = uuid.uuid4().hex
+    dataset = IndexedDataset(merge_uploads(frames))
+    datasets.put(key, dataset)
 
-def make_cashflow_figure(df):
+    return flask.jsonify(dataset=key,
+                         rows=len(dataset),
+                         failures=failures,
+                         url="/?dataset=%s" % key), 201
+
+
+# the route of dash that runs the callbacks
+_CALLBACK_PATH = '/_dash-update-component'
+
+
+@server.before_request
+def _start_callback_timer():
+    if flask.request.path.endswith(_CALLBACK_PATH):
+        flask.g.callback_start = timeit.default_timer()
+
+
+@server.after_request
+def _record_callback(response):
+    """
+    Adds the latency of each callback, and the size of the figures it
+    returns, to the metrics. Measured for the requests, so that all
+    callbacks are measured without being changed
+    """
+    start = flask.g.pop('callback_start', None)
+    if start is None:
+        return response
+
+    try:
+        component_id, component_property = _callback_output(
+            flask.request.get_json(silent=True) or {})
+        name = callback_name(component_id, component_property)
+        callback_seconds.observe(timeit.default_timer() - start,
+                                 callback=name)
+        if component_property == 'figure' and response.status_code == 200 \
+                and response.content_length is not None:
+            figure_bytes.observe(response.content_length, callback=name)
+    except Exception:
+        # the metrics must never fail a response
+        server.logger.exception("Could not record the metrics of %s",
+                                flask.request.path)
+    return response
+
+
+def _callback_output(body):
+    """
+    The id and property of the output of a callback request. Dash sends
+    them as a dict up to version 0.38 and as a string 'id.property' since,
+    the id can contain dots
+    """
+    output = body.get('output')
+    if isinstance(output, dict):
+        return output.get('id'), output.get('property')
+    if not output:
+        return None, None
+    component_id, _, component_property = output.rpartition('.')
+    return component_id, component_property
+
+
+def callback_name(component_id, component_property):
+    """
+    The name of the function of the callback of an output, 'unknown' if
+    there is no such callback
+    """
+    target = '%s.%s' % (component_id, component_property)
+    callback = app.callback_map.get(target, {}).get('callback')
+    if callback is None:
+        return 'unknown'
+    return callback.__name__
+
+
+@server.route('/metrics')
+def export_metrics():
+    """
+    The metrics of this process in the text format of Prometheus, e.g.
+    the latency of the callbacks, the size of uploads and figures, the
+    rows per second of the csv imports and the hit rates of the caches.
+    See pynance.dash_viz.metrics
+
+    Returns:
+    --------
+    text response
+    """
+    return flask.Response(metrics.exposition(), content_type=CONTENT_TYPE)
+
+
+def url_dataset_key(search):
+    """the key of the dataset given in the query string of the app url"""
+    if not search:
+        return None
+    keys = parse_qs(search.lstrip('?')).get('dataset')
+    return keys[0] if keys else None
+
+
+def merge_uploads(frames):
+    """
+    Combines the transactions of many uploaded files into one dataset
+
+    Transactions that are contained in more than one file, e.g. in exports
+    of the same account with overlapping periods, are kept only once.
+
+    Params:
+    -------
+    frames: list of pandas.DataFrame
+        parsed files, see parse_contents
+
+    Returns:
+    --------
+    DataFrame
+        transactions of all files
+    """
+    if not frames:
+        return pd.DataFrame(columns=list(COLUMNS))
+
+    # hashed per file, so that equal transactions within a file, like two
+    # equal payments on the same day, are told apart
+    hashes = np.concatenate([content_hashes(df) for df in frames])
+    df = pd.concat(frames, ignore_index=True)
+    return df[~pd.Series(hashes).duplicated().values]
+
+
+def make_cashflow_figure(df, x_range=None, max_bars=MAX_BARS):
     """
     Take a transactions dataframe and make a figure out of it,
     which contains two bar charts: one with green bars for positive
     transactions, and one with red bars for negative transactions
 
+    If there are more than max_bars transactions in a chart, they are
+    summed up per day, week, month or year, depending on the shown time
+    range.
+
     Params:
     -------
     df: pandas.Dataframe
         Dataframe which must have the columns date, amount and text
+    x_range: tuple of two dates, optional
+        only show the transactions in this range
+    max_bars: int
+        maximum number of bars per chart
 
     Returns:
     --------
     plotly.graph_objs.Figure
         Figure with the visualized data
     """
+    df = _select_range(df, x_range)
 
     pos = df[df["amount"] >= 0]
     neg = df[df["amount"] < 0]
 
-    pos_bar = go.Bar(x=pos["date"],
-                     y=pos["amount"],
-                     text=pos["text"],
-                     name="incoming")
-    neg_bar = go.Bar(x=neg["date"],
-                     y=neg["amount"],
-                     text=neg["text"],
-                     name="outgoing")
+    bars = []
+    for name, part in [("incoming", pos), ("outgoing", neg)]:
+        if len(part) <= max_bars:
+            bars.append(_transaction_bars(part, name))
+        else:
+            dates = pd.to_datetime(part["date"], cache=False)
+            freq = choose_frequency(dates.min(), dates.max(), max_bars)
+            sums = aggregate_amounts(dates, part["amount"], freq)
+            bars.append(_period_bars(sums, name))
 
-    fig = go.Figure(
-        data=[pos_bar, neg_bar],
-        layout=go.Layout(
-            showlegend=True,
-            legend=go.layout.Legend(
-                x=0,
-                y=1.0
-            ),
-            margin=go.layout.Margin(l=40, r=0, t=40, b=30)
-        )
-    )
+    fig = go.Figure(data=bars, layout=_cashflow_layout())
+    _keep_range(fig, x_range)
 
     return fig
 
 
-def make_line_figure(df):
+def dataset_cashflow_figure(dataset, start=None, end=None, accounts=None,
+                            max_bars=MAX_BARS):
+    """
+    Like make_cashflow_figure, for the transactions of an IndexedDataset
+    in a date range. The bars are made from the amounts per day of the
+    dataset, so the cost depends on the number of days, not transactions
+
+    Params:
+    -------
+    dataset: IndexedDataset
+        transactions with the columns date, amount and text
+    start, end: date like, optional
+        first and last date to show
+    accounts: list of str, optional
+        only show the transactions of these accounts
+    max_bars: int
+        maximum number of bars per chart
+
+    Returns:
+    --------
+    dict
+        the figure as plain data, which skips the validation of the
+        plotly graph objects
+    """
+    bars = []
+    for name, parts in zip(["incoming", "outgoing"],
+                           dataset.daily_amounts(accounts)):
+        ranges = [(daily, rows) + daily.select(start, end)
+                  for daily, rows in parts]
+        count = sum(daily.rows[hi] - daily.rows[lo]
+                    for daily, _, lo, hi in ranges)
+        if count <= max_bars:
+            rows = [rows[daily.rows[lo]:daily.rows[hi]]
+                    for daily, rows, lo, hi in ranges]
+            # the positions in the frame keep its order, newest first
+            part = dataset.frame.iloc[np.sort(np.concatenate(
+                rows + [np.arange(0)]))]
+            bars.append(_transaction_bars(part, name))
+            continue
+
+        ranges = [r for r in ranges if r[2] < r[3]]
+        freq = choose_frequency(
+            min(daily.days[lo] for daily, _, lo, hi in ranges),
+            max(daily.days[hi - 1] for daily, _, lo, hi in ranges),
+            max_bars)
+        sums = [daily.aggregate(lo, hi, freq)
+                for daily, _, lo, hi in ranges]
+        if len(sums) == 1:
+            sums = sums[0]
+        else:
+            sums = pd.concat(sums).groupby("date", sort=True).sum() \
+                .reset_index()
+        bars.append(_period_bars(sums, name))
+
+    return dict(data=bars, layout=_cashflow_layout())
+
+
+def _transaction_bars(part, name):
+    """a bar for each transaction"""
+    return dict(type="bar",
+                x=part["date"],
+                y=part["amount"],
+                text=part["text"],
+                name=name)
+
+
+def _period_bars(sums, name):
+    """a bar for each period, see aggregate_amounts"""
+    return dict(type="bar",
+                x=sums["date"],
+                y=sums["amount"],
+                text=["%d transactions" % count
+                      for count in sums["count"]],
+                name=name)
+
+
+def _cashflow_layout():
+    """the layout of the incoming and outgoing bars"""
+    return dict(
+        showlegend=True,
+        legend=dict(
+            x=0,
+            y=1.0
+        ),
+        margin=dict(l=40, r=0, t=40, b=30)
+    )
+
+
+def make_line_figure(df, x_range=None, max_points=MAX_POINTS):
     """
     Take a transactions dataframe and make a figure out of it, which
     shows the total balance as a function of time
 
+    If df contains the transactions of more than one account, which are
+    told apart by the origin column, the balance of each account and their
+    total balance at the end of each day are shown.
+
+    If there are more than max_points transactions, the line is downsampled
+    with LTTB, which keeps its shape, and drawn with WebGL.
+
     Params:
     -------
     df: pandas.Dataframe
-        Dataframe which must have the columns date and total_balance
+        Dataframe which must have the columns date and total_balance,
+        and amount and origin for more than one account
+    x_range: tuple of two dates, optional
+        only show the balances in this range
+    max_points: int
+        maximum number of points per line
 
     Returns:
     --------
     plotly.graph_objs.Figure
         Figure with the visualized data
     """
+    df = _select_range(df, x_range)
 
-    lineplot = go.Scatter(x=df["date"],
-                          y=df["total_balance"])
+    if "origin" in df and df["origin"].nunique() > 1:
+        lines = [_balance_line(part["date"], part["total_balance"],
+                               max_points, name=account)
+                 for account, part in df.groupby("origin", sort=True,
+                                                 observed=True)]
+        total = BalanceHistory().update(df).frame()["total"]
+        lines.append(_balance_line(total.index, total.values, max_points,
+                                   name="total"))
+    else:
+        lines = [_balance_line(df["date"], df["total_balance"], max_points)]
 
     fig = go.Figure(
-        data=[lineplot]
+        data=lines
     )
+    _keep_range(fig, x_range)
+
     return fig
 
 
-@app.callback(Output('graph_bar', 'figure'),
+def dataset_line_figure(dataset, start=None, end=None, accounts=None,
+                        max_points=MAX_POINTS):
+    """
+    Like make_line_figure, for the balances of an IndexedDataset in a date
+    range. Long lines are downsampled from the lowest, highest and last
+    balance of each day, and the total is made from the daily balances of
+    the dataset, so the cost depends on the number of days, not
+    transactions
+
+    Params:
+    -------
+    dataset: IndexedDataset
+        transactions with the columns date and total_balance, and amount
+        and origin for more than one account
+    start, end: date like, optional
+        first and last date to show
+    accounts: list of str, optional
+        only show the balances of these accounts
+    max_points: int
+        maximum number of points per line
+
+    Returns:
+    --------
+    dict
+        the figure as plain data, like dataset_cashflow_figure
+    """
+    balances = dataset.balances(start, end, accounts)
+
+    if len(balances) > 1:
+        lines = [_daily_balance_line(dates, values, extremes, max_points,
+                                     name=account)
+                 for account, dates, values, extremes in balances]
+        total = dataset.total_balance(
+            min(dates[0] for _, dates, _, _ in balances),
+            max(dates[-1] for _, dates, _, _ in balances),
+            [account for account, _, _, _ in balances])
+        lines.append(_balance_line(total.index, total.values, max_points,
+                                   name="total"))
+    elif balances:
+        _, dates, values, extremes = balances[0]
+        lines = [_daily_balance_line(dates, values, extremes, max_points)]
+    else:
+        lines = [_line("scatter", [], [])]
+
+    return dict(data=lines, layout={})
+
+
+def _daily_balance_line(dates, balances, extremes, max_points, name=None):
+    """
+    a line of balances sorted by date, downsampled to max_points from the
+    points at extremes and the first and last point
+    """
+    if len(dates) <= max_points:
+        # newest first, like the transactions
+        return _line("scatter", dates[::-1], balances[::-1], name)
+
+    points = np.unique(np.r_[0, extremes, len(dates) - 1])
+    selected = points[lttb(dates[points], balances[points], max_points)]
+    return _line("scattergl", dates[selected], balances[selected], name)
+
+
+def _balance_line(dates, balances, max_points, name=None):
+    """a line of balances, downsampled to max_points"""
+    if len(dates) <= max_points:
+        return _line("scatter", dates, balances, name)
+
+    dates = pd.to_datetime(dates, cache=False)
+    # lttb needs the points in chronological order
+    order = np.argsort(dates.values, kind="mergesort")
+    dates = dates.values[order]
+    balances = np.asarray(balances)[order]
+
+    selected = lttb(dates, balances, max_points)
+    return _line("scattergl", dates[selected], balances[selected], name)
+
+
+def _line(kind, dates, balances, name=None):
+    """
+    a trace of a line, arrays of datetime64 are sent as ISO dates, not as
+    nanoseconds, without encoding each date on its own
+    """
+    if isinstance(dates, np.ndarray) and dates.dtype.kind == "M":
+        dates = np.datetime_as_string(dates, unit="s")
+    line = dict(type=kind, x=dates, y=balances)
+    if name is not None:
+        line["name"] = name
+    return line
+
+
+def relayout_x_range(relayout_data):
+    """
+    The x range a user zoomed into, as given by the relayoutData of a graph
+
+    Params:
+    -------
+    relayout_data: dict or None
+        relayoutData property of a dcc.Graph
+
+    Returns:
+    --------
+    tuple of two str or None
+        start and end of the range, None if the whole range is shown
+    """
+    if not relayout_data:
+        return None
+    if "xaxis.range[0]" in relayout_data and \
+            "xaxis.range[1]" in relayout_data:
+        return (relayout_data["xaxis.range[0]"],
+                relayout_data["xaxis.range[1]"])
+    if "xaxis.range" in relayout_data:
+        return tuple(relayout_data["xaxis.range"])
+    return None
+
+
+def selected_range(start_date=None, end_date=None, x_range=None):
+    """
+    The range of dates to show, the intersection of the range of the date
+    picker and the range a user zoomed into
+
+    Params:
+    -------
+    start_date, end_date: str, optional
+        range of the date picker, None for an open end
+    x_range: tuple of two str, optional
+        zoomed range, see relayout_x_range
+
+    Returns:
+    --------
+    tuple of two pandas.Timestamp or None
+        start and end of the range, None for open ends
+    """
+    starts = [start_date]
+    ends = [end_date]
+    if x_range is not None:
+        starts.append(x_range[0])
+        ends.append(x_range[1])
+
+    starts = [pd.Timestamp(d) for d in starts if d is not None]
+    ends = [pd.Timestamp(d) for d in ends if d is not None]
+    return (max(starts) if starts else None,
+            min(ends) if ends else None)
+
+
+def _select_range(df, x_range):
+    """the rows of df with a date in x_range"""
+    if x_range is None:
+        return df
+    dates = pd.to_datetime(df["date"], cache=False)
+    start, end = pd.to_datetime(x_range[0]), pd.to_datetime(x_range[1])
+    return df[(dates >= start) & (dates <= end)]
+
+
+def _keep_range(fig, x_range):
+    """keep the zoomed range, instead of resetting it on update"""
+    if x_range is not None:
+        fig.layout.xaxis.range = list(x_range)
+
+
+@app.callback(Output('job', 'data'),
               [Input('uploader', 'contents')],
-              [State('csvtype', 'data')])
-def update_bar_chart(content, csvtype_str):
+              [State('uploader', 'filename'),
+               State('csvtype', 'data')])
+def start_upload(contents, filenames, csvtype_str):
     """
-    Visualizes the raw data content of a file as a time-amount bar graph
+    Starts a job that parses the uploaded files in parallel and stores the
+    merged result in `datasets`, as IndexedDataset that the figure
+    callbacks can slice by date and account. An upload that was parsed
+    before is not parsed again
 
     Params:
     -------
-    content: byte-like
-        undecoded csv file content
+    contents: list of str
+        undecoded csv file contents
+    filenames: list of str
+        names of the uploaded files
     csvtype_str: str
-        name of a supported csv type, should be name of the attribute of
-        SupportedCsvTypes
+        name of a supported csv type, should be name of a type registered
+        in csv_types or AUTODETECT
 
     Returns:
     --------
-    Figure:
-        Bar chart figure, with time on x and total balance on y
+    str:
+        key of the job in `jobs` and of the parsed data in `datasets`,
+        None if nothing was uploaded
     """
-    if content is not None:
-        df = parse_contents(content, csvtype_str)
-        return make_cashflow_figure(df)
+    if not contents:
+        return None
+    if not isinstance(contents, list):
+        contents, filenames = [contents], [filenames]
+    if filenames is None:
+        filenames = [str(i) for i in range(len(contents))]
+    for content in contents:
+        upload_bytes.observe(base64_size(content), route="callback")
+
+    key = dataset_key(csvtype_str, *contents)
+    job = jobs.get(key)
+    if key not in datasets and (job is None or job.finished):
+        def store(frames):
+            datasets.put(key, IndexedDataset(merge_uploads(frames)))
+
+        job = Job(lambda content: parse_contents(content, csvtype_str),
+                  contents,
+                  names=filenames,
+                  workers=UPLOAD_WORKERS,
+                  on_finished=store)
+        jobs.put(key, job)
+        job.start()
+    return key
+
+
+@app.callback(Output('dataset', 'data'),
+              [Input('progress-interval', 'n_intervals'),
+               Input('job', 'data'),
+               Input('url', 'search')],
+              [State('dataset', 'data')])
+def finish_upload(n_intervals, job_key, search=None, dataset_key_shown=None):
+    """
+    Shows the dataset of an upload once it is parsed, or the dataset given
+    in the url if nothing was uploaded with the app
+
+    Params:
+    -------
+    n_intervals: int
+        number of progress updates
+    job_key: str
+        key of the latest upload job
+    search: str, optional
+        query string of the app url, like '?dataset=<key>'
+    dataset_key_shown: str, optional
+        key of the dataset that is shown now
+
+    Returns:
+    --------
+    str:
+        key of the parsed data in `datasets`
+    """
+    if job_key is not None:
+        job = jobs.get(job_key)
+        if job_key not in datasets or (job is not None and not job.finished):
+            # still parsing, or failed to store the dataset, which is
+            # shown by update_progress
+            raise PreventUpdate()
+        key = job_key
     else:
+        key = url_dataset_key(search)
+        if key not in datasets:
+            # unknown or dropped from the cache
+            key = None
+
+    if key == dataset_key_shown:
+        raise PreventUpdate()
+    return key
+
+
+@app.callback(Output('upload-progress', 'children'),
+              [Input('progress-interval', 'n_intervals'),
+               Input('job', 'data'),
+               Input('dataset', 'data')])
+def update_progress(n_intervals, job_key, dataset_key_shown=None):
+    """describes the progress of the latest upload job"""
+    if job_key is None:
+        return None
+    job = jobs.get(job_key)
+    if job is None:
+        # started by another process, keep the last progress
+        raise PreventUpdate()
+
+    progress = job.progress()
+    children = ["Parsed %d of %d files" % (progress["done"] -
+                                           len(progress["failures"]),
+                                           progress["total"])]
+    for name, message in progress["failures"]:
+        children.append(html.Div("%s: %s" % (name, message)))
+    if upload_failed(job_key):
+        children.append(html.Div("The upload could not be stored: %s"
+                                 % progress["error"]))
+    return children
+
+
+@app.callback(Output('progress-interval', 'disabled'),
+              [Input('job', 'data'),
+               Input('dataset', 'data'),
+               Input('progress-interval', 'n_intervals')])
+def toggle_progress_interval(job_key, dataset_key_shown, n_intervals=None):
+    """polls the progress only while an upload is parsed"""
+    return job_key is None or job_key == dataset_key_shown or \
+        upload_failed(job_key)
+
+
+def upload_failed(job_key):
+    """
+    Whether the job of an upload in this process finished without storing
+    its dataset, e.g. because the dataset could not be written to the
+    cache. Otherwise the upload would be polled for forever
+    """
+    job = jobs.get(job_key)
+    return job is not None and job.finished and job_key not in datasets
+
+
+@app.callback(Output('account-selection', 'options'),
+              [Input('dataset', 'data')])
+def update_account_options(key):
+    """offer the accounts of an uploaded dataset for selection"""
+    dataset = datasets.get(key)
+    if dataset is None:
+        return []
+    return [{'label': account, 'value': account}
+            for account in dataset.accounts()]
+
+
+def cached_figure(make_figure, key, relayout_data=None, start_date=None,
+                  end_date=None, accounts=None):
+    """
+    The figure of the selected transactions of a dataset, made only once
+    for each selection and stored in `figures`
+
+    Params:
+    -------
+    make_figure: function: IndexedDataset, start, end, accounts -> Figure
+        e.g. dataset_cashflow_figure
+    key: str
+        key of the parsed data in `datasets`
+    relayout_data: dict, optional
+        zoom state of a graph
+    start_date, end_date: str, optional
+        range of the date picker
+    accounts: list of str, optional
+        selected accounts, all accounts if None or empty
+
+    Returns:
+    --------
+    dict or Figure:
+        the figure, empty if there is no such dataset
+    """
+    figure_key = dataset_key(make_figure.__name__, key,
+                             relayout_x_range(relayout_data),
+                             start_date, end_date, sorted(accounts or []))
+    figure = figures.get(figure_key)
+    if figure is not None:
+        return figure
+
+    dataset = datasets.get(key)
+    if dataset is None:
         return go.Figure(data=[])
 
+    x_range = relayout_x_range(relayout_data)
+    start, end = selected_range(start_date, end_date, x_range)
+    figure = make_figure(dataset, start, end, accounts or None)
+    if x_range is not None:
+        # keep the zoomed range, instead of resetting it on update
+        figure["layout"]["xaxis"] = dict(range=list(x_range))
+    figures.put(figure_key, figure)
+    return figure
+
+
+@app.callback(Output('graph_bar', 'figure'),
+              [Input('dataset', 'data'),
+               Input('graph_bar', 'relayoutData'),
+               Input('date-range', 'start_date'),
+               Input('date-range', 'end_date'),
+               Input('account-selection', 'value')])
+def update_bar_chart(key, relayout_data=None, start_date=None,
+                     end_date=None, accounts=None):
+    """
+    Visualizes an uploaded dataset as a time-amount bar graph
+
+    Params:
+    -------
+    key: str
+        key of the parsed data in `datasets`
+    relayout_data: dict, optional
+        zoom state of the graph, the bars are refined for the zoomed range
+    start_date, end_date: str, optional
+        only show the transactions in this range
+    accounts: list of str, optional
+        only show the transactions of these accounts
+
+    Returns:
+    --------
+    Figure:
+        Bar chart figure, with time on x and total balance on y
+    """
+    return cached_figure(dataset_cashflow_figure, key, relayout_data,
+                         start_date, end_date, accounts)
+
 
 @app.callback(Output('graph_line', 'figure'),
-              [Input('uploader', 'contents')],
-              [State('csvtype', 'data')])
-def update_line(content, csvtype_str):
+              [Input('dataset', 'data'),
+               Input('graph_line', 'relayoutData'),
+               Input('date-range', 'start_date'),
+               Input('date-range', 'end_date'),
+               Input('account-selection', 'value')])
+def update_line(key, relayout_data=None, start_date=None, end_date=None,
+                accounts=None):
     """
-    Visualizes the raw data content of a file as a time-amount line graph
+    Visualizes an uploaded dataset as a time-amount line graph
 
     Params:
     -------
-    content: byte-like
-        undecoded csv file content
-    csvtype_str: str
-        name of a supported csv type, should be name of the attribute of
-        SupportedCsvTypes
+    key: str
+        key of the parsed data in `datasets`
+    relayout_data: dict, optional
+        zoom state of the graph, the line is refined for the zoomed range
+    start_date, end_date: str, optional
+        only show the balances in this range
+    accounts: list of str, optional
+        only show the balances of these accounts
 
     Returns:
     --------
     Figure:
         Line figure, with time on x and amount on y
     """
-    if content is not None:
-        df = parse_contents(content, csvtype_str)
-        return make_line_figure(df)
-    else:
-        return go.Figure(data=[])
+    return cached_figure(dataset_line_figure, key, relayout_data,
+                         start_date, end_date, accounts)
 
 
 @app.callback(Output("uploader", "disabled"),
@@ -247,4 +1059,4 @@ def update_csvtype_store(dropdown_value):
 
 def csvtype_string2description(csvtype_string):
     """get the right csv type object from the list of supported its name"""
-    return getattr(SupportedCsvTypes, csvtype_string)
+    return csv_types[csvtype_string]
@@ -5,15 +5,28 @@ import unittest
 import os.path
 import base64
 import json
+import io
+import timeit
 
+import flask
 import pandas as pd
+from dash.exceptions import PreventUpdate
 import numpy as np
 from numpy.testing import assert_array_equal
 
-from .plot_flow import app, csvtype_string2description, \
-    update_bar_chart, update_line, \
+from .plot_flow import app, server, url_dataset_key, \
+    csvtype_string2description, update_bar_chart, update_line, \
+    start_upload, finish_upload, \
+    update_progress, toggle_progress_interval, merge_uploads, datasets, jobs, \
+    figures, \
     onselect_csvtype, update_csvtype_store, make_cashflow_figure, \
-    make_line_figure, parse_contents
+    make_line_figure, dataset_cashflow_figure, dataset_line_figure, \
+    parse_contents, relayout_x_range, selected_range, \
+    update_account_options, base64_size, callback_name, callback_seconds, \
+    figure_bytes, upload_bytes, parse_rate, _record_callback, \
+    _callback_output
+from .datasets import IndexedDataset
+from .jobs import Job
 from ..dkb import SupportedCsvTypes
 from ..textimporter import amounts_to_balances
 
@@ -49,14 +62,14 @@ class DashTestCase(unittest.TestCase):
         self.assertRaises(IOError, parse_invalid_input)
         self.assertRaises(IOError, parse_invalid_input2)
 
-    def _read_sample_file_like_uploaded(self):
+    def _read_sample_file_like_uploaded(self, filename="dkb_cash_sample.csv"):
         """
         This helper function reads the test file like the dash uploader
         component does
         """
         sample_csv_filepath = os.path.join("pynance",
                                            "test_data",
-                                           "dkb_cash_sample.csv")
+                                           filename)
 
         with open(sample_csv_filepath, "rb") as csvfile:
             b64encoded = base64.b64encode(csvfile.read())
@@ -82,6 +95,15 @@ class DashTestCase(unittest.TestCase):
         self.assertListEqual(expected_sender,
                              list(result_df["sender_account"].values))
 
+    def test_parse_contents_autodetect(self):
+        bytestr = self._read_sample_file_like_uploaded()
+
+        expected_df = parse_contents(bytestr, "DKBCash")
+        result_df = parse_contents(bytestr, "auto")
+
+        assert_array_equal(expected_df["amount"].values,
+                           result_df["amount"].values)
+
     def test_make_bar_chart(self):
         amounts = [12.34,
                    -20,
@@ -158,17 +180,315 @@ class DashTestCase(unittest.TestCase):
         assert_array_equal(balances, res_chart['y'])
         self.assertEqual(final_balance, res_chart['y'][0])
 
+    def _upload_sample_file(self, filenames=("dkb_cash_sample.csv",),
+                            csvtype="DKBCash"):
+        """
+        uploads the test files, waits until they are parsed and returns
+        the key of the dataset
+        """
+        contents = [self._read_sample_file_like_uploaded(filename)
+                    for filename in filenames]
+
+        response = start_upload(contents, list(filenames), csvtype)
+        response_dict = json.loads(response.data.decode())
+        key = response_dict["response"]["props"]["data"]
+
+        self.assertTrue(jobs.get(key).wait(10))
+        return key
+
+    def _large_df(self, n=100000):
+        dates = np.datetime64("2005-01-01") + np.arange(n) // 20
+        amounts = np.where(np.arange(n) % 3, -10.0, 25.0)
+        return pd.DataFrame({"date": dates,
+                             "amount": amounts,
+                             "total_balance": np.cumsum(amounts),
+                             "text": "text"})
+
+    def test_make_bar_chart_aggregated(self):
+        df = self._large_df()
+
+        result_fig = make_cashflow_figure(df, max_bars=300)
+
+        for res_chart in result_fig._data:
+            self.assertLessEqual(len(res_chart['y']), 300)
+        all_y_values = np.concatenate([res_chart['y']
+                                       for res_chart in result_fig._data])
+        self.assertAlmostEqual(df["amount"].sum(), all_y_values.sum())
+
+    def test_make_bar_chart_zoomed(self):
+        df = self._large_df()
+        x_range = ("2006-01-01", "2006-01-31")
+
+        result_fig = make_cashflow_figure(df, x_range, max_bars=1000)
+
+        # few enough transactions in the range to show each of them
+        n_bars = sum(len(res_chart['y']) for res_chart in result_fig._data)
+        self.assertEqual(31 * 20, n_bars)
+        self.assertEqual(list(x_range), list(result_fig.layout.xaxis.range))
+
+    def test_make_line_chart_downsampled(self):
+        df = self._large_df()
+
+        result_fig = make_line_figure(df, max_points=1000)
+        res_chart = result_fig._data[0]
+
+        self.assertEqual('scattergl', res_chart['type'])
+        self.assertEqual(1000, len(res_chart['y']))
+        self.assertEqual(df["total_balance"].iloc[-1], res_chart['y'][-1])
+
+    def test_dataset_bar_chart_like_frame(self):
+        df = self._large_df()
+        df["origin"] = np.where(np.arange(len(df)) % 7, "a", "b")
+        dataset = IndexedDataset(df)
+
+        for accounts in [None, ["a", "b"]]:
+            for x_range in [None, ("2006-01-01", "2009-12-31")]:
+                expected = make_cashflow_figure(df, x_range, max_bars=300)
+                start, end = x_range or (None, None)
+                result = dataset_cashflow_figure(dataset, start, end,
+                                                 accounts, max_bars=300)
+
+                for expected_bars, bars in zip(expected._data,
+                                               result["data"]):
+                    assert_array_equal(pd.to_datetime(expected_bars['x']),
+                                       pd.to_datetime(bars['x']))
+                    np.testing.assert_allclose(expected_bars['y'],
+                                               bars['y'])
+                    self.assertEqual(list(expected_bars['text']),
+                                     list(bars['text']))
+
+    def test_dataset_bar_chart_zoomed(self):
+        dataset = IndexedDataset(self._large_df())
+
+        result = dataset_cashflow_figure(dataset, "2006-01-01",
+                                         "2006-01-31", max_bars=1000)
+
+        n_bars = sum(len(bars['y']) for bars in result["data"])
+        self.assertEqual(31 * 20, n_bars)
+        self.assertTrue(all(bars['x'].is_monotonic_decreasing
+                            for bars in result["data"]))
+
+    def test_dataset_line_chart_downsampled(self):
+        # newest first, like the exports
+        df = self._large_df().iloc[::-1]
+
+        result = dataset_line_figure(IndexedDataset(df), max_points=1000)
+        line = result["data"][0]
+
+        self.assertEqual('scattergl', line['type'])
+        self.assertEqual(1000, len(line['y']))
+        self.assertEqual(df["total_balance"].iloc[0], line['y'][-1])
+        # the dates are sent as dates
+        self.assertEqual(df["date"].iloc[0], pd.Timestamp(str(line['x'][-1])))
+
+    def test_dataset_line_chart_accounts(self):
+        df = pd.DataFrame({
+            "date": pd.to_datetime(["2018-12-05", "2018-12-01",
+                                    "2018-12-04", "2018-12-02"]),
+            "amount": [10.0, -5.0, 1.0, 2.0],
+            "total_balance": [105.0, 95.0, 13.0, 12.0],
+            "origin": ["a", "a", "b", "b"]})
+        dataset = IndexedDataset(df)
+
+        result = dataset_line_figure(dataset)
+
+        self.assertEqual(["a", "b", "total"],
+                         [line['name'] for line in result["data"]])
+        assert_array_equal([105.0, 107.0, 107.0, 108.0, 118.0],
+                           result["data"][2]['y'])
+        # a single account is shown as a single line
+        result = dataset_line_figure(dataset, accounts=["b"])
+        self.assertEqual(1, len(result["data"]))
+        assert_array_equal([13.0, 12.0], result["data"][0]['y'])
+
+    def test_relayout_x_range(self):
+        self.assertIsNone(relayout_x_range(None))
+        self.assertIsNone(relayout_x_range({"xaxis.autorange": True}))
+        self.assertEqual(("2018-01-01", "2018-02-01"),
+                         relayout_x_range({"xaxis.range[0]": "2018-01-01",
+                                           "xaxis.range[1]": "2018-02-01"}))
+        self.assertEqual(("2018-01-01", "2018-02-01"),
+                         relayout_x_range({"xaxis.range": ["2018-01-01",
+                                                           "2018-02-01"]}))
+
     def test_update_output_None(self):
-        self.assertFalse(update_bar_chart(None, "") is None)
+        self.assertFalse(update_bar_chart(None) is None)
+
+    def test_start_upload_parses_once(self):
+        key = self._upload_sample_file()
+        df = datasets.get(key)
+        self.assertEqual(3, len(df))
+
+        # the same upload is not parsed again
+        self.assertEqual(key, self._upload_sample_file())
+        self.assertIs(df, datasets.get(key))
+
+    def test_start_upload_None(self):
+        response = start_upload(None, None, "DKBCash")
+        response_dict = json.loads(response.data.decode())
+
+        self.assertIsNone(response_dict["response"]["props"]["data"])
+
+    def test_start_upload_many_files(self):
+        filenames = ["dkb_cash_sample.csv",
+                     "dkb_visa_sample.csv",
+                     "dkb_cash_sample_broken.csv"]
+
+        key = self._upload_sample_file(filenames, "auto")
+
+        progress = jobs.get(key).progress()
+        self.assertEqual(3, progress["done"])
+        self.assertEqual(["dkb_cash_sample_broken.csv"],
+                         [name for name, _ in progress["failures"]])
+
+        dataset = datasets.get(key)
+        self.assertEqual(2, len(dataset.accounts()))
+
+    def test_finish_upload(self):
+        key = self._upload_sample_file()
+
+        response = finish_upload(1, key, None, None)
+        response_dict = json.loads(response.data.decode())
+        self.assertEqual(key, response_dict["response"]["props"]["data"])
+
+        # the dataset is shown already
+        self.assertRaises(PreventUpdate, finish_upload, 2, key, None, key)
+
+    def test_finish_upload_url(self):
+        key = self._upload_sample_file()
+
+        response = finish_upload(0, None, "?dataset=" + key, None)
+        response_dict = json.loads(response.data.decode())
+        self.assertEqual(key, response_dict["response"]["props"]["data"])
+
+        # unknown datasets are not shown
+        self.assertRaises(PreventUpdate, finish_upload, 0, None,
+                          "?dataset=unknown", None)
+
+    def test_url_dataset_key(self):
+        self.assertIsNone(url_dataset_key(None))
+        self.assertIsNone(url_dataset_key("?other=1"))
+        self.assertEqual("abc", url_dataset_key("?dataset=abc&other=1"))
+
+    def _read_sample_file(self, filename="dkb_cash_sample.csv"):
+        with open(os.path.join("pynance", "test_data", filename), "rb") as f:
+            return f.read()
+
+    def test_upload_route_body(self):
+        client = server.test_client()
+
+        response = client.post("/upload?csvtype=DKBCash",
+                               data=self._read_sample_file(),
+                               content_type="text/csv")
+        result = json.loads(response.data.decode())
+
+        self.assertEqual(201, response.status_code)
+        self.assertEqual(3, result["rows"])
+        self.assertEqual("/?dataset=" + result["dataset"], result["url"])
+        dataset = datasets.get(result["dataset"])
+        assert_array_equal([-12.16, 120.0, -10.0],
+                           dataset.frame["amount"].values)
+
+    def test_upload_route_multipart(self):
+        client = server.test_client()
+        files = [(io.BytesIO(self._read_sample_file(filename)), filename)
+                 for filename in ["dkb_cash_sample.csv",
+                                  "dkb_visa_sample.csv",
+                                  "dkb_cash_sample_wrong_col.csv"]]
+
+        response = client.post("/upload",
+                               data={"file": files},
+                               content_type="multipart/form-data")
+        result = json.loads(response.data.decode())
+
+        self.assertEqual(201, response.status_code)
+        self.assertEqual(7, result["rows"])
+        self.assertEqual(["dkb_cash_sample_wrong_col.csv"],
+                         [name for name, _ in result["failures"]])
+        self.assertEqual(2, len(datasets.get(result["dataset"]).accounts()))
+
+    def test_upload_route_errors(self):
+        client = server.test_client()
+
+        response = client.post("/upload?csvtype=unknown", data=b"")
+        self.assertEqual(400, response.status_code)
+
+        response = client.post("/upload", data=b"no csv file",
+                               content_type="text/csv")
+        self.assertEqual(400, response.status_code)
+
+    def test_update_progress(self):
+        key = self._upload_sample_file()
+
+        response = update_progress(1, key, None)
+        response_dict = json.loads(response.data.decode())
+        self.assertEqual(["Parsed 1 of 1 files"],
+                         response_dict["response"]["props"]["children"])
+
+    def test_toggle_progress_interval(self):
+        for expected, job_key, key_shown in [(True, None, None),
+                                             (False, "key", None),
+                                             (True, "key", "key")]:
+            response = toggle_progress_interval(job_key, key_shown)
+            response_dict = json.loads(response.data.decode())
+            self.assertEqual(expected,
+                             response_dict["response"]["props"]["disabled"])
+
+    def test_upload_not_stored(self):
+        def fail(frames):
+            raise IOError("disk full")
+
+        key = "not stored"
+        job = Job(len, ["content"], on_finished=fail)
+        job.run()
+        jobs.put(key, job)
+
+        response = update_progress(1, key, None)
+        response_dict = json.loads(response.data.decode())
+        children = response_dict["response"]["props"]["children"]
+        self.assertEqual("The upload could not be stored: disk full",
+                         children[-1]["props"]["children"])
+
+        response = toggle_progress_interval(key, None, 1)
+        response_dict = json.loads(response.data.decode())
+        self.assertTrue(response_dict["response"]["props"]["disabled"])
+        self.assertRaises(PreventUpdate, finish_upload, 1, key, None, None)
+
+    def test_merge_uploads(self):
+        bytestr = self._read_sample_file_like_uploaded()
+        df = parse_contents(bytestr, "DKBCash")
+
+        # the same export uploaded twice
+        merged = merge_uploads([df, df])
+
+        self.assertEqual(3, len(merged))
+        self.assertEqual(0, len(merge_uploads([])))
+
+    def test_make_balance_line_chart_accounts(self):
+        df = pd.DataFrame({
+            "date": pd.to_datetime(["2018-12-05", "2018-12-01",
+                                    "2018-12-04", "2018-12-02"]),
+            "amount": [10.0, -5.0, 1.0, 2.0],
+            "total_balance": [105.0, 95.0, 13.0, 12.0],
+            "origin": ["a", "a", "b", "b"]})
+
+        result_fig = make_line_figure(df)
+
+        self.assertEqual(["a", "b", "total"],
+                         [res_chart['name'] for res_chart in result_fig._data])
+        # the total at the end of each day, b has its opening balance on
+        # the first day
+        assert_array_equal([105.0, 107.0, 107.0, 108.0, 118.0],
+                           result_fig._data[2]['y'])
 
     def test_update_bar_chart(self):
         expected_amount = np.array([-12.16,
                                     120.0,
                                     -10.0]).astype(np.float64)
 
-        bytestr = self._read_sample_file_like_uploaded()
+        key = self._upload_sample_file()
 
-        response = update_bar_chart(bytestr, "DKBCash")
+        response = update_bar_chart(key)
         response_dict = json.loads(response.data.decode())
 
         res_charts = response_dict["response"]["props"]["figure"]["data"]
@@ -181,14 +501,24 @@ class DashTestCase(unittest.TestCase):
         assert_array_equal(np.sort(all_y_values),
                            np.sort(expected_amount))
 
+    def test_update_bar_chart_cached(self):
+        key = self._upload_sample_file()
+        n_figures = len(figures)
+
+        first = update_bar_chart(key, None, "2018-12-04")
+        second = update_bar_chart(key, None, "2018-12-04")
+
+        self.assertEqual(n_figures + 1, len(figures))
+        self.assertEqual(first.data, second.data)
+
     def test_update_line(self):
         expected_balance = np.array([1248.54,
                                      1260.70,
                                      1140.70]).astype(np.float64)
 
-        bytestr = self._read_sample_file_like_uploaded()
+        key = self._upload_sample_file()
 
-        response = update_line(bytestr, "DKBCash")
+        response = update_line(key)
         response_dict = json.loads(response.data.decode())
 
         res_chart = response_dict["response"]["props"]["figure"]["data"][0]
@@ -196,6 +526,141 @@ class DashTestCase(unittest.TestCase):
         assert_array_equal(res_chart['y'],
                            expected_balance)
 
+    def test_selected_range(self):
+        self.assertEqual((None, None), selected_range())
+        self.assertEqual((pd.Timestamp("2018-01-01"), None),
+                         selected_range("2018-01-01"))
+        self.assertEqual((pd.Timestamp("2018-02-01"),
+                          pd.Timestamp("2018-03-01")),
+                         selected_range("2018-01-01", "2018-03-01",
+                                        ("2018-02-01", "2018-04-01")))
+
+    def test_parse_contents_origin(self):
+        bytestr = self._read_sample_file_like_uploaded()
+
+        result_df = parse_contents(bytestr, "DKBCash")
+
+        self.assertEqual(["DE95500105178154844163"] * 3,
+                         list(result_df["origin"]))
+
+    def test_update_account_options(self):
+        key = self._upload_sample_file()
+
+        response = update_account_options(key)
+        response_dict = json.loads(response.data.decode())
+
+        self.assertEqual([{"label": "DE95500105178154844163",
+                           "value": "DE95500105178154844163"}],
+                         response_dict["response"]["props"]["options"])
+
+    def test_update_bar_chart_date_range(self):
+        key = self._upload_sample_file()
+
+        response = update_bar_chart(key, None, "2018-12-03", "2018-12-03")
+        response_dict = json.loads(response.data.decode())
+
+        res_charts = response_dict["response"]["props"]["figure"]["data"]
+        all_y_values = np.concatenate([res_chart['y']
+                                       for res_chart in res_charts])
+        assert_array_equal([-10.0, 120.0], np.sort(all_y_values))
+
+    def test_update_line_accounts(self):
+        key = self._upload_sample_file()
+
+        response = update_line(key, None, None, None, ["other account"])
+        response_dict = json.loads(response.data.decode())
+
+        res_chart = response_dict["response"]["props"]["figure"]["data"][0]
+        self.assertEqual(0, len(res_chart.get('y', [])))
+
+    def test_base64_size(self):
+        for content in [b"", b"a", b"ab", b"abc", b"abcd"]:
+            contents = "data:text/csv;base64," + \
+                base64.b64encode(content).decode()
+            self.assertEqual(len(content), base64_size(contents))
+
+    def test_callback_name(self):
+        self.assertEqual("update_bar_chart",
+                         callback_name("graph_bar", "figure"))
+        self.assertEqual("unknown", callback_name("graph_bar", "other"))
+
+    def test_callback_metrics(self):
+        client = server.test_client()
+        inputs = [{"id": "dataset", "property": "data", "value": None},
+                  {"id": "graph_line", "property": "relayoutData"},
+                  {"id": "date-range", "property": "start_date"},
+                  {"id": "date-range", "property": "end_date"},
+                  {"id": "account-selection", "property": "value"}]
+        calls = callback_seconds.count(callback="update_line")
+        figures_sent = figure_bytes.count(callback="update_line")
+
+        response = client.post("/_dash-update-component",
+                               data=json.dumps({
+                                   "output": {"id": "graph_line",
+                                              "property": "figure"},
+                                   "inputs": inputs,
+                                   "state": []}),
+                               content_type="application/json")
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(calls + 1,
+                         callback_seconds.count(callback="update_line"))
+        self.assertEqual(figures_sent + 1,
+                         figure_bytes.count(callback="update_line"))
+
+    def test_callback_metrics_string_output(self):
+        # dash from 0.39 on sends the output as 'id.property'
+        calls = callback_seconds.count(callback="update_bar_chart")
+        with server.test_request_context(
+                "/_dash-update-component", method="POST",
+                json={"output": "graph_bar.figure", "inputs": []}):
+            flask.g.callback_start = timeit.default_timer()
+            response = flask.Response("{}", status=200)
+            self.assertIs(response, _record_callback(response))
+
+        self.assertEqual(calls + 1,
+                         callback_seconds.count(callback="update_bar_chart"))
+        self.assertEqual(("a.b", "figure"),
+                         _callback_output({"output": "a.b.figure"}))
+        self.assertEqual(("graph_bar", "figure"),
+                         _callback_output({"output": {"id": "graph_bar",
+                                                      "property": "figure"}}))
+
+    def test_callback_metrics_never_fail(self):
+        for body in [{"output": 5}, ["output"], None]:
+            with server.test_request_context(
+                    "/_dash-update-component", method="POST", json=body):
+                flask.g.callback_start = timeit.default_timer()
+                response = flask.Response("{}", status=200)
+                self.assertIs(response, _record_callback(response))
+
+    def test_upload_metrics(self):
+        uploads = upload_bytes.count(route="upload")
+        parses = parse_rate.count()
+
+        self.test_upload_route_body()
+        self.assertEqual(uploads + 1, upload_bytes.count(route="upload"))
+        self.assertEqual(parses + 1, parse_rate.count())
+
+        self._upload_sample_file()
+        self.assertLessEqual(1, upload_bytes.count(route="callback"))
+
+    def test_metrics_route(self):
+        self._upload_sample_file()
+        update_bar_chart(None)
+
+        response = server.test_client().get("/metrics")
+        text = response.data.decode()
+
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(response.content_type.startswith("text/plain"))
+        for name in ["pynance_callback_seconds", "pynance_figure_json_bytes",
+                     "pynance_upload_bytes", "pynance_parse_rows_per_second",
+                     "pynance_cache_requests_total"]:
+            self.assertIn("# TYPE %s " % name, text)
+        self.assertIn('pynance_cache_requests_total{cache="datasets",'
+                      'result="hit"}', text)
+
 
 def test_suite():
     """test suite for plot_flow"""
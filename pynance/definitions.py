@@ -17,4 +17,20 @@ COLUMNS = {
     "currency": str,
     "category": str,
     "tags": str,
-    "origin": str}
\ No newline at end of file
+    "origin": str}
+
+# str columns with few distinct values, they are stored as categoricals
+# in compact DataFrames
+CATEGORICAL_COLUMNS = [
+    "sender_account",
+    "receiver_account",
+    "currency",
+    "category",
+    "origin"]
+
+# metadata that can be found in the preamble of a csv file,
+# i.e. in the lines before the header
+PREAMBLE_FIELDS = {
+    "account": str,
+    "period_start": np.datetime64,
+    "period_end": np.datetime64}
@@ -5,8 +5,9 @@ import datetime
 import re
 
 import numpy as np
+import pandas as pd
 
-from .textimporter import CsvFileDescription
+from .textimporter import CsvFileDescription, csv_types
 
 # DKB definitions
 # for most solutions, see
@@ -20,6 +21,12 @@ class DKBFormatters():
         as given from a DKB CSV file to all the types needed in COLUMNS
     """
 
+    # removes the thousands separator and turns the decimal comma into a dot
+    _german_decimal_table = {ord(u"."): None, ord(u","): u"."}
+
+    # positions of the digits in a date like 24.12.2018
+    _date_digits = [0, 1, 3, 4, 6, 7, 8, 9]
+
     @classmethod
     def to_datetime64(cls, datestring):
         date = datetime.datetime.strptime(datestring, "%d.%m.%Y")
@@ -49,6 +56,70 @@ class DKBFormatters():
             np.float64: cls.to_float64
         }
 
+    @classmethod
+    def series_to_datetime64(cls, dateseries):
+        # dates like 24.12.2018 are parsed as bytes with array arithmetic,
+        # which is much faster than pandas.to_datetime and does not hold
+        # the GIL. Anything else is left to pandas, which also raises for
+        # invalid dates
+        def parse_with_pandas():
+            return pd.to_datetime(dateseries, format="%d.%m.%Y")
+
+        missing = dateseries.isna().values
+        try:
+            # one byte more than a date, which is 0 for dates
+            chars = dateseries.where(~missing, "01.01.1970").values \
+                .astype("S11")
+        except UnicodeEncodeError:
+            return parse_with_pandas()
+
+        codes = chars.view(np.uint8).reshape(-1, 11).astype(np.int64)
+        digits = codes - ord("0")
+        is_date = np.all((digits[:, cls._date_digits] >= 0)
+                         & (digits[:, cls._date_digits] <= 9), axis=1)
+        is_date &= (codes[:, 2] == ord(".")) & (codes[:, 5] == ord(".")) \
+            & (codes[:, 10] == 0)
+
+        day = digits[:, 0] * 10 + digits[:, 1]
+        month = digits[:, 3] * 10 + digits[:, 4]
+        year = digits[:, 6] * 1000 + digits[:, 7] * 100 \
+            + digits[:, 8] * 10 + digits[:, 9]
+        is_date &= (month >= 1) & (month <= 12) & (day >= 1)
+        if not is_date.all():
+            return parse_with_pandas()
+
+        months = (year - 1970) * 12 + month - 1
+        dates = months.astype("datetime64[M]").astype("datetime64[D]") \
+            + (day - 1).astype("timedelta64[D]")
+        # e.g. 31.04. would be in the next month
+        if np.any(dates.astype("datetime64[M]").view(np.int64) != months):
+            return parse_with_pandas()
+
+        dates = dates.astype("datetime64[ns]")
+        dates[missing] = np.datetime64("NaT")
+        return pd.Series(dates, index=dateseries.index)
+
+    @classmethod
+    def series_to_string(cls, stringseries):
+        # remove trailing whitespace
+        return stringseries.str.strip()
+
+    @classmethod
+    def series_to_float64(cls, numberseries):
+        # drop the thousands separators and swap the decimal comma
+        # in a single pass over each cell
+        numbers = numberseries.str.translate(cls._german_decimal_table)
+        # astype rounds exactly like float(), unlike pandas.to_numeric
+        return numbers.replace("", np.nan).astype(np.float64)
+
+    @classmethod
+    def column_formatter_map(cls):
+        return {
+            np.datetime64: cls.series_to_datetime64,
+            str: cls.series_to_string,
+            np.float64: cls.series_to_float64
+        }
+
 
 class DKBCsvDialect(csv.Dialect):
     """
@@ -65,7 +136,9 @@ class DKBCsvDialect(csv.Dialect):
 class SupportedCsvTypes():
     """
         Static enumeration of all the supported CSV file types, to be used
-        with :func:`~textimporter.read_csv~`
+        with :func:`~textimporter.read_csv~`. They are registered in
+        :data:`~textimporter.csv_types` as well, which can detect the type
+        of a file
     """
     DKBCash = CsvFileDescription(
         column_map={
@@ -80,7 +153,15 @@ class SupportedCsvTypes():
         encoding="iso-8859-1",
         total_balance_re_pattern=r'(?<=Kontostand vom \d{2}.\d{2}.\d{4}:";")'
                                  r'(.*)(?= EUR";)',
-        total_balance_formatter=DKBFormatters.to_float64)
+        total_balance_formatter=DKBFormatters.to_float64,
+        column_formatters=DKBFormatters.column_formatter_map(),
+        preamble_re_patterns={
+            "account": r'(?<=Kontonummer:";")(\w+)',
+            "period_start": r'(?<=Von:";")(\d{2}.\d{2}.\d{4})',
+            "period_end": r'(?<=Bis:";")(\d{2}.\d{2}.\d{4})',
+        },
+        decimal=",",
+        thousands=".")
 
     DKBVisa = CsvFileDescription(
         column_map={
@@ -93,4 +174,16 @@ class SupportedCsvTypes():
         skiprows=6,
         encoding="iso-8859-1",
         total_balance_re_pattern=r'(?<=Saldo:";")(.*)(?= EUR";)',
-        total_balance_formatter=DKBFormatters.to_float64_VISA_header)
+        total_balance_formatter=DKBFormatters.to_float64_VISA_header,
+        column_formatters=DKBFormatters.column_formatter_map(),
+        preamble_re_patterns={
+            "account": r'(?<=Kreditkarte:";")([\w*]+)',
+            # the export date is the end of the period
+            "period_end": r'(?<=Datum:";")(\d{2}.\d{2}.\d{4})',
+        },
+        decimal=",",
+        thousands=".")
+
+
+csv_types.register("DKBCash", SupportedCsvTypes.DKBCash)
+csv_types.register("DKBVisa", SupportedCsvTypes.DKBVisa)
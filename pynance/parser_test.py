@@ -6,9 +6,11 @@ import locale
 import platform
 
 import numpy as np
+import pandas as pd
+from numpy.testing import assert_array_equal
 
 from hypothesis import given
-from hypothesis.strategies import datetimes, decimals
+from hypothesis.strategies import datetimes, decimals, lists, text
 
 from .dkb import DKBFormatters
 
@@ -55,6 +57,60 @@ class ParserTestCase(unittest.TestCase):
 
         self.assertEqual(expected, date_result)
 
+    @given(lists(datetimes(min_value=datetime.datetime(1900, 1, 1, 0, 0),
+                           max_value=datetime.datetime(2200, 1, 1, 0, 0)),
+                 min_size=1))
+    def test_dkb_date_column_formatting(self, dts):
+        """
+        the column formatter must give the same dates as the scalar one
+        """
+        datestrs = pd.Series([dt.strftime("%d.%m.%Y") for dt in dts])
+
+        expected = datestrs.apply(DKBFormatters.to_datetime64)
+        result = DKBFormatters.series_to_datetime64(datestrs)
+
+        assert_array_equal(expected.values, result.values)
+
+    def test_dkb_date_column_formatting_fallback(self):
+        datestrs = pd.Series(["1.2.2018", None, "24.12.2018"])
+        result = DKBFormatters.series_to_datetime64(datestrs)
+        assert_array_equal(np.array(["2018-02-01", "NaT", "2018-12-24"],
+                                    dtype="datetime64[ns]"),
+                           result.values)
+
+        for invalid in ["31.04.2018", "24.12.2018x", u"24.12.2\xf6"]:
+            self.assertRaises(ValueError, DKBFormatters.series_to_datetime64,
+                              pd.Series([invalid]))
+
+    @given(lists(decimals(allow_infinity=False,
+                          allow_nan=False,
+                          places=2), min_size=1))
+    def test_dkb_float_column_formatting(self, decimals_list):
+        """
+        the column formatter must give the same numbers as the scalar one,
+        including empty cells
+        """
+        numberstrs = pd.Series(["{:,.2f}".format(d)
+                                .replace(",", "_")
+                                .replace(".", ",")
+                                .replace("_", ".")
+                                for d in decimals_list] + [""])
+
+        expected = numberstrs.apply(DKBFormatters.to_float64)
+        result = DKBFormatters.series_to_float64(numberstrs)
+
+        self.assertEqual(np.float64, result.dtype)
+        assert_array_equal(expected.values, result.values)
+
+    @given(lists(text(), min_size=1))
+    def test_dkb_string_column_formatting(self, strings):
+        strings = pd.Series(strings)
+
+        expected = strings.apply(DKBFormatters.to_string)
+        result = DKBFormatters.series_to_string(strings)
+
+        self.assertListEqual(expected.tolist(), result.tolist())
+
 
 def test_suite():
     suite = unittest.makeSuite(ParserTestCase)
@@ -0,0 +1,256 @@
+"""
+This module contains a full text index of transactions, so that filtering
+by words does not scan the texts of all transactions, see
+docs/graphs/usecase_filter-refinement.dot
+"""
+from __future__ import absolute_import
+
+import re
+import unicodedata
+from bisect import bisect_left
+
+import numpy as np
+import pandas as pd
+
+# columns whose words are indexed, the accounts are the counterparts
+INDEXED_COLUMNS = ["text", "sender_account", "receiver_account"]
+
+OPERATORS = ["and", "or"]
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+# only texts with these characters can have accents
+_NON_ASCII_RE = re.compile(u"[^\x00-\x7f]")
+
+# sorts after all characters of a token, for prefix ranges
+_MAX_CHAR = u"\uffff"
+
+
+def tokenize(text):
+    """
+    Splits a text into normalized words: lower case, without accents, e.g.
+    u"PP.4882.PP . FLIXBUS" -> [u"pp", u"4882", u"pp", u"flixbus"]
+
+    Parameters
+    ----------
+    text : str
+
+    Returns
+    -------
+    list of str
+    """
+    text = u"%s" % text.lower()
+    if _NON_ASCII_RE.search(text) is not None:
+        decomposed = unicodedata.normalize("NFKD", text)
+        text = u"".join(char for char in decomposed
+                        if not unicodedata.combining(char))
+    return _WORD_RE.findall(text)
+
+
+class TextIndex():
+    """
+        An inverted index from the words of the indexed columns to the ids
+        of the transactions that contain them
+
+        The ids of each word are kept as sorted integer arrays. A query
+        looks up its words, so its cost grows with the number of matching
+        transactions, not with the number of indexed ones. New transactions
+        are added with larger ids than the indexed ones, so the arrays only
+        grow at their ends.
+    """
+
+    def __init__(self):
+        # word -> list of sorted id arrays, concatenated on the next lookup
+        self._postings = {}
+        # sorted words for prefix queries, None if it must be sorted again
+        self._words = []
+        self._last_id = -1
+        self._count = 0
+
+    def add(self, df, ids=None):
+        """
+        Adds transactions to the index
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            transactions with the columns in INDEXED_COLUMNS
+        ids : array-like of int, optional
+            increasing ids of the transactions, larger than the ids in the
+            index. Defaults to the numbers following the largest id
+
+        Returns
+        -------
+        TextIndex : self
+
+        Raises
+        ------
+        ValueError
+            if the ids are not increasing or not larger than the indexed
+            ones
+        """
+        if ids is None:
+            ids = np.arange(self._last_id + 1, self._last_id + 1 + len(df))
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(ids) == 0:
+            return self
+        if ids[0] <= self._last_id or np.any(ids[1:] <= ids[:-1]):
+            raise ValueError("ids must be increasing and larger than %d"
+                             % self._last_id)
+
+        # one key per (word, transaction) pair, that sorts by word and then
+        # by id, which is much faster to sort than the pairs themselves
+        vocabulary = {}
+        keys = []
+        for col_name in INDEXED_COLUMNS:
+            codes, positions = self._word_codes(df[col_name], vocabulary)
+            keys.append(codes * len(ids) + positions)
+        # unique drops words repeated in a transaction
+        keys = np.unique(np.concatenate(keys))
+        word_codes = keys // len(ids)
+        word_ids = ids[keys % len(ids)]
+
+        words = sorted(vocabulary, key=vocabulary.get)
+        starts = np.flatnonzero(np.r_[True, word_codes[1:] != word_codes[:-1]])
+        ends = np.r_[starts[1:], len(word_codes)]
+        for start, end in zip(starts, ends):
+            word = words[word_codes[start]]
+            if word not in self._postings:
+                self._postings[word] = []
+                self._words = None
+            self._postings[word].append(word_ids[start:end])
+
+        self._last_id = ids[-1]
+        self._count += len(ids)
+        return self
+
+    def lookup(self, word, prefix=False):
+        """
+        Finds the transactions that contain a word
+
+        Parameters
+        ----------
+        word : str
+            normalized like :func:`tokenize`
+        prefix : bool
+            also find the words that start with `word`
+
+        Returns
+        -------
+        numpy.ndarray of int : sorted ids
+        """
+        word = u"%s" % word
+        if not prefix:
+            return self._posting(word)
+
+        words = self._sorted_words()
+        lo = bisect_left(words, word)
+        hi = bisect_left(words, word + _MAX_CHAR)
+        if hi - lo == 1:
+            return self._posting(words[lo])
+        postings = [self._posting(w) for w in words[lo:hi]]
+        if not postings:
+            return np.array([], dtype=np.int64)
+        return np.unique(np.concatenate(postings))
+
+    def search(self, query, operator="and"):
+        """
+        Finds the transactions that contain the words of a query
+
+        Parameters
+        ----------
+        query : str
+            words separated by spaces, they are normalized like
+            :func:`tokenize`. A word followed by `*` matches all words
+            that start with it, e.g. "flix*"
+        operator : str
+            "and" to find transactions that contain all words, "or" for
+            transactions that contain any of them
+
+        Returns
+        -------
+        numpy.ndarray of int : sorted ids
+
+        Raises
+        ------
+        ValueError
+            if an unknown operator is given
+        """
+        if operator not in OPERATORS:
+            raise ValueError("Unknown operator: %r" % operator)
+
+        postings = []
+        for term in query.split():
+            prefix = term.endswith("*")
+            # a term like "Vers.-Nr.0065" is looked up as its words
+            for word in tokenize(term):
+                postings.append(self.lookup(word, prefix=prefix))
+
+        if not postings:
+            return np.array([], dtype=np.int64)
+        if operator == "or":
+            return np.unique(np.concatenate(postings))
+        return _intersect(postings)
+
+    @property
+    def last_id(self):
+        """the largest indexed id, -1 if nothing is indexed"""
+        return self._last_id
+
+    def __len__(self):
+        """number of indexed transactions"""
+        return self._count
+
+    def _posting(self, word):
+        chunks = self._postings.get(word)
+        if not chunks:
+            return np.array([], dtype=np.int64)
+        if len(chunks) > 1:
+            chunks[:] = [np.concatenate(chunks)]
+        return chunks[0]
+
+    def _sorted_words(self):
+        if self._words is None:
+            self._words = sorted(self._postings)
+        return self._words
+
+    @staticmethod
+    def _word_codes(values, vocabulary):
+        """
+        codes of the words of the values and the position of the value of
+        each word. Each distinct value is only tokenized once
+        """
+        codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+
+        unique_words = []
+        n_words = np.zeros(len(uniques) + 1, dtype=np.int64)
+        for i, value in enumerate(uniques):
+            words = [vocabulary.setdefault(word, len(vocabulary))
+                     for word in tokenize(value)]
+            unique_words.extend(words)
+            n_words[i] = len(words)
+        unique_words = np.array(unique_words, dtype=np.int64)
+        # factorize gives -1 for missing values, which have no words
+        offsets = np.r_[0, np.cumsum(n_words[:-1])]
+
+        lengths = n_words[codes]
+        positions = np.repeat(np.arange(len(codes)), lengths)
+        # the position of each word within its value
+        within = np.arange(len(positions)) - np.repeat(
+            np.cumsum(lengths) - lengths, lengths)
+        return unique_words[offsets[codes][positions] + within], positions
+
+
+def _intersect(postings):
+    """
+    the ids in all sorted postings, the shortest one is looked up in the
+    others, so the cost depends on its length
+    """
+    postings = sorted(postings, key=len)
+    result = postings[0]
+    for posting in postings[1:]:
+        if len(result) == 0:
+            break
+        positions = np.searchsorted(posting, result)
+        found = posting[np.minimum(positions, len(posting) - 1)] == result
+        result = result[found]
+    return result
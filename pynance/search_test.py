@@ -0,0 +1,89 @@
+from __future__ import absolute_import
+
+import unittest
+
+import numpy as np
+import pandas as pd
+from numpy.testing import assert_array_equal
+
+from .search import TextIndex, tokenize
+
+
+class TextIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.df = pd.DataFrame({
+            "text": [u"PP.4882.PP . FLIXBUS, Ihr Einkauf bei FLIXBUS",
+                     u"Miete 2017",
+                     u"Vers.-Nr.0065435465, Helene Musterfrau",
+                     u"Flixtrain Berlin",
+                     np.nan],
+            "sender_account": [None, u"DE63500105173984825797", None, None,
+                               None],
+            "receiver_account": [u"DE39500105174461799382", None,
+                                 u"DE75500105178797957724", None, None]})
+
+    def test_tokenize(self):
+        self.assertListEqual([u"pp", u"4882", u"pp", u"flixbus"],
+                             tokenize(u"PP.4882.PP . FLIXBUS"))
+        self.assertListEqual([u"muller", u"strasse"],
+                             tokenize(u"Müller Strasse"))
+
+    def test_search(self):
+        index = TextIndex().add(self.df)
+        self.assertEqual(5, len(index))
+
+        assert_array_equal([0], index.search("flixbus"))
+        assert_array_equal([1], index.search("MIETE"))
+        assert_array_equal([2], index.search("0065435465"))
+        assert_array_equal([2], index.search("Vers.-Nr.0065435465"))
+        assert_array_equal([1], index.search("de63500105173984825797"))
+        assert_array_equal([], index.search("bahn"))
+        assert_array_equal([], index.search(""))
+
+    def test_operators_and_prefixes(self):
+        index = TextIndex().add(self.df)
+
+        assert_array_equal([0, 3], index.search("flix*"))
+        assert_array_equal([3], index.search("flix* berlin"))
+        assert_array_equal([0, 1, 3],
+                           index.search("flix* miete", operator="or"))
+        assert_array_equal([], index.search("flix* miete"))
+        assert_array_equal([], index.search("*", operator="or"))
+        self.assertRaises(ValueError, index.search, "miete", "not")
+
+    def test_incremental(self):
+        index = TextIndex().add(self.df.iloc[:2], ids=[10, 20])
+        index.add(self.df.iloc[2:], ids=[21, 22, 30])
+
+        assert_array_equal([10, 22], index.search("flix*"))
+        assert_array_equal([10], index.search("flixbus"))
+        self.assertEqual(30, index.last_id)
+        self.assertRaises(ValueError, index.add, self.df.iloc[:1], [30])
+        self.assertRaises(ValueError, index.add, self.df.iloc[:2], [40, 40])
+
+    def test_like_str_contains(self):
+        rng = np.random.RandomState(0)
+        words = ["".join(rng.choice(list("abc"), 3)) for _ in range(20)]
+        texts = [" ".join(rng.choice(words, rng.randint(0, 5)))
+                 for _ in range(1000)]
+        df = pd.DataFrame({"text": texts, "sender_account": None,
+                           "receiver_account": None})
+        index = TextIndex()
+        for start in range(0, len(df), 300):
+            index.add(df.iloc[start:start + 300])
+
+        has_word = [df["text"].str.split().apply(lambda ws: word in ws)
+                    for word in words[:3]]
+        assert_array_equal(np.flatnonzero(has_word[0] & has_word[1]),
+                           index.search(" ".join(words[:2])))
+        assert_array_equal(
+            np.flatnonzero(has_word[0] | has_word[1] | has_word[2]),
+            index.search(" ".join(words[:3]), operator="or"))
+        assert_array_equal(
+            np.flatnonzero(df["text"].str.contains(r"\bab")),
+            index.search("ab*"))
+
+
+def test_suite():
+    suite = unittest.makeSuite(TextIndexTestCase)
+    return suite
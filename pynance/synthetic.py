@@ -0,0 +1,373 @@
+"""
+This module writes synthetic DKB Cash and DKB Visa exports of any size,
+e.g. for benchmarks. They have the preamble, header, encoding and number
+format of the real exports, see dkb.py, and the same arguments always give
+the same file
+"""
+from __future__ import absolute_import
+
+import io
+
+import numpy as np
+import pandas as pd
+
+# header lines of the exports, the columns read by pynance are in
+# SupportedCsvTypes of dkb.py
+CASH_HEADER = [u"Buchungstag", u"Wertstellung", u"Buchungstext",
+               u"Auftraggeber / Beg\u00fcnstigter", u"Verwendungszweck",
+               u"Kontonummer", u"BLZ", u"Betrag (EUR)",
+               u"Gl\u00e4ubiger-ID", u"Mandatsreferenz", u"Kundenreferenz"]
+VISA_HEADER = [u"Umsatz abgerechnet und nicht im Saldo enthalten",
+               u"Wertstellung", u"Belegdatum", u"Beschreibung",
+               u"Betrag (EUR)", u"Urspr\u00fcnglicher Betrag"]
+
+ENCODING = "iso-8859-1"
+
+# average number of transactions per day, if the period is not given
+ROWS_PER_DAY = 4
+# longest default period, dates before 1677 cannot be parsed by pandas
+MAX_DAYS = 100 * 365
+
+# rows generated and written at once
+_CHUNK_SIZE = 100000
+
+# booking text, counterpart, purpose, account, BLZ, creditor id, mean and
+# standard deviation of the amount and relative frequency. {ref} is
+# replaced by a reference number, {month} by the month of the transaction
+_CASH_TEMPLATES = [
+    (u"Lastschrift", u"REWE Markt GmbH", u"REWE SAGT DANKE {ref}",
+     u"DE02120300000000202051", u"BYLADEM1001", u"DE36ZZZ00000156243",
+     -45.0, 30.0, 30),
+    (u"Lastschrift", u"PayPal (Europe) S.a.r.l. et Cie.",
+     u"PP.{ref}.PP . FLIXBUS, Ihr Einkauf bei FLIXBUS",
+     u"DE39500105174461799382", u"DEUTDEFFXXX",
+     u"LU96ZZZ0000000000000000058", -25.0, 15.0, 15),
+    (u"Kartenzahlung", u"B\u00e4ckerei Sch\u00e4fer",
+     u"Kartenzahlung {ref} B\u00e4ckerei", u"DE12500105170648489890",
+     u"INGDDEFFXXX", u"", -6.5, 3.0, 20),
+    (u"Lastschrift", u"HANSEMERKUR SPEZIALE KV. AG",
+     u"Vers.-Nr.{ref}, Helene Musterfrau", u"DE75500105178797957724",
+     u"PBNKDEFFXXX", u"DE73ZZZ00000062190", -10.0, 0.0, 4),
+    (u"Dauerauftrag", u"Hausverwaltung M\u00fcller GbR", u"Miete {month}",
+     u"DE63500105173984825797", u"BYLADEM1001", u"", -850.0, 0.0, 4),
+    (u"Gutschrift", u"Arbeitgeber GmbH", u"Lohn/Gehalt {month}",
+     u"DE89370400440532013000", u"COBADEFFXXX", u"", 2600.0, 150.0, 4),
+    (u"\u00dcberweisung", u"Hans Mustermann",
+     u"R\u00fcckzahlung Auslage {ref}", u"DE27100777770209299700",
+     u"NORSDE51XXX", u"", 40.0, 60.0, 8),
+    (u"Lastschrift", u"Stadtwerke M\u00fcnchen GmbH",
+     u"Abschlag Strom {month} Vertragskonto {ref}",
+     u"DE44500105175407324931", u"SSKMDEMMXXX", u"DE12ZZZ00000024823",
+     -75.0, 10.0, 4),
+]
+
+# description, mean and standard deviation of the amount and relative
+# frequency
+_VISA_TEMPLATES = [
+    (u"REWE Markt GmbH ZW", -60.0, 40.0, 25),
+    (u"FRISCHEM.ABC", -14.0, 6.0, 20),
+    (u"SPORT", -65.0, 0.0, 4),
+    (u"AMAZON.DE AMAZON.DE", -35.0, 30.0, 20),
+    (u"DB Vertrieb GmbH", -55.0, 35.0, 10),
+    (u"Caf\u00e9 Zentral M\u00fcnchen", -8.0, 4.0, 15),
+    (u"Einzahlung", 300.0, 100.0, 6),
+]
+
+# swaps the separators of '1,234.56' to '1.234,56'
+_GERMAN_TABLE = {ord(u","): u".", ord(u"."): u","}
+
+
+def synthetic_cash_frame(rows, seed=0, end_date="2018-12-15", days=None):
+    """
+    The transactions of a synthetic DKB Cash export, the latest first like
+    in the exports
+
+    Parameters
+    ----------
+    rows : int
+        number of transactions
+    seed : int
+        seed of the random numbers, the same seed gives the same
+        transactions
+    end_date : str like '2018-12-15' or numpy.datetime64
+        date of the export and of the latest possible transaction
+    days : int, optional
+        length of the period of the export, defaults to ROWS_PER_DAY
+        transactions per day but at most MAX_DAYS
+
+    Returns
+    -------
+    pandas.DataFrame : with the columns date, booking_text, counterpart,
+        text, account, blz, creditor_id and amount
+    """
+    rng = np.random.RandomState(seed)
+    dates = _random_dates(rng, rows, end_date, days)
+    templates = _choose(rng, _CASH_TEMPLATES, rows)
+    amounts = _random_amounts(rng, _CASH_TEMPLATES, templates)
+    refs = rng.randint(10**6, 10**7, size=rows)
+
+    texts = np.empty(rows, dtype=object)
+    months = _german_dates(dates, with_day=False)
+    for i, template in enumerate(_CASH_TEMPLATES):
+        selected = np.flatnonzero(templates == i)
+        purpose = template[2]
+        texts[selected] = [purpose.format(ref=ref, month=month)
+                           for ref, month in zip(refs[selected],
+                                                 months[selected])]
+
+    columns = list(zip(*_CASH_TEMPLATES))
+    return pd.DataFrame({
+        "date": dates,
+        "booking_text": np.array(columns[0], dtype=object)[templates],
+        "counterpart": np.array(columns[1], dtype=object)[templates],
+        "text": texts,
+        "account": np.array(columns[3], dtype=object)[templates],
+        "blz": np.array(columns[4], dtype=object)[templates],
+        "creditor_id": np.array(columns[5], dtype=object)[templates],
+        "amount": amounts,
+    }, columns=["date", "booking_text", "counterpart", "text", "account",
+                "blz", "creditor_id", "amount"])
+
+
+def synthetic_visa_frame(rows, seed=0, end_date="2019-01-28", days=None):
+    """
+    The transactions of a synthetic DKB Visa export, the latest first like
+    in the exports
+
+    Parameters
+    ----------
+    rows, seed, end_date, days :
+        see :func:`synthetic_cash_frame`
+
+    Returns
+    -------
+    pandas.DataFrame : with the columns date, receipt_date, text, amount
+        and settled
+    """
+    rng = np.random.RandomState(seed)
+    dates = _random_dates(rng, rows, end_date, days)
+    templates = _choose(rng, _VISA_TEMPLATES, rows)
+    amounts = _random_amounts(rng, _VISA_TEMPLATES, templates)
+    # receipts are booked up to three days later
+    receipt_dates = dates - rng.randint(0, 4, size=rows) \
+        .astype("timedelta64[D]")
+
+    return pd.DataFrame({
+        "date": dates,
+        "receipt_date": receipt_dates,
+        "text": np.array([t[0] for t in _VISA_TEMPLATES],
+                         dtype=object)[templates],
+        "amount": amounts,
+        "settled": rng.rand(rows) < 0.95,
+    }, columns=["date", "receipt_date", "text", "amount", "settled"])
+
+
+def write_dkb_cash(path_or_buffer, rows, seed=0, end_date="2018-12-15",
+                   days=None, opening_balance=1000.0, account=None):
+    """
+    Writes a synthetic DKB Cash export, which is read by pynance like a
+    real one, see SupportedCsvTypes.DKBCash
+
+    Parameters
+    ----------
+    path_or_buffer : str or binary file object
+    rows, seed, end_date, days :
+        see :func:`synthetic_cash_frame`
+    opening_balance : float
+        balance before the first transaction, the balance of the preamble
+        is the opening balance plus all amounts
+    account : str, optional
+        IBAN of the account, a random one by default
+
+    Returns
+    -------
+    pandas.DataFrame : the written transactions
+    """
+    df = synthetic_cash_frame(rows, seed=seed, end_date=end_date, days=days)
+    if account is None:
+        account = _random_iban(seed)
+    end = pd.Timestamp(end_date)
+    start = df["date"].min() if rows else end
+
+    preamble = [
+        [u"Kontonummer:", u"%s / Girokonto" % account],
+        None,
+        [u"Von:", _german_date(start)],
+        [u"Bis:", _german_date(end)],
+        [u"Kontostand vom %s:" % _german_date(end),
+         u"%s EUR" % _german_number(_final_balance(opening_balance, df))],
+        None,
+        CASH_HEADER,
+    ]
+
+    line = _line_format(len(CASH_HEADER))
+
+    def lines(part):
+        dates = _german_dates(part["date"])
+        return [line % (date, date, booking_text, counterpart, text,
+                        account_nr, blz, amount, creditor_id, u"", u"")
+                for date, booking_text, counterpart, text, account_nr, blz,
+                creditor_id, amount in zip(
+                    dates, part["booking_text"].values,
+                    part["counterpart"].values, part["text"].values,
+                    part["account"].values, part["blz"].values,
+                    part["creditor_id"].values,
+                    _german_numbers(part["amount"]))]
+
+    _write(path_or_buffer, preamble, df, lines)
+    return df
+
+
+def write_dkb_visa(path_or_buffer, rows, seed=0, end_date="2019-01-28",
+                   days=None, opening_balance=0.0, card=None):
+    """
+    Writes a synthetic DKB Visa export, which is read by pynance like a
+    real one, see SupportedCsvTypes.DKBVisa
+
+    Parameters
+    ----------
+    path_or_buffer : str or binary file object
+    rows, seed, end_date, days :
+        see :func:`synthetic_cash_frame`
+    opening_balance : float
+        balance before the first transaction, the Saldo of the preamble is
+        the opening balance plus all amounts
+    card : str, optional
+        masked number of the card, like 3546********6546, a random one by
+        default
+
+    Returns
+    -------
+    pandas.DataFrame : the written transactions
+    """
+    df = synthetic_visa_frame(rows, seed=seed, end_date=end_date, days=days)
+    if card is None:
+        digits = _random_digits(seed, 8)
+        card = u"%s********%s" % (digits[:4], digits[4:])
+
+    preamble = [
+        [u"Kreditkarte:", card],
+        None,
+        [u"Zeitraum:", u"letzten %d Tage" % (days or _default_days(rows))],
+        # unlike the amounts, the Saldo has a decimal point
+        [u"Saldo:", u"%.2f EUR" % _final_balance(opening_balance, df)],
+        [u"Datum:", _german_date(pd.Timestamp(end_date))],
+        None,
+        VISA_HEADER,
+    ]
+
+    line = _line_format(len(VISA_HEADER))
+
+    def lines(part):
+        return [line % (u"Ja" if settled else u"Nein", date, receipt_date,
+                        text, amount, u"")
+                for settled, date, receipt_date, text, amount in zip(
+                    part["settled"].values, _german_dates(part["date"]),
+                    _german_dates(part["receipt_date"]),
+                    part["text"].values, _german_numbers(part["amount"]))]
+
+    _write(path_or_buffer, preamble, df, lines)
+    return df
+
+
+def dkb_cash_export(rows, **kwargs):
+    """the bytes of a synthetic DKB Cash export, see write_dkb_cash"""
+    buffer = io.BytesIO()
+    write_dkb_cash(buffer, rows, **kwargs)
+    return buffer.getvalue()
+
+
+def dkb_visa_export(rows, **kwargs):
+    """the bytes of a synthetic DKB Visa export, see write_dkb_visa"""
+    buffer = io.BytesIO()
+    write_dkb_visa(buffer, rows, **kwargs)
+    return buffer.getvalue()
+
+
+def _default_days(rows):
+    return max(1, min(rows // ROWS_PER_DAY, MAX_DAYS))
+
+
+def _random_dates(rng, rows, end_date, days):
+    """random dates of a period that ends at end_date, the latest first"""
+    if days is None:
+        days = _default_days(rows)
+    offsets = np.sort(rng.randint(0, days, size=rows))
+    return np.datetime64(pd.Timestamp(end_date).date(), "D") - offsets
+
+
+def _choose(rng, templates, rows):
+    """random positions of templates, by their relative frequencies"""
+    weights = np.array([template[-1] for template in templates], dtype=float)
+    return rng.choice(len(templates), size=rows, p=weights / weights.sum())
+
+
+def _random_amounts(rng, templates, chosen):
+    """random amounts in the direction of the mean of their templates"""
+    means = np.array([template[-3] for template in templates])[chosen]
+    sds = np.array([template[-2] for template in templates])[chosen]
+    amounts = np.abs(means + sds * rng.standard_normal(len(chosen)))
+    # whole cents, at least one
+    cents = np.maximum(np.round(amounts * 100), 1)
+    return np.sign(means) * cents / 100
+
+
+def _final_balance(opening_balance, df):
+    return round(opening_balance + df["amount"].sum(), 2)
+
+
+def _random_digits(seed, n):
+    """digits that depend on seed, but not on the random transactions"""
+    rng = np.random.RandomState(seed + 1)
+    return u"".join(u"%d" % digit for digit in rng.randint(0, 10, size=n))
+
+
+def _random_iban(seed):
+    return u"DE%s" % _random_digits(seed, 20)
+
+
+def _german_date(timestamp):
+    return u"%s" % pd.Timestamp(timestamp).strftime("%d.%m.%Y")
+
+
+def _german_dates(dates, with_day=True):
+    """dates like 24.12.2018, or like 12.2018 without the day"""
+    # there are far less days than transactions, and formatting them with
+    # % is much faster than strftime
+    codes, days = pd.factorize(pd.DatetimeIndex(dates))
+    if with_day:
+        strings = [u"%02d.%02d.%04d" % date
+                   for date in zip(days.day, days.month, days.year)]
+    else:
+        strings = [u"%02d.%04d" % date for date in zip(days.month, days.year)]
+    return np.array(strings + [u""], dtype=object)[codes]
+
+
+def _german_number(number):
+    return u"{:,.2f}".format(number).translate(_GERMAN_TABLE)
+
+
+def _german_numbers(numbers):
+    return [_german_number(number) for number in numbers]
+
+
+def _line_format(n_values):
+    """a line like in the exports, every value quoted and followed by ;"""
+    return u'"%s";' * n_values + u"\n"
+
+
+def _csv_line(values):
+    return _line_format(len(values)) % tuple(values)
+
+
+def _write(path_or_buffer, preamble, df, lines):
+    """writes the preamble and the lines of df in chunks"""
+    if not hasattr(path_or_buffer, "write"):
+        with open(path_or_buffer, "wb") as f:
+            return _write(f, preamble, df, lines)
+
+    head = [u"\n" if line is None else _csv_line(line) for line in preamble]
+    path_or_buffer.write(u"".join(head).encode(ENCODING))
+    for start in range(0, len(df), _CHUNK_SIZE):
+        part = df.iloc[start:start + _CHUNK_SIZE]
+        path_or_buffer.write(u"".join(lines(part)).encode(ENCODING))
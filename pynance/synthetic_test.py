@@ -0,0 +1,89 @@
+from __future__ import absolute_import
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from numpy.testing import assert_array_equal, assert_array_almost_equal
+
+from .dkb import SupportedCsvTypes
+from .synthetic import dkb_cash_export, dkb_visa_export, write_dkb_cash, \
+    synthetic_cash_frame, ENCODING
+from .textimporter import read_csv_with_preamble, csv_types
+
+
+class SyntheticTestCase(unittest.TestCase):
+    def test_deterministic(self):
+        self.assertEqual(dkb_cash_export(100, seed=1),
+                         dkb_cash_export(100, seed=1))
+        self.assertNotEqual(dkb_cash_export(100, seed=1),
+                            dkb_cash_export(100, seed=2))
+        self.assertEqual(dkb_visa_export(100, seed=1),
+                         dkb_visa_export(100, seed=1))
+
+    def test_cash_export(self):
+        content = dkb_cash_export(1000, opening_balance=1234567.5)
+        self.assertIn(u"Auftraggeber / Beg\u00fcnstigter".encode(ENCODING),
+                      content)
+
+        df, preamble = read_csv_with_preamble(io.BytesIO(content),
+                                              SupportedCsvTypes.DKBCash)
+        written = synthetic_cash_frame(1000)
+
+        self.assertEqual(1000, len(df))
+        assert_array_equal(written["date"].values, df["date"].values)
+        assert_array_equal(written["amount"].values, df["amount"].values)
+        assert_array_equal(written["text"].values, df["text"].values)
+        self.assertAlmostEqual(1234567.5 + written["amount"].sum(),
+                               preamble.total_balance)
+        # the balance before the oldest transaction is the opening balance
+        self.assertAlmostEqual(1234567.5, df["total_balance"].values[-1]
+                               - df["amount"].values[-1])
+        self.assertEqual(written["date"].min(), preamble.period_start)
+        self.assertEqual(np.datetime64("2018-12-15"), preamble.period_end)
+
+    def test_visa_export(self):
+        content = dkb_visa_export(500, opening_balance=-100.0,
+                                  card="1234********5678")
+
+        df, preamble = read_csv_with_preamble(io.BytesIO(content),
+                                              SupportedCsvTypes.DKBVisa)
+
+        self.assertEqual(500, len(df))
+        self.assertEqual("1234********5678", preamble.account)
+        assert_array_almost_equal(
+            -100.0 + np.cumsum(df["amount"].values[::-1])[::-1],
+            df["total_balance"].values)
+
+    def test_detect(self):
+        self.assertIs(SupportedCsvTypes.DKBCash,
+                      csv_types.detect(io.BytesIO(dkb_cash_export(10))))
+        self.assertIs(SupportedCsvTypes.DKBVisa,
+                      csv_types.detect(io.BytesIO(dkb_visa_export(10))))
+
+    def test_periods(self):
+        df = synthetic_cash_frame(1000, end_date="2019-03-31", days=10)
+        self.assertEqual(np.datetime64("2019-03-22"), df["date"].min())
+        self.assertEqual(np.datetime64("2019-03-31"), df["date"].max())
+        # the latest transactions first, like in the exports
+        self.assertTrue((np.diff(df["date"].values.astype(int)) <= 0).all())
+
+        self.assertEqual(0, len(synthetic_cash_frame(0)))
+
+    def test_write_file(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "cash.csv")
+            write_dkb_cash(path, 50, seed=3)
+            with open(path, "rb") as f:
+                self.assertEqual(dkb_cash_export(50, seed=3), f.read())
+        finally:
+            shutil.rmtree(directory)
+
+
+def test_suite():
+    suite = unittest.makeSuite(SyntheticTestCase)
+    return suite
@@ -1,13 +1,29 @@
 import re
+import io
+import csv
 import codecs
+import hashlib
+import multiprocessing
+import timeit
+from collections import OrderedDict
 
 import pandas as pd
 import numpy as np
 
-from .definitions import COLUMNS
+from .definitions import COLUMNS, PREAMBLE_FIELDS
+from .compact import compact as compact_df
 
+# part of the fingerprint of each CsvFileDescription, so that results that
+# are cached by fingerprint are read again. Must be increased whenever the
+# parsing or the formatters change the result for the same file
+PARSER_VERSION = 2
 
-def read_csv(filepath_or_buffer, description):
+
+def read_csv(filepath_or_buffer,
+             description,
+             compact=False,
+             cache=None,
+             report=None):
     """
     Reads the text in a csv file or buffer and converts it into a
     DataFrame as specified by a CsvFileDescription
@@ -16,9 +32,18 @@ def read_csv(filepath_or_buffer, description):
     ----------
     filepath_or_buffer : str, pathlib.Path, py._path.local.LocalPath or
         any object with a read() method.
-        Passed to pandas.read_csv
+        The input is read exactly once, from the current position of a
+        buffer, so non-seekable streams work as well
     description : CsvFileDescription, a description of how the CSV file is to
         be read and transformed
+    compact : bool
+        convert the result with :func:`~compact.compact` to save memory
+    cache : cache.ParseCache, optional
+        returns the cached result if the same content was read with the
+        same description before
+    report : ImportReport, optional
+        filled with the time, rows and bytes of each stage of the import,
+        unless the result comes from the cache
 
     Returns
     -------
@@ -30,21 +55,390 @@ def read_csv(filepath_or_buffer, description):
     ------
     UnsupportedCsvFormatException
         if the file does not contain the required header columnsd
+
+    Notes
+    -----
+    read_csv can be called from several threads at the same time, also
+    with the same description, as long as each thread reads its own
+    buffer. Neither the buffer nor the description are changed.
+    """
+    if cache is not None:
+        return cache.read_csv(filepath_or_buffer, description,
+                              compact=compact)
+
+    df, _ = read_csv_with_preamble(filepath_or_buffer, description,
+                                   compact=compact, report=report)
+    return df
+
+
+def read_csv_with_preamble(filepath_or_buffer,
+                           description,
+                           compact=False,
+                           report=None):
+    """
+    Like :func:`read_csv`, but also returns the metadata found in the
+    preamble, i.e. the lines before the header of the csv file
+
+    The input is read and decoded once. Only the first
+    `description.skiprows` lines are scanned for the preamble, the rest is
+    handed to the csv parser without being copied.
+
+    Parameters
+    ----------
+    filepath_or_buffer : str, pathlib.Path, py._path.local.LocalPath or
+        any object with a read() method
+    description : CsvFileDescription, a description of how the CSV file is to
+        be read and transformed
+    compact : bool
+        convert the result with :func:`~compact.compact` to save memory
+    report : ImportReport, optional
+        filled with the time, rows and bytes of each stage of the import
+
+    Returns
+    -------
+    tuple(pandas.DataFrame, Preamble) : the data as returned by
+        :func:`read_csv` and the metadata of the preamble
+
+    Raises
+    ------
+    UnsupportedCsvFormatException
+        if the file does not contain the required header columns or the
+        total balance is missing in the preamble
+    """
+    report = _active_report(report)
+
+    start = report.now()
+    preamble_lines, body = _split_preamble(filepath_or_buffer, description)
+    report.record("read", start,
+                  n_bytes=_buffer_bytes(body, description.encoding, report))
+
+    start = report.now()
+    preamble = description.parse_preamble(preamble_lines)
+    report.record("preamble", start)
+
+    new_df = _read_body(body, description, preamble, compact, report)
+    report.finish(new_df)
+    return new_df, preamble
+
+
+def read_csv_with_report(filepath_or_buffer, description, compact=False):
+    """
+    Like :func:`read_csv_with_preamble`, but also returns an ImportReport
+    of the import
+
+    Returns
+    -------
+    tuple(pandas.DataFrame, Preamble, ImportReport)
     """
-    columns_to_read = description.column_map.values()
+    report = ImportReport()
+    df, preamble = read_csv_with_preamble(filepath_or_buffer, description,
+                                          compact=compact, report=report)
+    return df, preamble, report
+
 
+def _read_body(body, description, preamble, compact, report):
+    """
+    parses and formats the rows of a csv file, after its preamble, and
+    records the stages in report
+    """
     # read the dataframe as it is, with only strings
     # formatting is done later
+    start = report.now()
     try:
-        df_as_is = pd.read_csv(filepath_or_buffer=filepath_or_buffer,
-                               dialect=description.csv_dialect,
-                               skiprows=description.skiprows,
-                               encoding=description.encoding,
-                               usecols=columns_to_read,
-                               dtype=str)
+        df_as_is = pd.read_csv(filepath_or_buffer=body,
+                               **description.parser_options())
     except ValueError as e:
         raise UnsupportedCsvFormatException(str(e))
+    report.record("parse", start, rows=len(df_as_is), frame=df_as_is)
+
+    start = report.now()
+    new_df = _format_columns(df_as_is, description)
+    report.record("format", start, rows=len(new_df), frame=new_df)
+
+    start = report.now()
+    amounts = new_df['amount'].values
+    new_df['total_balance'] = amounts_to_balances(amounts,
+                                                  preamble.total_balance)
+    report.record("balances", start, rows=len(new_df))
+
+    if compact:
+        start = report.now()
+        new_df = compact_df(new_df)
+        report.record("compact", start, rows=len(new_df), frame=new_df)
+
+    return new_df
+
+
+def read_csv_chunks(filepath_or_buffer, description, chunksize,
+                    nan_policy="omit"):
+    """
+    Reads a csv file or buffer in chunks of rows, each converted into a
+    DataFrame as specified by a CsvFileDescription
+
+    Only the current chunk is held in memory. The total balance in the
+    preamble is known before any row is read, so the balances of each chunk
+    are carried forward from the previous one.
+
+    Parameters
+    ----------
+    filepath_or_buffer : str, pathlib.Path, py._path.local.LocalPath or
+        any object with a read() and a readline() method
+    description : CsvFileDescription, a description of how the CSV file is to
+        be read and transformed
+    chunksize : int
+        maximum number of rows per chunk
+    nan_policy : str
+        how missing amounts are handled, see :func:`amounts_to_balances`.
+        With "omit", the balances are the same as those of :func:`read_csv`
+
+    Yields
+    ------
+    pandas.DataFrame : consecutive parts of the data as returned by
+        :func:`read_csv`, including the `total_balance` column
+
+    Raises
+    ------
+    UnsupportedCsvFormatException
+        if the file does not contain the required header columns or the
+        total balance is missing in the preamble
+    """
+    if hasattr(filepath_or_buffer, 'read'):
+        for chunk in _read_chunks(filepath_or_buffer, description, chunksize,
+                                  nan_policy):
+            yield chunk
+    else:
+        with open(str(filepath_or_buffer), 'rb') as buffer:
+            for chunk in _read_chunks(buffer, description, chunksize,
+                                      nan_policy):
+                yield chunk
+
+
+def read_csv_stream(stream, description, compact=False, report=None):
+    """
+    Like :func:`read_csv_with_preamble`, but reads from a stream that can
+    only be read once, like an upload that is still being received
+
+    The preamble is read line by line, the rest of the stream is handed to
+    the csv parser as it is. Unlike :func:`read_csv_with_preamble`, the
+    content is never held in memory as a whole, only the resulting
+    DataFrame is.
+
+    Parameters
+    ----------
+    stream : a binary or text file object, or any object with a read()
+        method that returns bytes
+    description : CsvFileDescription, a description of how the CSV file is to
+        be read and transformed
+    compact : bool
+        convert the result with :func:`~compact.compact` to save memory
+    report : ImportReport, optional
+        filled with the time and rows of each stage of the import. The
+        bytes of a stream are not known, reading them is part of the
+        parse stage
+
+    Returns
+    -------
+    tuple(pandas.DataFrame, Preamble) : the data as returned by
+        :func:`read_csv` and the metadata of the preamble
+
+    Raises
+    ------
+    UnsupportedCsvFormatException
+        if the file does not contain the required header columns or the
+        total balance is missing in the preamble
+    """
+    report = _active_report(report)
+
+    if not isinstance(stream, io.IOBase):
+        # the csv parser needs a file object
+        stream = io.BufferedReader(_PrefixedStream(b'', stream))
+
+    start = report.now()
+    preamble = _read_preamble(stream, description)
+    report.record("preamble", start)
+
+    new_df = _read_body(stream, description, preamble, compact, report)
+    report.finish(new_df)
+    return new_df, preamble
+
+
+def _read_preamble(buffer, description):
+    """reads and parses the preamble lines of a buffer, line by line"""
+    preamble_lines = [buffer.readline() for _ in range(description.skiprows)]
+    preamble_lines = [line.decode(description.encoding)
+                      if isinstance(line, bytes) else line
+                      for line in preamble_lines]
+    return description.parse_preamble(preamble_lines)
+
+
+def _read_chunks(buffer, description, chunksize, nan_policy):
+    preamble = _read_preamble(buffer, description)
+
+    try:
+        reader = pd.read_csv(filepath_or_buffer=buffer,
+                             chunksize=chunksize,
+                             **description.parser_options())
+    except ValueError as e:
+        raise UnsupportedCsvFormatException(str(e))
+
+    # balance after the latest transaction of the next chunk
+    balance = preamble.total_balance
+
+    while True:
+        try:
+            df_as_is = next(reader)
+        except StopIteration:
+            return
+        except ValueError as e:
+            raise UnsupportedCsvFormatException(str(e))
+
+        new_df = _format_columns(df_as_is, description)
 
+        amounts = new_df['amount'].values
+        new_df['total_balance'] = amounts_to_balances(
+            amounts, balance, nan_policy=nan_policy)
+
+        if len(amounts) > 0:
+            # undo all transactions of this chunk, with missing amounts
+            # handled like within the chunk
+            balance -= extend_balances(amounts, 0.0,
+                                       nan_policy=nan_policy)[0]
+
+        yield new_df
+
+
+def read_many(paths, description, workers=None, compact=False):
+    """
+    Reads many csv files in parallel and concatenates them into one DataFrame
+
+    The files are parsed in a pool of worker processes. Files that cannot be
+    read are reported, but do not stop the other files from being read.
+
+    Parameters
+    ----------
+    paths : list of str, pathlib.Path or py._path.local.LocalPath
+        the files to read
+    description : CsvFileDescription or function: path -> CsvFileDescription
+        a description that fits all files, or a function that picks the
+        description for each file, like a CsvTypeRegistry. Both must be
+        picklable.
+    workers : int, optional
+        number of worker processes, defaults to the number of CPUs.
+        With 1 worker, the files are read in the calling process
+    compact : bool
+        convert the result with :func:`~compact.compact` to save memory
+
+    Returns
+    -------
+    tuple(pandas.DataFrame, list of tuple(path, Exception)) :
+        the data of all files in the order of `paths`, with the `origin`
+        column set to the account found in the preamble of each file or
+        to its path if there is none, and the files that could not be read
+        together with the error that occured
+    """
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+
+    tasks = [(path, description) for path in paths]
+
+    if workers == 1 or len(tasks) < 2:
+        results = [_read_one(task) for task in tasks]
+    else:
+        pool = multiprocessing.Pool(min(workers, len(tasks)))
+        try:
+            # map keeps the order of the paths
+            results = pool.map(_read_one, tasks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+    frames = []
+    failures = []
+    for path, (df, error) in zip(paths, results):
+        if error is None:
+            frames.append(df)
+        else:
+            failures.append((path, error))
+
+    if frames:
+        all_df = pd.concat(frames, ignore_index=True)
+    else:
+        all_df = pd.DataFrame(columns=list(COLUMNS))
+
+    if compact:
+        # categories are only shared once all files are concatenated
+        all_df = compact_df(all_df)
+
+    return all_df, failures
+
+
+def _read_one(task):
+    """reads a single file for read_many, errors are returned, not raised"""
+    path, description = task
+
+    try:
+        if not isinstance(description, CsvFileDescription):
+            description = description(path)
+        df, preamble = read_csv_with_preamble(path, description)
+    except (IOError, ValueError) as e:
+        # UnsupportedCsvFormatException is an IOError as well. Decoding
+        # errors, pandas.errors.ParserError and errors of the formatters
+        # are ValueErrors
+        return None, e
+
+    if preamble.account is not None:
+        df['origin'] = preamble.account
+    else:
+        df['origin'] = str(path)
+
+    return df, None
+
+
+def _split_preamble(filepath_or_buffer, description):
+    """
+    Reads filepath_or_buffer once and splits it into the decoded preamble
+    lines and a buffer positioned at the header line
+
+    Raw bytes are not decoded here but wrapped as they are, so that the
+    csv parser decodes the body once. Only the few preamble lines are
+    decoded separately. Lines are split at b'\\n', so the encoding must be
+    ASCII compatible.
+    """
+    if hasattr(filepath_or_buffer, 'read'):
+        content = filepath_or_buffer.read()
+    else:
+        with open(str(filepath_or_buffer), 'rb') as f:
+            content = f.read()
+
+    if isinstance(content, bytes):
+        newline = b'\n'
+        body = io.BytesIO(content)
+    else:
+        newline = u'\n'
+        body = io.StringIO(content)
+
+    # find the start of the header line, the preamble is before it
+    body_start = 0
+    for _ in range(description.skiprows):
+        line_end = content.find(newline, body_start)
+        if line_end < 0:
+            body_start = len(content)
+            break
+        body_start = line_end + 1
+
+    preamble = content[:body_start]
+    if isinstance(preamble, bytes):
+        preamble = preamble.decode(description.encoding)
+
+    body.seek(body_start)
+    return preamble.splitlines(), body
+
+
+def _format_columns(df_as_is, description):
+    """
+    Converts the string columns of a freshly read csv file into a
+    DataFrame with the columns and types defined in COLUMNS
+    """
     # construct a new DataFrame that matches the definitions
     new_df = pd.DataFrame()
 
@@ -54,12 +448,20 @@ def read_csv(filepath_or_buffer, description):
         if new_col_name in description.column_map.keys():
             old_col_name = description.column_map[new_col_name]
 
-            # get the formatter for the required type
+            # prefer a formatter that converts the whole column at once,
+            # fall back to converting the column cell by cell
+            column_formatter = description.column_formatters.get(new_type)
             formatter = description.formatters[new_type]
 
             try:
                 # apply the formatter
-                new_col = df_as_is[old_col_name].apply(formatter)
+                if df_as_is[old_col_name].dtype != object:
+                    # converted by the csv parser already
+                    new_col = df_as_is[old_col_name]
+                elif column_formatter is not None:
+                    new_col = column_formatter(df_as_is[old_col_name])
+                else:
+                    new_col = df_as_is[old_col_name].apply(formatter)
             except:
                 raise UnsupportedCsvFormatException("Could not convert content of \
                                                      column %s to %s"
@@ -74,39 +476,158 @@ def read_csv(filepath_or_buffer, description):
             empty_series = pd.Series(dtype=new_type)
             new_df[new_col_name] = empty_series
 
-    # read the total balance with the parser as
-    # provided by `description`
-    final_total_balance = description.read_total_balance(filepath_or_buffer)
-
-    amounts = new_df['amount'].values
-    new_df['total_balance'] = amounts_to_balances(amounts,
-                                                  final_total_balance)
-
     return new_df
 
 
-def amounts_to_balances(amounts, final_balance):
+def amounts_to_balances(amounts,
+                        final_balance,
+                        groups=None,
+                        out=None,
+                        nan_policy="omit"):
     """
     Gives a list of balances after each transaction
     Calculated backwards, starting with the given final balance
 
+    The balances of many accounts are calculated in one pass, if the
+    account of each transaction is given in `groups`.
+
     PARAMS:
     -------
     amounts : iterable of float
         amount transferred for each transaction. It must be ordered,
         such that the latest performed transaction is *first* in the
-        list
-    final_balance : float
-        total value of the balance after the last transaction
+        list, or the first of its group
+    final_balance : float, or dict-like if groups are given
+        total value of the balance after the last transaction, or the
+        balance of each group after its last transaction
+    groups : iterable, optional
+        the account of each transaction, e.g. the origin column
+    out : numpy.ndarray of float, optional
+        array of the length of amounts the balances are written to, it
+        must not be amounts itself
+    nan_policy : str
+        how missing amounts are handled, like empty cells given by
+        DKBFormatters.to_float64:
+        "omit" counts them as 0, "propagate" makes the balances that
+        depend on them NaN and "raise" raises a ValueError
 
     RETURNS:
     --------
-    list of float
-        values of the total balance after each transaction
+    numpy.ndarray of float
+        values of the total balance after each transaction, `out` if it
+        is given
     """
+    amounts, missing = _checked_amounts(amounts, nan_policy)
+    n = len(amounts)
+    if out is None:
+        out = np.empty(n, dtype=float)
+    if n == 0:
+        return out
 
-    accumulated = np.cumsum(np.array(amounts[::-1], dtype=float))[::-1]
-    return accumulated - accumulated[0] + final_balance
+    if groups is None:
+        # sum of the amounts of the later transactions
+        out[0] = 0.0
+        np.cumsum(amounts[:-1], out=out[1:])
+        np.subtract(final_balance, out, out=out)
+        if missing is not None:
+            out[np.r_[False, np.cumsum(missing[:-1]) > 0]] = np.nan
+        return out
+
+    if not isinstance(groups, pd.Series):
+        groups = np.asarray(groups, dtype=object)
+    codes, keys = pd.factorize(groups)
+    if np.any(codes < 0):
+        raise ValueError("groups must not be missing")
+    if len(keys) <= np.iinfo(np.int16).max:
+        # numpy sorts small integers stably by radix sort
+        codes = codes.astype(np.int16)
+
+    # the groups one after the other, a stable sort keeps the order of
+    # the transactions within a group
+    order = np.argsort(codes, kind="mergesort")
+    sorted_codes = codes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    counts = np.diff(np.r_[starts, n])
+
+    later = _exclusive_cumsum(amounts[order], starts, counts)
+    finals = np.array([final_balance[key] for key in keys], dtype=float)
+    out[order] = finals[sorted_codes] - later
+    if missing is not None:
+        later_missing = _exclusive_cumsum(missing[order].astype(np.int64),
+                                          starts, counts)
+        out[order[later_missing > 0]] = np.nan
+    return out
+
+
+def extend_balances(amounts, previous_balance, out=None, nan_policy="omit"):
+    """
+    Gives the balances after transactions that were performed after the
+    ones of an existing chain of balances, e.g. those of a later export
+
+    Only the new amounts are summed up, the balances of the existing
+    transactions do not change.
+
+    PARAMS:
+    -------
+    amounts : iterable of float
+        amount transferred for each new transaction, the latest performed
+        transaction first
+    previous_balance : float
+        balance after the latest transaction of the existing chain, i.e.
+        its final balance
+    out : numpy.ndarray of float, optional
+        see amounts_to_balances
+    nan_policy : str
+        see amounts_to_balances
+
+    RETURNS:
+    --------
+    numpy.ndarray of float
+        values of the total balance after each new transaction
+    """
+    amounts, missing = _checked_amounts(amounts, nan_policy)
+    if out is None:
+        out = np.empty(len(amounts), dtype=float)
+
+    # the oldest transaction is the last one, so the balances are summed
+    # up from the end
+    np.cumsum(amounts[::-1], out=out[::-1])
+    out += previous_balance
+    if missing is not None:
+        out[np.cumsum(missing[::-1])[::-1] > 0] = np.nan
+    return out
+
+
+def _checked_amounts(amounts, nan_policy):
+    """
+    the amounts as float array, with missing amounts as 0 unless they
+    propagate, and where they are missing if they do
+    """
+    if nan_policy not in ("omit", "propagate", "raise"):
+        raise ValueError("Unknown nan_policy: %r" % nan_policy)
+
+    amounts = np.asarray(amounts, dtype=float)
+    missing = np.isnan(amounts)
+    if not missing.any():
+        return amounts, None
+    if nan_policy == "raise":
+        raise ValueError("amounts contain NaN")
+
+    amounts = np.where(missing, 0.0, amounts)
+    if nan_policy == "omit":
+        return amounts, None
+    return amounts, missing
+
+
+def _exclusive_cumsum(values, starts, counts):
+    """
+    the sum of the preceding values within each group of consecutive
+    values, given by the start and length of each group
+    """
+    sums = np.cumsum(values)
+    sums -= values
+    sums -= np.repeat(sums[starts], counts)
+    return sums
 
 
 class CsvFileDescription():
@@ -117,7 +638,11 @@ class CsvFileDescription():
                  skiprows,
                  encoding,
                  total_balance_re_pattern,
-                 total_balance_formatter):
+                 total_balance_formatter,
+                 column_formatters=None,
+                 preamble_re_patterns=None,
+                 decimal=None,
+                 thousands=None):
         """
         A description of a specific CSV file design.
         Typically a definition for a specific bank transaction CSV file
@@ -140,19 +665,210 @@ class CsvFileDescription():
         total_balance_formatter : function : string -> float
             a function that is applied to the string matched by
             total_balance_re_pattern and return the number
+        column_formatters : dict(type T, func: pandas.Series of strings ->
+            pandas.Series of T), optional
+            maps the required types to functions that convert a whole column
+            at once. Types without an entry here are converted cell by cell
+            with the function given in `formatters`
+        preamble_re_patterns : dict(str, string), optional
+            maps the names of PREAMBLE_FIELDS to regex expressions that match
+            their value in the preamble. The matches are converted with the
+            formatter for the type given in PREAMBLE_FIELDS
+        decimal : string, optional
+            decimal point of the numbers in the csv file, e.g. ','. If it
+            is given, the np.float64 columns are converted by the csv
+            parser instead of the formatters, which is faster and does not
+            hold the GIL, so that files can be read in parallel threads
+        thousands : string, optional
+            thousands separator of the numbers, e.g. '.', used together
+            with decimal
+
+        The dicts are copied, so that changing them later does not change
+        a description that is shared by concurrent imports.
         """
 
         # check that for every type in COLUMN, there is a formatter
         for col_type in COLUMNS.values():
             assert col_type in formatters.keys()
 
-        self.column_map = column_map
+        self.column_map = dict(column_map)
         self.csv_dialect = csv_dialect
-        self.formatters = formatters
+        self.formatters = dict(formatters)
         self.skiprows = skiprows
         self.encoding = encoding
         self.total_balance_re_pattern = total_balance_re_pattern
         self.total_balance_formatter = total_balance_formatter
+        self.column_formatters = dict(column_formatters or {})
+        self.preamble_re_patterns = dict(preamble_re_patterns or {})
+        self.decimal = decimal
+        self.thousands = thousands
+
+        # the preamble is parsed for every import, so compile once
+        self._total_balance_re = re.compile(total_balance_re_pattern)
+        self._preamble_res = dict(
+            (field, re.compile(pattern))
+            for field, pattern in self.preamble_re_patterns.items())
+
+    def parser_options(self):
+        """
+        The keyword arguments of pandas.read_csv that read the columns of
+        column_map, as strings unless the csv parser converts them, see
+        decimal
+
+        RETURNS:
+        --------
+        dict : a new dict for each call
+        """
+        options = {"dialect": self.csv_dialect,
+                   "encoding": self.encoding,
+                   "usecols": list(self.column_map.values()),
+                   "dtype": str}
+
+        if self.decimal is not None:
+            options["dtype"] = dict(
+                (old_col_name,
+                 np.float64 if COLUMNS[new_col_name] is np.float64 else str)
+                for new_col_name, old_col_name in self.column_map.items())
+            options["decimal"] = self.decimal
+            options["thousands"] = self.thousands
+            # rounds like float(), unlike the default
+            options["float_precision"] = "high"
+
+        return options
+
+    def parse_preamble(self, lines):
+        """
+        Searches the lines of a preamble for the total balance and the
+        fields given in preamble_re_patterns
+
+        PARAMS:
+        -------
+        lines : iterable of str
+            the decoded lines before the header of the csv file
+
+        RETURNS:
+        --------
+        Preamble :
+            the formatted metadata, fields that were not found are None
+
+        RAISES:
+        -------
+        UnsupportedCsvFormat :
+            if the total_balance was not found in the given lines
+        """
+        total_balance = None
+        fields = {}
+
+        for line in lines:
+            if total_balance is None:
+                match = self._total_balance_re.search(line)
+                if match:
+                    total_balance = self.total_balance_formatter(
+                        match.group(0))
+
+            for field, field_re in self._preamble_res.items():
+                if field in fields:
+                    continue
+                match = field_re.search(line)
+                if match:
+                    formatter = self.formatters[PREAMBLE_FIELDS[field]]
+                    fields[field] = formatter(match.group(0))
+
+        if total_balance is None:
+            raise UnsupportedCsvFormatException(
+                'Total balance was not found in given file or stream.')
+
+        return Preamble(total_balance=total_balance, **fields)
+
+    def fingerprint(self):
+        """
+        A hash of everything that influences how a file is read with this
+        description. Equal descriptions have equal fingerprints, also in
+        other processes and sessions
+
+        Formatters are hashed with their code, so that two lambdas differ
+        and a changed formatter changes the fingerprint. Changes that the
+        code of a formatter does not show, e.g. in the functions it calls,
+        are covered by PARSER_VERSION
+
+        RETURNS:
+        --------
+        str : hex digest
+        """
+        def name(func):
+            owner = getattr(func, '__self__', None)
+            return "%s.%s.%s %s" % (func.__module__,
+                                    getattr(owner, '__name__', ''),
+                                    func.__name__,
+                                    _code_fingerprint(func))
+
+        def type_name(col_type):
+            return "%s.%s" % (col_type.__module__, col_type.__name__)
+
+        dialect = self.csv_dialect
+        parts = [
+            PARSER_VERSION,
+            sorted(self.column_map.items()),
+            [getattr(dialect, attr, None)
+             for attr in ['delimiter', 'quotechar', 'doublequote',
+                          'escapechar', 'skipinitialspace', 'quoting']],
+            sorted((type_name(t), name(f))
+                   for t, f in self.formatters.items()),
+            sorted((type_name(t), name(f))
+                   for t, f in self.column_formatters.items()),
+            self.skiprows,
+            self.encoding,
+            self.total_balance_re_pattern,
+            name(self.total_balance_formatter),
+            sorted(self.preamble_re_patterns.items()),
+            self.decimal,
+            self.thousands]
+
+        return hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()
+
+    def match_confidence(self, head):
+        """
+        Tells how well the beginning of a file fits this description,
+        without parsing the file
+
+        PARAMS:
+        -------
+        head : bytes or str
+            the first few KB of the file, i.e. at least the preamble and the
+            header line
+
+        RETURNS:
+        --------
+        float :
+            0.0 if the file cannot be read with this description, because a
+            required column or the total balance is missing. Otherwise the
+            share of the header, the total balance and the preamble fields
+            that were found, up to 1.0 if all of them were found
+        """
+        if isinstance(head, bytes):
+            # the head may end in the middle of a multi-byte character
+            head = head.decode(self.encoding, 'replace')
+
+        lines = head.splitlines()
+        if len(lines) <= self.skiprows:
+            return 0.0
+
+        header = next(csv.reader([lines[self.skiprows]], self.csv_dialect))
+        if not all(col in header for col in self.column_map.values()):
+            return 0.0
+
+        preamble_lines = lines[:self.skiprows]
+
+        def found(regex):
+            return any(regex.search(line) for line in preamble_lines)
+
+        if not found(self._total_balance_re):
+            return 0.0
+
+        # header and total balance count as found
+        n_found = 2 + sum(found(field_re)
+                          for field_re in self._preamble_res.values())
+        return n_found / float(2 + len(self._preamble_res))
 
     def read_total_balance(self, filepath_or_buffer):
         """
@@ -162,7 +878,8 @@ class CsvFileDescription():
         PARAMS:
         -------
         filepath_or_buffer : str, pathlib.Path, py._path.local.LocalPath or
-            any object with a readlines() method
+            any object with readline(), tell() and seek() methods. Only the
+            preamble is read, the position of a buffer is restored
 
         RETURNS:
         --------
@@ -178,26 +895,400 @@ class CsvFileDescription():
 
         """
 
-        def read_from_buffer(buffer):
-
-            for line in buffer.readlines():
-                match = re.search(self.total_balance_re_pattern, line)
-                if match:
-                    formatter = self.total_balance_formatter
-                    return formatter(match.group(0))
-
-            raise UnsupportedCsvFormatException(
-                'Total balance was not found in given file or stream.')
+        def read_preamble_lines(buffer):
+            # the total balance is part of the preamble, so there is no need
+            # to look any further than the header line
+            lines = [buffer.readline() for _ in range(self.skiprows)]
+            return [line.decode(self.encoding)
+                    if isinstance(line, bytes) else line
+                    for line in lines]
 
         try:
             # try to use filepath_or_buffer like a filepath
             with codecs.open(filepath_or_buffer, 'r', encoding=self.encoding) \
                     as buffer:
-                return read_from_buffer(buffer)
+                lines = read_preamble_lines(buffer)
         except (TypeError, AttributeError):
-            # try to use read directly
+            # try to use read directly, from the start of the buffer, but
+            # leave the buffer where the caller left it
+            position = filepath_or_buffer.tell()
             filepath_or_buffer.seek(0)
-            return read_from_buffer(filepath_or_buffer)
+            try:
+                lines = read_preamble_lines(filepath_or_buffer)
+            finally:
+                filepath_or_buffer.seek(position)
+
+        return self.parse_preamble(lines).total_balance
+
+
+class Preamble():
+    """
+        The metadata given in the lines before the header of a CSV file
+    """
+
+    def __init__(self,
+                 total_balance,
+                 account=None,
+                 period_start=None,
+                 period_end=None):
+        """
+        Parameters
+        ----------
+        total_balance : float
+            total balance after the latest transaction in the file
+        account : str, optional
+            the account the transactions in the file belong to
+        period_start : numpy.datetime64, optional
+            first day of the period covered by the file
+        period_end : numpy.datetime64, optional
+            last day of the period covered by the file
+        """
+        self.total_balance = total_balance
+        self.account = account
+        self.period_start = period_start
+        self.period_end = period_end
+
+    def __repr__(self):
+        return ("Preamble(total_balance=%r, account=%r, period_start=%r, "
+                "period_end=%r)" % (self.total_balance, self.account,
+                                    self.period_start, self.period_end))
+
+
+def _code_fingerprint(func):
+    """
+    a hash of the bytecode, constants and closure of a function, empty for
+    builtins like float
+    """
+    code = getattr(getattr(func, '__func__', func), '__code__', None)
+    if code is None:
+        return ""
+
+    def code_parts(code):
+        # nested functions are constants as well, their repr contains
+        # their address
+        return [code.co_code, code.co_names,
+                [code_parts(const) if hasattr(const, 'co_code')
+                 else repr(const) for const in code.co_consts]]
+
+    closure = getattr(func, '__closure__', None) or []
+    parts = [code_parts(code), [repr(cell.cell_contents) for cell in closure]]
+    return hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()
+
+
+class ImportStage():
+    """
+        The wall time, rows and bytes of one stage of an import
+    """
+
+    def __init__(self, name, seconds, rows=None, n_bytes=None):
+        self.name = name
+        self.seconds = seconds
+        self.rows = rows
+        self.n_bytes = n_bytes
+
+    def __repr__(self):
+        return ("ImportStage(%r, seconds=%r, rows=%r, n_bytes=%r)"
+                % (self.name, self.seconds, self.rows, self.n_bytes))
+
+
+class ImportReport():
+    """
+        The stages of an import, in the order they ran, and the peak size
+        of the intermediate frames
+
+        The stages of a csv import are read (the input is read and split
+        into preamble and body), preamble, parse (pandas.read_csv), format
+        (the formatters of the description), balances and, for compact
+        results, compact. Frame sizes are shallow, without the strings of
+        object columns, so that measuring them does not slow the import.
+    """
+
+    def __init__(self):
+        self.stages = []
+        self.peak_frame_bytes = 0
+        # rows of the result and bytes of the whole input, the preamble
+        # included
+        self.rows = None
+        self.n_bytes = None
+
+    @staticmethod
+    def now():
+        """a start time for :meth:`record`"""
+        return timeit.default_timer()
+
+    def record(self, name, start, rows=None, n_bytes=None, frame=None):
+        """
+        Adds a stage that started at `start`, see :meth:`now`
+
+        Parameters
+        ----------
+        name : str
+        start : float
+        rows : int, optional
+            rows processed by the stage
+        n_bytes : int, optional
+            bytes processed by the stage
+        frame : pandas.DataFrame, optional
+            the frame made by the stage, for the peak frame size
+        """
+        self.stages.append(ImportStage(name, self.now() - start,
+                                       rows=rows, n_bytes=n_bytes))
+        if n_bytes is not None:
+            self.n_bytes = (self.n_bytes or 0) + n_bytes
+        if frame is not None:
+            self.peak_frame_bytes = max(
+                self.peak_frame_bytes,
+                int(frame.memory_usage(index=True, deep=False).sum()))
+
+    def finish(self, df):
+        """records the result and calls the import hooks"""
+        self.rows = len(df)
+        for hook in list(_import_hooks):
+            hook(self)
+
+    @property
+    def seconds(self):
+        """the wall time of all stages"""
+        return sum(stage.seconds for stage in self.stages)
+
+    def as_dict(self):
+        """
+        The report as plain types, e.g. to log it as json
+
+        Returns
+        -------
+        dict
+        """
+        return {"seconds": self.seconds,
+                "rows": self.rows,
+                "n_bytes": self.n_bytes,
+                "peak_frame_bytes": self.peak_frame_bytes,
+                "stages": [{"name": stage.name,
+                            "seconds": stage.seconds,
+                            "rows": stage.rows,
+                            "n_bytes": stage.n_bytes}
+                           for stage in self.stages]}
+
+    def __repr__(self):
+        return ("ImportReport(seconds=%r, rows=%r, n_bytes=%r, "
+                "peak_frame_bytes=%r, stages=%r)"
+                % (self.seconds, self.rows, self.n_bytes,
+                   self.peak_frame_bytes, [s.name for s in self.stages]))
+
+
+class _NoReport():
+    """stands in for an ImportReport if nobody asked for one"""
+
+    @staticmethod
+    def now():
+        return 0.0
+
+    def record(self, name, start, rows=None, n_bytes=None, frame=None):
+        pass
+
+    def finish(self, df):
+        pass
+
+
+_NO_REPORT = _NoReport()
+
+# functions called with the ImportReport of each import, see add_import_hook
+_import_hooks = []
+
+
+def add_import_hook(hook):
+    """
+    Calls a function with the ImportReport of every following csv import,
+    e.g. to collect metrics. Without hooks, imports that are not asked for
+    a report do not measure anything
+
+    Parameters
+    ----------
+    hook : function: ImportReport -> None
+        called in the importing thread, after the import
+    """
+    _import_hooks.append(hook)
+
+
+def remove_import_hook(hook):
+    """stops calling a function added with :func:`add_import_hook`"""
+    _import_hooks.remove(hook)
+
+
+def _active_report(report):
+    """the report to fill, a new one for the hooks or a no-op report"""
+    if report is not None:
+        return report
+    if _import_hooks:
+        return ImportReport()
+    return _NO_REPORT
+
+
+def _buffer_bytes(buffer, encoding, report):
+    """
+    bytes of a seekable buffer from its start to its end. Text has no
+    bytes, it is counted as it would be encoded in the file
+    """
+    if report is _NO_REPORT:
+        return None
+    if isinstance(buffer, io.StringIO):
+        return len(buffer.getvalue().encode(encoding, 'replace'))
+    position = buffer.tell()
+    end = buffer.seek(0, io.SEEK_END)
+    buffer.seek(position)
+    return end
+
+
+class CsvTypeRegistry():
+    """
+        A collection of named CsvFileDescriptions that can detect which one
+        fits a file by looking at its first few KB only
+    """
+
+    def __init__(self, sniff_bytes=4096):
+        """
+        Parameters
+        ----------
+        sniff_bytes : int
+            number of bytes read from the beginning of a file to detect its
+            description. Must cover the preamble and the header line
+        """
+        self.sniff_bytes = sniff_bytes
+        self._descriptions = OrderedDict()
+
+    def register(self, name, description):
+        """adds a CsvFileDescription under the given name"""
+        self._descriptions[name] = description
+
+    def names(self):
+        """names of all registered descriptions, in order of registration"""
+        return list(self._descriptions.keys())
+
+    def __getitem__(self, name):
+        return self._descriptions[name]
+
+    def __contains__(self, name):
+        return name in self._descriptions
+
+    def rank(self, filepath_or_buffer):
+        """
+        Rates how well each registered description fits a file
+
+        PARAMS:
+        -------
+        filepath_or_buffer : str, pathlib.Path, py._path.local.LocalPath or
+            any object with a read() method. The position of seekable buffers
+            is restored afterwards
+
+        RETURNS:
+        --------
+        list of tuple(float, str) :
+            confidence and name of each registered description, the best
+            match first. See :meth:`CsvFileDescription.match_confidence`
+        """
+        head = self._sniff(filepath_or_buffer)
+
+        ranking = [(description.match_confidence(head), name)
+                   for name, description in self._descriptions.items()]
+        # stable sort, so that ties are broken by order of registration
+        ranking.sort(key=lambda confidence_name: -confidence_name[0])
+        return ranking
+
+    def detect(self, filepath_or_buffer):
+        """
+        Picks the registered description that fits a file best
+
+        PARAMS:
+        -------
+        filepath_or_buffer : str, pathlib.Path, py._path.local.LocalPath or
+            any object with a read() method
+
+        RETURNS:
+        --------
+        CsvFileDescription :
+            the description with the highest confidence
+
+        RAISES:
+        -------
+        UnsupportedCsvFormat :
+            if no registered description fits the file
+        """
+        ranking = self.rank(filepath_or_buffer)
+
+        if not ranking or ranking[0][0] <= 0.0:
+            raise UnsupportedCsvFormatException(
+                'No known csv type fits the given file or stream.')
+
+        return self._descriptions[ranking[0][1]]
+
+    # a registry can be used where a function path -> description is expected
+    __call__ = detect
+
+    def detect_stream(self, stream):
+        """
+        Like :meth:`detect`, for binary streams that can only be read once
+
+        PARAMS:
+        -------
+        stream : any object with a read() method that returns bytes
+
+        RETURNS:
+        --------
+        tuple(CsvFileDescription, io.BufferedReader) :
+            the description with the highest confidence and a stream that
+            returns the whole content of the given stream, including the
+            bytes read for the detection
+
+        RAISES:
+        -------
+        UnsupportedCsvFormat :
+            if no registered description fits the stream
+        """
+        head = stream.read(self.sniff_bytes)
+        description = self.detect(io.BytesIO(head))
+        return description, io.BufferedReader(_PrefixedStream(head, stream))
+
+    def _sniff(self, filepath_or_buffer):
+        if not hasattr(filepath_or_buffer, 'read'):
+            with open(str(filepath_or_buffer), 'rb') as f:
+                return f.read(self.sniff_bytes)
+
+        try:
+            position = filepath_or_buffer.tell()
+        except (AttributeError, IOError):
+            position = None
+
+        head = filepath_or_buffer.read(self.sniff_bytes)
+
+        if position is not None:
+            filepath_or_buffer.seek(position)
+
+        return head
+
+
+class _PrefixedStream(io.RawIOBase):
+    """a binary stream that returns `head` and then the rest of `stream`"""
+
+    def __init__(self, head, stream):
+        self._head = head
+        self._stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self._head:
+            data = self._head[:len(b)]
+            self._head = self._head[len(data):]
+        else:
+            data = self._stream.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+
+# all csv types known to pynance, modules that define csv types
+# register them here
+csv_types = CsvTypeRegistry()
 
 
 class UnsupportedCsvFormatException(IOError):
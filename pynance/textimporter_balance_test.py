@@ -5,12 +5,14 @@ import os.path
 import io
 
 import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
 from numpy.testing import assert_array_equal, \
     assert_array_almost_equal, assert_almost_equal
 
-from .textimporter import read_csv, \
+from .textimporter import read_csv, read_csv_chunks, \
     COLUMNS, UnsupportedCsvFormatException, \
-    CsvFileDescription, amounts_to_balances
+    CsvFileDescription, amounts_to_balances, extend_balances
 from .dkb import SupportedCsvTypes, DKBFormatters, DKBCsvDialect
 
 
@@ -140,6 +142,92 @@ class CsvBalanceImportTestCase(unittest.TestCase):
 
         self.assertRaises(UnsupportedCsvFormatException, parse_invald_header)
 
+    def test_balance_only_searched_in_preamble(self):
+        """
+        a line that looks like the balance after the header must be ignored
+        """
+        csv_desc = SupportedCsvTypes.DKBVisa
+
+        content = u"""
+            "Kreditkarte:";"3546********6546";
+
+            "Zeitraum:";"letzten 60 Tage";
+            "BALANCE:";"465.33 EUR";
+            "Datum:";"28.01.2019";
+            "Saldo:";"465.33 EUR";
+            """
+        header_stream = io.StringIO(content)
+
+        def parse_body_balance():
+            csv_desc.read_total_balance(header_stream)
+
+        self.assertRaises(UnsupportedCsvFormatException, parse_body_balance)
+
+    def test_read_chunks_balances(self):
+        """
+        the balances must be carried over from chunk to chunk
+        """
+        for filename, csv_desc in [("dkb_cash_sample.csv",
+                                    SupportedCsvTypes.DKBCash),
+                                   ("dkb_visa_sample.csv",
+                                    SupportedCsvTypes.DKBVisa)]:
+            sample_file = os.path.join("pynance", "test_data", filename)
+            expected_df = read_csv(sample_file, csv_desc)
+
+            chunks = list(read_csv_chunks(sample_file, csv_desc, chunksize=1))
+
+            self.assertEqual(len(expected_df), len(chunks))
+            for chunk in chunks:
+                self.assertListEqual(list(COLUMNS), list(chunk.columns))
+            assert_frame_equal(expected_df, pd.concat(chunks))
+
+    def test_read_chunks_StringIO(self):
+        csv_desc = SupportedCsvTypes.DKBVisa
+        sample_file = os.path.join("pynance", "test_data",
+                                   "dkb_visa_sample.csv")
+        with io.open(sample_file, encoding=csv_desc.encoding) as f:
+            content = f.read()
+
+        chunks = list(read_csv_chunks(io.StringIO(content), csv_desc,
+                                      chunksize=3))
+
+        self.assertListEqual([3, 1], [len(chunk) for chunk in chunks])
+        assert_array_almost_equal([465.33, 530.33, 544.66, 556.08],
+                                  pd.concat(chunks)["total_balance"].values)
+
+    def test_read_chunks_missing_amount(self):
+        csv_desc = SupportedCsvTypes.DKBVisa
+        sample_file = os.path.join("pynance", "test_data",
+                                   "dkb_visa_sample.csv")
+        with io.open(sample_file, encoding=csv_desc.encoding) as f:
+            # the oldest transaction of the first chunk
+            content = f.read().replace('"-11,42"', '""')
+
+        def read_chunks(nan_policy):
+            chunks = read_csv_chunks(io.StringIO(content), csv_desc,
+                                     chunksize=3, nan_policy=nan_policy)
+            return pd.concat(list(chunks))["total_balance"].values
+
+        # the missing amount counts as 0, also in the later chunks
+        expected = read_csv(io.StringIO(content), csv_desc)
+        assert_array_almost_equal([465.33, 530.33, 544.66, 544.66],
+                                  expected["total_balance"].values)
+        assert_array_almost_equal(expected["total_balance"].values,
+                                  read_chunks("omit"))
+
+        assert_array_almost_equal([465.33, 530.33, 544.66, np.nan],
+                                  read_chunks("propagate"))
+        self.assertRaises(ValueError, read_chunks, "raise")
+
+    def test_read_chunks_wrong_header(self):
+        sample_file = os.path.join("pynance", "test_data",
+                                   "dkb_cash_sample_wrong_col.csv")
+
+        def read_wrong_header():
+            list(read_csv_chunks(sample_file, SupportedCsvTypes.DKBCash, 2))
+
+        self.assertRaises(UnsupportedCsvFormatException, read_wrong_header)
+
     def test_amounts_to_balances1(self):
         amounts = np.array([1.0, 1.0, 1.0, 1.0])
         final_balance = 4.0
@@ -167,6 +255,66 @@ class CsvBalanceImportTestCase(unittest.TestCase):
 
         self.assertEqual(balances[0], final_balance)
 
+    def test_amounts_to_balances_out(self):
+        amounts = np.array([-12.23, 9.00, 453.23, -232.32])
+        out = np.zeros(4)
+
+        balances = amounts_to_balances(amounts, 221.32, out=out)
+        self.assertIs(out, balances)
+        assert_array_almost_equal([221.32, 233.55, 224.55, -228.68], out)
+        self.assertEqual(0, len(amounts_to_balances([], 1.0)))
+
+    def test_amounts_to_balances_nan(self):
+        amounts = np.array([1.0, np.nan, 1.0, 1.0])
+
+        assert_array_almost_equal(
+            [4.0, 3.0, 3.0, 2.0], amounts_to_balances(amounts, 4.0))
+        assert_array_equal(
+            [4.0, 3.0, np.nan, np.nan],
+            amounts_to_balances(amounts, 4.0, nan_policy="propagate"))
+        self.assertRaises(ValueError, amounts_to_balances, amounts, 4.0,
+                          nan_policy="raise")
+        self.assertRaises(ValueError, amounts_to_balances, amounts, 4.0,
+                          nan_policy="ignore")
+
+    def test_amounts_to_balances_groups(self):
+        np.random.seed(0)
+        groups = np.random.choice(["a", "b", "c"], 1000)
+        amounts = np.round(np.random.normal(0, 100, 1000), 2)
+        final_balances = {"a": 100.0, "b": -50.0, "c": 0.0}
+
+        balances = amounts_to_balances(amounts, final_balances, groups)
+
+        for group, final_balance in final_balances.items():
+            in_group = groups == group
+            assert_array_almost_equal(
+                amounts_to_balances(amounts[in_group], final_balance),
+                balances[in_group])
+
+        in_a = np.flatnonzero(groups == "a")
+        amounts[in_a[5]] = np.nan
+        balances = amounts_to_balances(amounts, final_balances, groups,
+                                       nan_policy="propagate")
+        # only the balances before the missing amount in its group
+        assert_array_equal(in_a[6:], np.flatnonzero(np.isnan(balances)))
+
+    def test_extend_balances(self):
+        amounts = np.array([-12.23, 9.00, 453.23, -232.32])
+        balances = amounts_to_balances(amounts, 221.32)
+
+        # the two later transactions continue the chain of the older ones
+        new_balances = extend_balances(amounts[:2], balances[2])
+        assert_array_almost_equal(balances[:2], new_balances)
+
+        out = np.empty(2)
+        self.assertIs(out, extend_balances(amounts[:2], balances[2],
+                                           out=out))
+        # the balances that depend on the missing amount
+        assert_array_equal([np.nan, 225.55],
+                           extend_balances([np.nan, 1.0], 224.55,
+                                           nan_policy="propagate"))
+        self.assertEqual(0, len(extend_balances([], 1.0)))
+
 
 def test_suite():
     suite = unittest.makeSuite(CsvBalanceImportTestCase)
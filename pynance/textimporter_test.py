@@ -1,19 +1,39 @@
 from __future__ import absolute_import, print_function
 
+import copy
 import unittest
 import os.path
 import io
+import shutil
+import tempfile
+import threading
 
 import numpy as np
+from pandas.testing import assert_frame_equal
 from numpy.testing import assert_array_equal, \
     assert_array_almost_equal, assert_almost_equal
 
-from .textimporter import read_csv, \
+from .textimporter import read_csv, read_csv_with_preamble, read_many, \
+    read_csv_stream, read_csv_with_report, add_import_hook, \
+    remove_import_hook, ImportReport, \
     COLUMNS, UnsupportedCsvFormatException, \
-    CsvFileDescription, amounts_to_balances
+    CsvFileDescription, CsvTypeRegistry, csv_types, amounts_to_balances
 from .dkb import SupportedCsvTypes, DKBFormatters, DKBCsvDialect
 
 
+class NonSeekableStream(object):
+    """a stream that can only be read once, like an upload pipe"""
+
+    def __init__(self, content):
+        self._buffer = io.BytesIO(content)
+
+    def read(self, size=-1):
+        return self._buffer.read(size)
+
+    def seek(self, *args):
+        raise io.UnsupportedOperation("seek")
+
+
 class CsvImportTestCase(unittest.TestCase):
 
     # helper
@@ -58,6 +78,30 @@ class CsvImportTestCase(unittest.TestCase):
                 total_balance_formatter=DKBFormatters.to_float64)
         self.assertRaises(AssertionError, construction_missing_formatter)
 
+    def test_scalar_formatters_fallback(self):
+        """
+        a description without column formatters converts cell by cell
+        and must give the same frame as the vectorized one
+        """
+        dkbcash = SupportedCsvTypes.DKBCash
+        scalar_description = CsvFileDescription(
+            column_map=dkbcash.column_map,
+            csv_dialect=dkbcash.csv_dialect,
+            formatters=dkbcash.formatters,
+            skiprows=dkbcash.skiprows,
+            encoding=dkbcash.encoding,
+            total_balance_re_pattern=dkbcash.total_balance_re_pattern,
+            total_balance_formatter=dkbcash.total_balance_formatter)
+        self.assertEqual({}, scalar_description.column_formatters)
+
+        sample_file = os.path.join("pynance",
+                                   "test_data",
+                                   "dkb_cash_sample.csv")
+        expected_df = read_csv(sample_file, dkbcash)
+        result_df = read_csv(sample_file, scalar_description)
+
+        assert_frame_equal(expected_df, result_df)
+
     # tests DKB
 
     def test_csv_importer_read_dkbcash(self):
@@ -174,8 +218,217 @@ class CsvImportTestCase(unittest.TestCase):
         self.assertTrue(np.isnan(formatter("")))
         self.assertEqual(-1200.54, formatter("-1200,54"))
 
+    def test_dkbcash_preamble(self):
+        sample_file = os.path.join("pynance",
+                                   "test_data",
+                                   "dkb_cash_sample.csv")
+        _, preamble = read_csv_with_preamble(sample_file,
+                                             SupportedCsvTypes.DKBCash)
+
+        self.assertEqual(1248.54, preamble.total_balance)
+        self.assertEqual("DE95500105178154844163", preamble.account)
+        self.assertEqual(np.datetime64("2018-12-01"), preamble.period_start)
+        self.assertEqual(np.datetime64("2018-12-15"), preamble.period_end)
+
+    def test_dkbcash_non_seekable_stream(self):
+        sample_file = os.path.join("pynance",
+                                   "test_data",
+                                   "dkb_cash_sample.csv")
+        with open(sample_file, "rb") as f:
+            stream = NonSeekableStream(f.read())
+
+        expected_df = self.read_dummy_file_dkbcash_small()
+        result_df = read_csv(stream, SupportedCsvTypes.DKBCash)
+
+        assert_frame_equal(expected_df, result_df)
+
+    def test_read_total_balance_keeps_position(self):
+        sample_file = os.path.join("pynance",
+                                   "test_data",
+                                   "dkb_cash_sample.csv")
+        with open(sample_file, "rb") as f:
+            buffer = io.BytesIO(f.read())
+        buffer.seek(42)
+
+        self.assertEqual(1248.54, SupportedCsvTypes.DKBCash
+                         .read_total_balance(buffer))
+        self.assertEqual(42, buffer.tell())
+
+    def test_description_copies_dicts(self):
+        column_map = {"date": "Wertstellung"}
+        description = CsvFileDescription(
+            column_map=column_map,
+            csv_dialect=DKBCsvDialect(),
+            formatters=DKBFormatters.formatter_map(),
+            skiprows=6,
+            encoding="iso-8859-1",
+            total_balance_re_pattern=r'(?<=Saldo:";")(.*)(?= EUR";)',
+            total_balance_formatter=DKBFormatters.to_float64)
+        fingerprint = description.fingerprint()
+
+        column_map["text"] = "Beschreibung"
+        self.assertEqual({"date": "Wertstellung"}, description.column_map)
+        self.assertEqual(fingerprint, description.fingerprint())
+
+        # a new dict on each call
+        description.parser_options()["usecols"].append("Beschreibung")
+        self.assertEqual(["Wertstellung"],
+                         description.parser_options()["usecols"])
+
+    def test_fingerprint_formatter_code(self):
+        def description(total_balance_formatter):
+            return CsvFileDescription(
+                column_map={"date": "Wertstellung"},
+                csv_dialect=DKBCsvDialect(),
+                formatters=DKBFormatters.formatter_map(),
+                skiprows=6,
+                encoding="iso-8859-1",
+                total_balance_re_pattern=r'(?<=Saldo:";")(.*)(?= EUR";)',
+                total_balance_formatter=total_balance_formatter)
+
+        # both are named <lambda>
+        self.assertNotEqual(
+            description(lambda s: float(s)).fingerprint(),
+            description(lambda s: float(s) * 100).fingerprint())
+        self.assertEqual(
+            description(lambda s: float(s)).fingerprint(),
+            description(lambda s: float(s)).fingerprint())
+        self.assertNotEqual(description(float).fingerprint(),
+                            description(lambda s: float(s)).fingerprint())
+
+    def test_concurrent_reads(self):
+        """
+        threads that share a description read their own buffers like a
+        single thread does
+        """
+        sample_file = os.path.join("pynance",
+                                   "test_data",
+                                   "dkb_cash_sample.csv")
+        with open(sample_file, "rb") as f:
+            content = f.read()
+        expected_df = self.read_dummy_file_dkbcash_small()
+        fingerprint = SupportedCsvTypes.DKBCash.fingerprint()
+
+        results = []
+        errors = []
+
+        def read(n):
+            try:
+                for _ in range(n):
+                    results.append(read_csv(io.BytesIO(content),
+                                            SupportedCsvTypes.DKBCash))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=read, args=(20,))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertListEqual([], errors)
+        self.assertEqual(8 * 20, len(results))
+        for result_df in results:
+            assert_frame_equal(expected_df, result_df)
+        self.assertEqual(fingerprint, SupportedCsvTypes.DKBCash.fingerprint())
+
+    def test_import_report(self):
+        sample_file = os.path.join("pynance",
+                                   "test_data",
+                                   "dkb_cash_sample.csv")
+        with open(sample_file, "rb") as f:
+            content = f.read()
+
+        df, preamble, report = read_csv_with_report(
+            io.BytesIO(content), SupportedCsvTypes.DKBCash)
+
+        self.assertListEqual(["read", "preamble", "parse", "format",
+                              "balances"],
+                             [stage.name for stage in report.stages])
+        self.assertEqual(3, report.rows)
+        # the preamble is read as well
+        self.assertEqual(len(content), report.n_bytes)
+        self.assertEqual(3, report.stages[2].rows)
+        self.assertGreater(report.peak_frame_bytes, 0)
+        self.assertTrue(all(stage.seconds >= 0 for stage in report.stages))
+        self.assertAlmostEqual(report.seconds,
+                               report.as_dict()["seconds"])
+
+        _, _, report = read_csv_with_report(
+            io.BytesIO(content), SupportedCsvTypes.DKBCash, compact=True)
+        self.assertEqual("compact", report.stages[-1].name)
+
+    def test_import_report_file_size(self):
+        for filename, csv_desc in [
+                ("dkb_cash_sample.csv", SupportedCsvTypes.DKBCash),
+                ("dkb_visa_sample.csv", SupportedCsvTypes.DKBVisa)]:
+            sample_file = os.path.join("pynance", "test_data", filename)
+            report = ImportReport()
+            read_csv(sample_file, csv_desc, report=report)
+            self.assertEqual(os.path.getsize(sample_file), report.n_bytes)
+            self.assertEqual(report.n_bytes, report.stages[0].n_bytes)
+
+            # text is counted in the encoding of the file
+            with io.open(sample_file, encoding=csv_desc.encoding,
+                         newline="") as f:
+                report = ImportReport()
+                read_csv(f, csv_desc, report=report)
+            self.assertEqual(os.path.getsize(sample_file), report.n_bytes)
+
+        # umlauts take two bytes in utf-8, but are one character of text
+        utf8_description = copy.copy(SupportedCsvTypes.DKBVisa)
+        utf8_description.encoding = "utf-8"
+        sample_file = os.path.join("pynance", "test_data",
+                                   "dkb_visa_sample.csv")
+        with io.open(sample_file, encoding="iso-8859-1", newline="") as f:
+            content = f.read()
+        report = ImportReport()
+        read_csv(io.StringIO(content), utf8_description, report=report)
+        self.assertEqual(len(content.encode("utf-8")), report.n_bytes)
+        self.assertGreater(report.n_bytes, len(content))
+
+    def test_import_hooks(self):
+        sample_file = os.path.join("pynance",
+                                   "test_data",
+                                   "dkb_cash_sample.csv")
+        reports = []
+        add_import_hook(reports.append)
+        try:
+            read_csv(sample_file, SupportedCsvTypes.DKBCash)
+            with open(sample_file, "rb") as f:
+                read_csv_stream(NonSeekableStream(f.read()),
+                                SupportedCsvTypes.DKBCash)
+        finally:
+            remove_import_hook(reports.append)
+        read_csv(sample_file, SupportedCsvTypes.DKBCash)
+
+        self.assertEqual(2, len(reports))
+        self.assertEqual("read", reports[0].stages[0].name)
+        # a stream has no read stage and no known size
+        self.assertListEqual(["preamble", "parse", "format", "balances"],
+                             [stage.name for stage in reports[1].stages])
+        self.assertIsNone(reports[1].n_bytes)
+
+        # a given report is filled, also without hooks
+        report = ImportReport()
+        read_csv(sample_file, SupportedCsvTypes.DKBCash, report=report)
+        self.assertEqual(3, report.rows)
+
     # Tests VISA
 
+    def test_dkbvisa_preamble(self):
+        sample_file = os.path.join("pynance",
+                                   "test_data",
+                                   "dkb_visa_sample.csv")
+        _, preamble = read_csv_with_preamble(sample_file,
+                                             SupportedCsvTypes.DKBVisa)
+
+        self.assertEqual(465.33, preamble.total_balance)
+        self.assertEqual("3546********6546", preamble.account)
+        self.assertIsNone(preamble.period_start)
+        self.assertEqual(np.datetime64("2019-01-28"), preamble.period_end)
+
     def test_csv_importer_read_dkbvisa_empty_columns(self):
         """
         some colummns should be NAN on all entries
@@ -280,6 +533,177 @@ class CsvImportTestCase(unittest.TestCase):
         self.assertListEqual(expected, df["text"].tolist())
 
 
+class ReadManyTestCase(unittest.TestCase):
+    cash_file = os.path.join("pynance", "test_data", "dkb_cash_sample.csv")
+    visa_file = os.path.join("pynance", "test_data", "dkb_visa_sample.csv")
+    broken_file = os.path.join("pynance", "test_data",
+                               "dkb_cash_sample_broken.csv")
+
+    def test_read_many_order_and_origin(self):
+        paths = [self.cash_file, self.broken_file, self.cash_file]
+
+        for workers in [1, 2]:
+            df, failures = read_many(paths, SupportedCsvTypes.DKBCash,
+                                     workers=workers)
+
+            self.assertEqual(6, len(df))
+            self.assertListEqual(list(COLUMNS), list(df.columns))
+            self.assertListEqual(["DE95500105178154844163"] * 6,
+                                 df["origin"].tolist())
+            assert_array_equal([-12.16, 120.0, -10.0] * 2,
+                               df["amount"].values)
+
+            self.assertEqual(1, len(failures))
+            path, error = failures[0]
+            self.assertEqual(self.broken_file, path)
+            self.assertIsInstance(error, UnsupportedCsvFormatException)
+
+    def test_read_many_pick_description(self):
+        descriptions = {self.cash_file: SupportedCsvTypes.DKBCash,
+                        self.visa_file: SupportedCsvTypes.DKBVisa}
+
+        df, failures = read_many([self.visa_file, self.cash_file],
+                                 descriptions.get, workers=2)
+
+        self.assertListEqual([], failures)
+        self.assertListEqual(["3546********6546"] * 4 +
+                             ["DE95500105178154844163"] * 3,
+                             df["origin"].tolist())
+
+    def test_read_many_missing_file(self):
+        df, failures = read_many(["does_not_exist.csv"],
+                                 SupportedCsvTypes.DKBCash)
+
+        self.assertEqual(0, len(df))
+        self.assertEqual(1, len(failures))
+        self.assertIsInstance(failures[0][1], IOError)
+
+    def test_read_many_parse_errors(self):
+        directory = tempfile.mkdtemp()
+        try:
+            with open(self.cash_file, "rb") as f:
+                content = f.read()
+            # a preamble that is no iso-8859-1 and a balance that is no
+            # number
+            utf8_description = copy.copy(SupportedCsvTypes.DKBCash)
+            utf8_description.encoding = "utf-8"
+            undecodable = os.path.join(directory, "undecodable.csv")
+            with open(undecodable, "wb") as f:
+                f.write(content.replace(b"Girokonto", b"Girok\xf6nto"))
+            no_number = os.path.join(directory, "no_number.csv")
+            with open(no_number, "wb") as f:
+                f.write(content.replace(b"1.248,54", b"1.2x8,54"))
+            descriptions = {self.cash_file: SupportedCsvTypes.DKBCash,
+                            undecodable: utf8_description,
+                            no_number: SupportedCsvTypes.DKBCash}
+
+            for workers in [1, 2]:
+                df, failures = read_many(
+                    [undecodable, self.cash_file, no_number],
+                    descriptions.get, workers=workers)
+
+                self.assertEqual(3, len(df))
+                self.assertEqual([undecodable, no_number],
+                                 [path for path, _ in failures])
+                self.assertIsInstance(failures[0][1], UnicodeDecodeError)
+                self.assertIsInstance(failures[1][1], ValueError)
+        finally:
+            shutil.rmtree(directory)
+
+
+class CsvTypeRegistryTestCase(unittest.TestCase):
+    cash_file = os.path.join("pynance", "test_data", "dkb_cash_sample.csv")
+    visa_file = os.path.join("pynance", "test_data", "dkb_visa_sample.csv")
+    wrong_col_file = os.path.join("pynance", "test_data",
+                                  "dkb_cash_sample_wrong_col.csv")
+
+    def test_dkb_types_registered(self):
+        self.assertListEqual(["DKBCash", "DKBVisa"], csv_types.names())
+        self.assertIs(SupportedCsvTypes.DKBCash, csv_types["DKBCash"])
+
+    def test_detect_dkb(self):
+        self.assertIs(SupportedCsvTypes.DKBCash,
+                      csv_types.detect(self.cash_file))
+        self.assertIs(SupportedCsvTypes.DKBVisa,
+                      csv_types.detect(self.visa_file))
+
+    def test_rank_confidence(self):
+        ranking = csv_types.rank(self.cash_file)
+
+        self.assertListEqual([(1.0, "DKBCash"), (0.0, "DKBVisa")], ranking)
+
+    def test_detect_unknown(self):
+        def detect_wrong_col():
+            return csv_types.detect(self.wrong_col_file)
+
+        def detect_empty_registry():
+            return CsvTypeRegistry().detect(self.cash_file)
+
+        self.assertRaises(UnsupportedCsvFormatException, detect_wrong_col)
+        self.assertRaises(UnsupportedCsvFormatException,
+                          detect_empty_registry)
+
+    def test_detect_reads_head_only(self):
+        with open(self.cash_file, "rb") as f:
+            content = f.read()
+        buffer = io.BytesIO(content)
+
+        registry = CsvTypeRegistry(sniff_bytes=600)
+        registry.register("DKBCash", SupportedCsvTypes.DKBCash)
+        description = registry.detect(buffer)
+
+        # the buffer can still be read from its start
+        self.assertEqual(0, buffer.tell())
+        self.assertEqual(3, len(read_csv(buffer, description)))
+
+    def test_detect_stream(self):
+        with open(self.visa_file, "rb") as f:
+            content = f.read()
+
+        registry = CsvTypeRegistry(sniff_bytes=600)
+        registry.register("DKBCash", SupportedCsvTypes.DKBCash)
+        registry.register("DKBVisa", SupportedCsvTypes.DKBVisa)
+        description, stream = registry.detect_stream(
+            NonSeekableStream(content))
+
+        self.assertIs(SupportedCsvTypes.DKBVisa, description)
+        # the returned stream starts with the bytes read for the detection
+        self.assertEqual(content, stream.read())
+
+    def test_read_csv_stream(self):
+        with open(self.cash_file, "rb") as f:
+            content = f.read()
+        expected_df, expected_preamble = read_csv_with_preamble(
+            self.cash_file, SupportedCsvTypes.DKBCash)
+
+        df, preamble = read_csv_stream(NonSeekableStream(content),
+                                       SupportedCsvTypes.DKBCash)
+
+        assert_frame_equal(expected_df, df)
+        self.assertEqual(repr(expected_preamble), repr(preamble))
+
+    def test_read_csv_stream_detected(self):
+        with open(self.cash_file, "rb") as f:
+            description, stream = csv_types.detect_stream(
+                NonSeekableStream(f.read()))
+
+        df, preamble = read_csv_stream(stream, description)
+
+        self.assertEqual(3, len(df))
+        self.assertAlmostEqual(1248.54, preamble.total_balance)
+
+    def test_read_many_detect(self):
+        df, failures = read_many([self.cash_file, self.visa_file,
+                                  self.wrong_col_file],
+                                 csv_types, workers=2)
+
+        self.assertEqual(7, len(df))
+        self.assertListEqual([self.wrong_col_file],
+                             [path for path, _ in failures])
+
+
 def test_suite():
     suite = unittest.makeSuite(CsvImportTestCase)
+    suite.addTest(unittest.makeSuite(ReadManyTestCase))
+    suite.addTest(unittest.makeSuite(CsvTypeRegistryTestCase))
     return suite
@@ -0,0 +1,592 @@
+"""
+This module contains the persistent store for transactions, see
+docs/data_structures/database.md
+"""
+from __future__ import absolute_import
+
+import sqlite3
+import time
+from contextlib import contextmanager
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+
+from .aggregation import AggregationCube
+from .balances import BalanceHistory
+from .definitions import COLUMNS
+from .search import INDEXED_COLUMNS, TextIndex
+from .textimporter import read_csv_with_preamble
+
+# how the types in COLUMNS are stored in sqlite
+# dates are stored as days since 1970-01-01, so that they can be
+# compared and converted without parsing strings
+SQL_TYPES = {
+    np.datetime64: "INTEGER",
+    np.float64: "REAL",
+    str: "TEXT"}
+
+# indexes of the transactions table, name -> indexed columns
+INDEXES = {
+    "idx_transactions_date": ["date"],
+    "idx_transactions_origin_date": ["origin", "date"],
+    "idx_transactions_category": ["category"],
+    "idx_transactions_content_hash": ["content_hash"]}
+
+# number of hashes looked up with one query, sqlite allows at least 999
+# parameters per statement
+_LOOKUP_SIZE = 500
+
+
+# columns that can be read with Storage.query
+QUERY_COLUMNS = ["id", "imported_at"] + list(COLUMNS)
+
+
+class Storage():
+    """
+        Reads and writes transactions from and to a sqlite database
+    """
+
+    # number of rows inserted with one executemany call
+    batch_size = 10000
+
+    def __init__(self, path=":memory:"):
+        """
+        Parameters
+        ----------
+        path : str
+            path of the sqlite database file, created if it does not exist.
+            The default keeps the database in memory
+        """
+        self.path = path
+        self._connection = sqlite3.connect(path)
+        self._create_schema()
+
+    def _create_schema(self):
+        column_defs = ",\n".join("%s %s" % (col_name, SQL_TYPES[col_type])
+                                 for col_name, col_type in COLUMNS.items())
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS transactions (\n"
+                "id INTEGER PRIMARY KEY AUTOINCREMENT,\n"
+                "imported_at INTEGER NOT NULL,\n"
+                "content_hash INTEGER,\n"
+                "%s)" % column_defs)
+
+            # databases created before content hashes were introduced
+            cursor = self._connection.execute(
+                "PRAGMA table_info(transactions)")
+            if "content_hash" not in [row[1] for row in cursor.fetchall()]:
+                self._connection.execute(
+                    "ALTER TABLE transactions ADD COLUMN content_hash INTEGER")
+
+            for index_name, index_cols in INDEXES.items():
+                self._connection.execute(
+                    "CREATE INDEX IF NOT EXISTS %s ON transactions (%s)"
+                    % (index_name, ", ".join(index_cols)))
+
+    def insert(self, df, imported_at=None, deduplicate=False,
+               return_mask=False):
+        """
+        Inserts transactions in batches within a single database transaction
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            transactions with the columns defined in COLUMNS, as returned by
+            :func:`~textimporter.read_csv`. Compact frames are supported
+        imported_at : int, optional
+            unix timestamp stored with all rows, defaults to now
+        deduplicate : bool
+            only insert transactions whose :func:`content_hashes` are not
+            stored yet, e.g. when exports with overlapping periods are
+            imported. Only the hashes of `df` are looked up in the index,
+            so the cost does not depend on the number of stored rows. The
+            database is locked from the lookup on, so that no other
+            connection can store the same transactions in between
+        return_mask : bool
+            return which rows were inserted instead of their number, e.g.
+            to update data derived from the stored transactions with
+            exactly the inserted rows
+
+        Returns
+        -------
+        int : number of inserted rows, or numpy.ndarray of bool : one value
+            per row of df, True if it was inserted, if return_mask is given
+        """
+        if imported_at is None:
+            imported_at = int(time.time())
+
+        hashes = content_hashes(df)
+        is_new = np.ones(len(df), dtype=bool)
+
+        with self._write_transaction():
+            if deduplicate:
+                is_new = ~self.is_stored(df, hashes)
+                df = df[is_new]
+                hashes = hashes[is_new]
+
+            # convert whole columns, the rows are only assembled by zip
+            columns = [hashes.tolist()]
+            columns += [_to_sql_values(df[col_name], col_type)
+                        for col_name, col_type in COLUMNS.items()]
+
+            sql = ("INSERT INTO transactions (imported_at, content_hash, %s) "
+                   "VALUES (?, ?, %s)" % (", ".join(COLUMNS),
+                                          ", ".join("?" * len(COLUMNS))))
+
+            for start in range(0, len(df), self.batch_size):
+                end = start + self.batch_size
+                batch = zip(repeat(imported_at),
+                            *[values[start:end] for values in columns])
+                self._connection.executemany(sql, batch)
+
+        if return_mask:
+            return is_new
+        return len(df)
+
+    @contextmanager
+    def _write_transaction(self):
+        """
+        A database transaction that locks the database for writing from
+        its start, not only from its first write like the transactions of
+        the sqlite3 module, so that lookups and writes are atomic
+        """
+        isolation_level = self._connection.isolation_level
+        # the sqlite3 module neither begins nor commits on its own
+        self._connection.isolation_level = None
+        try:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+        finally:
+            self._connection.isolation_level = isolation_level
+
+    def is_stored(self, df, hashes=None):
+        """
+        Tells which transactions are stored already, by their
+        :func:`content_hashes`
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            transactions with the columns defined in COLUMNS
+        hashes : numpy.ndarray, optional
+            the content hashes of df, if they are known already
+
+        Returns
+        -------
+        numpy.ndarray of bool : one value per row
+        """
+        if hashes is None:
+            hashes = content_hashes(df)
+        return np.isin(hashes, self._stored_hashes(hashes))
+
+    def _stored_hashes(self, hashes):
+        """the given content hashes that are already stored"""
+        stored = []
+        unique_hashes = np.unique(hashes).tolist()
+
+        for start in range(0, len(unique_hashes), _LOOKUP_SIZE):
+            lookup = unique_hashes[start:start + _LOOKUP_SIZE]
+            cursor = self._connection.execute(
+                "SELECT content_hash FROM transactions "
+                "WHERE content_hash IN (%s)" % ", ".join("?" * len(lookup)),
+                lookup)
+            stored.extend(row[0] for row in cursor.fetchall())
+
+        return np.array(stored, dtype=np.int64)
+
+    def read(self):
+        """
+        Reads all transactions in the order they were inserted
+
+        Returns
+        -------
+        pandas.DataFrame : the columns `id` and `imported_at`, followed by
+            the columns defined in COLUMNS
+        """
+        return self.query()
+
+    def query(self,
+              start=None,
+              end=None,
+              accounts=None,
+              categories=None,
+              min_amount=None,
+              max_amount=None,
+              sign=None,
+              min_id=None,
+              columns=None):
+        """
+        Reads the transactions that match all given filters, in the order
+        they were inserted
+
+        The filters are evaluated by sqlite using the indexes on date,
+        origin and category, so only matching rows and only the requested
+        columns are read.
+
+        Parameters
+        ----------
+        start : numpy.datetime64 or str like '2018-12-01', optional
+            first day to include
+        end : numpy.datetime64 or str like '2018-12-31', optional
+            last day to include
+        accounts : list of str, optional
+            values of the `origin` column to include
+        categories : list of str, optional
+            values of the `category` column to include
+        min_amount : float, optional
+            smallest amount to include
+        max_amount : float, optional
+            largest amount to include
+        sign : int, optional
+            1 for incoming (amount > 0), -1 for outgoing (amount < 0)
+            transactions only
+        min_id : int, optional
+            smallest `id` to include, e.g. to read the transactions
+            inserted after a known one
+        columns : list of str, optional
+            columns to read, from `id`, `imported_at` and COLUMNS.
+            Defaults to all of them
+
+        Returns
+        -------
+        pandas.DataFrame : the requested columns of the matching transactions
+
+        Raises
+        ------
+        ValueError
+            if an unknown column or sign is given
+        """
+        if columns is None:
+            columns = QUERY_COLUMNS
+        unknown = [c for c in columns if c not in QUERY_COLUMNS]
+        if unknown:
+            raise ValueError("Unknown columns: %s" % ", ".join(unknown))
+
+        conditions = []
+        params = []
+
+        if start is not None:
+            conditions.append("date >= ?")
+            params.append(_to_days(start))
+        if end is not None:
+            conditions.append("date <= ?")
+            params.append(_to_days(end))
+        for col_name, values in [("origin", accounts),
+                                 ("category", categories)]:
+            if values is not None:
+                values = list(values)
+                conditions.append("%s IN (%s)" % (col_name,
+                                                  ", ".join("?" * len(values))))
+                params.extend(values)
+        if min_amount is not None:
+            conditions.append("amount >= ?")
+            params.append(float(min_amount))
+        if max_amount is not None:
+            conditions.append("amount <= ?")
+            params.append(float(max_amount))
+        if sign is not None:
+            if sign not in (1, -1):
+                raise ValueError("sign must be 1 or -1, not %r" % sign)
+            conditions.append("amount > 0" if sign == 1 else "amount < 0")
+        if min_id is not None:
+            conditions.append("id >= ?")
+            params.append(int(min_id))
+
+        sql = "SELECT %s FROM transactions" % ", ".join(columns)
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY id"
+
+        return self._read_sql(sql, params)
+
+    def read_ids(self, ids, columns=None):
+        """
+        Reads the transactions with the given ids, using the primary key
+
+        Parameters
+        ----------
+        ids : list of int
+        columns : list of str, optional
+            see :meth:`query`
+
+        Returns
+        -------
+        pandas.DataFrame : the requested columns of the transactions,
+            ordered by id
+        """
+        if columns is None:
+            columns = QUERY_COLUMNS
+        unknown = [c for c in columns if c not in QUERY_COLUMNS]
+        if unknown:
+            raise ValueError("Unknown columns: %s" % ", ".join(unknown))
+
+        unique_ids = np.unique(np.asarray(ids, dtype=np.int64)).tolist()
+        frames = []
+        # at least one query, for the columns of an empty frame
+        for start in range(0, max(len(unique_ids), 1), _LOOKUP_SIZE):
+            lookup = unique_ids[start:start + _LOOKUP_SIZE]
+            sql = ("SELECT %s FROM transactions WHERE id IN (%s) "
+                   "ORDER BY id" % (", ".join(columns),
+                                    ", ".join("?" * len(lookup))))
+            frames.append(self._read_sql(sql, lookup))
+        return pd.concat(frames, ignore_index=True)
+
+    def count(self):
+        """number of stored transactions"""
+        cursor = self._connection.execute("SELECT COUNT(*) FROM transactions")
+        return cursor.fetchone()[0]
+
+    def close(self):
+        self._connection.close()
+
+    def _read_sql(self, sql, params=()):
+        df = pd.read_sql_query(sql, self._connection, params=params)
+        return _from_sql_frame(df)
+
+
+class Transactions():
+    """
+        All transactions of the user, backed by a Storage
+    """
+
+    def __init__(self, storage=None):
+        """
+        Parameters
+        ----------
+        storage : Storage, optional
+            defaults to a Storage in memory
+        """
+        if storage is None:
+            storage = Storage()
+        self.storage = storage
+        self._cube = None
+        self._history = None
+        self._index = None
+
+    def append(self, df, deduplicate=False):
+        """
+        Stores the transactions of a DataFrame
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            transactions with the columns defined in COLUMNS
+        deduplicate : bool
+            skip transactions that are stored already,
+            see :meth:`Storage.insert`
+
+        Returns
+        -------
+        int : number of stored rows
+        """
+        is_new = self.storage.insert(df, deduplicate=deduplicate,
+                                     return_mask=True)
+        n_rows = int(is_new.sum())
+
+        if self._cube is not None or self._history is not None:
+            new_df = df if n_rows == len(df) else df[is_new]
+            if self._cube is not None:
+                self._cube.update(new_df)
+            if self._history is not None:
+                self._history.update(new_df)
+        if self._index is not None:
+            self._update_text_index()
+        return n_rows
+
+    def import_csv(self,
+                   filepath_or_buffer,
+                   description,
+                   deduplicate=True,
+                   rules=None):
+        """
+        Reads a csv file with :func:`~textimporter.read_csv_with_preamble`
+        and stores its transactions
+
+        The `origin` of the transactions is set to the account given in the
+        preamble. By default, transactions that were imported before, e.g.
+        from an export with an overlapping period, are skipped. Their
+        balances were computed from the same preamble balance chain, so the
+        stored balances stay consistent.
+
+        If a :class:`~categorize.RuleSet` is given as `rules`, it fills the
+        categories of the transactions before they are stored.
+
+        Returns
+        -------
+        int : number of stored rows
+        """
+        df, preamble = read_csv_with_preamble(filepath_or_buffer, description)
+        if preamble.account is not None:
+            df['origin'] = preamble.account
+        if rules is not None:
+            df = rules.categorize(df)
+
+        return self.append(df, deduplicate=deduplicate)
+
+    def to_dataframe(self):
+        """all stored transactions, see :meth:`Storage.read`"""
+        return self.storage.read()
+
+    def query(self, **filters):
+        """the matching transactions, see :meth:`Storage.query`"""
+        return self.storage.query(**filters)
+
+    def aggregation(self):
+        """
+        The AggregationCube of all stored transactions, e.g. for monthly
+        reports per category
+
+        It is made from the storage on the first call and then updated
+        with the transactions of each append.
+
+        Returns
+        -------
+        AggregationCube
+        """
+        if self._cube is None:
+            self._cube = AggregationCube().update(self.to_dataframe())
+        return self._cube
+
+    def balances(self):
+        """
+        The BalanceHistory of all stored transactions, e.g. for the total
+        balance of all accounts per day
+
+        It is made from the storage on the first call and then updated
+        with the transactions of each append.
+
+        Returns
+        -------
+        BalanceHistory
+        """
+        if self._history is None:
+            df = self.query(columns=["imported_at", "date", "amount",
+                                     "total_balance", "origin"])
+            # each import is ordered like its export, latest first, so the
+            # imports are added one after the other, like by append
+            self._history = BalanceHistory()
+            for _, part in df.groupby("imported_at", sort=True):
+                self._history.update(part)
+        return self._history
+
+    def text_index(self):
+        """
+        The TextIndex of the words in the texts and counterpart accounts
+        of all stored transactions, by their `id`
+
+        It is made from the storage on the first call and then updated
+        with the transactions of each append.
+
+        Returns
+        -------
+        TextIndex
+        """
+        if self._index is None:
+            self._index = TextIndex()
+            self._update_text_index()
+        return self._index
+
+    def search(self, query, operator="and", columns=None):
+        """
+        The transactions that contain the words of a query, see
+        :meth:`TextIndex.search`
+
+        Returns
+        -------
+        pandas.DataFrame : the requested columns of the matching
+            transactions, see :meth:`Storage.query`
+        """
+        ids = self.text_index().search(query, operator=operator)
+        return self.storage.read_ids(ids, columns=columns)
+
+    def _update_text_index(self):
+        """adds the transactions stored after the indexed ones"""
+        df = self.storage.query(min_id=self._index.last_id + 1,
+                                columns=["id"] + INDEXED_COLUMNS)
+        self._index.add(df, ids=df["id"].values)
+
+    def __len__(self):
+        return self.storage.count()
+
+
+def content_hashes(df):
+    """
+    Stable hashes that identify transactions by their content
+
+    A transaction is identified by its date, amount, text, counterpart
+    accounts and origin. Identical transactions, e.g. two equal payments on
+    the same day, are told apart by the number of identical transactions
+    before them in `df`.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        transactions with the columns defined in COLUMNS
+
+    Returns
+    -------
+    numpy.ndarray of numpy.int64 : one hash per row
+    """
+    # normalize, so that equal transactions from different imports and
+    # in compact frames give equal hashes
+    dates = np.asarray(df["date"], dtype="datetime64[D]").astype(np.int64)
+    cents = np.round(np.asarray(df["amount"], dtype=np.float64) * 100)
+    key_df = pd.DataFrame({"date": dates, "cents": cents})
+    for col_name in ["text", "sender_account", "receiver_account", "origin"]:
+        values = np.array(df[col_name], dtype=object)
+        values[pd.isna(values)] = ""
+        key_df[col_name] = values
+
+    hashes = pd.util.hash_pandas_object(key_df, index=False)
+    occurrence = hashes.groupby(hashes.values).cumcount()
+
+    hashes = pd.util.hash_pandas_object(
+        pd.DataFrame({"hash": hashes.values,
+                      "occurrence": occurrence.values}),
+        index=False)
+    # sqlite stores signed 64 bit integers
+    return hashes.values.view(np.int64)
+
+
+def _to_sql_values(col, col_type):
+    """converts a column into a list of values sqlite can store"""
+    if col_type is np.datetime64:
+        dates = np.asarray(col, dtype="datetime64[D]")
+        days = dates.astype(np.int64).astype(object)
+        days[np.isnat(dates)] = None
+        return days.tolist()
+    elif col_type is np.float64:
+        # sqlite stores NaN as NULL
+        return np.asarray(col, dtype=np.float64).tolist()
+    else:
+        # np.array copies, the caller's frame is not changed
+        values = np.array(col, dtype=object)
+        values[pd.isna(values)] = None
+        return values.tolist()
+
+
+def _to_days(date):
+    """days since 1970-01-01 of a date, as stored in the database"""
+    return int(np.datetime64(date, "D").astype(np.int64))
+
+
+def _from_sql_frame(df):
+    """converts the columns of a frame read from sqlite to COLUMNS types"""
+    for col_name, col_type in COLUMNS.items():
+        if col_name not in df:
+            continue
+        if col_type is np.datetime64:
+            df[col_name] = pd.to_datetime(df[col_name], unit="D")
+        elif col_type is np.float64:
+            df[col_name] = df[col_name].astype(np.float64)
+        else:
+            col = df[col_name]
+            df[col_name] = col.where(col.notna(), np.nan)
+    return df
@@ -0,0 +1,349 @@
+from __future__ import absolute_import, print_function
+
+import unittest
+import os
+import os.path
+import shutil
+import sqlite3
+import tempfile
+
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+from numpy.testing import assert_array_equal, assert_array_almost_equal
+
+from .transactions import Storage, Transactions, INDEXES, content_hashes
+from .textimporter import read_csv
+from .definitions import COLUMNS
+from .compact import compact
+from .dkb import SupportedCsvTypes
+from .categorize import Rule, RuleSet
+
+
+class TransactionsTestCase(unittest.TestCase):
+    cash_file = os.path.join("pynance", "test_data", "dkb_cash_sample.csv")
+    visa_file = os.path.join("pynance", "test_data", "dkb_visa_sample.csv")
+
+    def test_roundtrip(self):
+        transactions = Transactions()
+        cash_df = read_csv(self.cash_file, SupportedCsvTypes.DKBCash)
+        visa_df = read_csv(self.visa_file, SupportedCsvTypes.DKBVisa)
+
+        self.assertEqual(3, transactions.append(cash_df))
+        self.assertEqual(4, transactions.append(visa_df))
+        self.assertEqual(7, len(transactions))
+
+        result_df = transactions.to_dataframe()
+
+        self.assertListEqual(["id", "imported_at"] + list(COLUMNS),
+                             list(result_df.columns))
+        assert_array_equal(np.arange(1, 8), result_df["id"].values)
+
+        expected_df = pd.concat([cash_df, visa_df], ignore_index=True)
+        assert_frame_equal(expected_df, result_df[list(COLUMNS)])
+
+    def test_append_compact(self):
+        transactions = Transactions()
+        transactions.append(read_csv(self.cash_file,
+                                     SupportedCsvTypes.DKBCash))
+        transactions.append(read_csv(self.cash_file,
+                                     SupportedCsvTypes.DKBCash,
+                                     compact=True))
+
+        result_df = transactions.to_dataframe()
+        assert_frame_equal(result_df.iloc[:3][list(COLUMNS)],
+                           result_df.iloc[3:][list(COLUMNS)]
+                           .reset_index(drop=True))
+
+    def test_large_insert(self):
+        n = 25000
+        df = pd.DataFrame({
+            "date": np.datetime64("2010-01-01") + np.arange(n) % 3650,
+            "amount": np.arange(n, dtype=np.float64),
+            "text": ["text %d" % i for i in range(n)]})
+        for col_name in COLUMNS:
+            if col_name not in df:
+                df[col_name] = np.nan
+
+        storage = Storage()
+        storage.batch_size = 10000
+        storage.insert(df, imported_at=42)
+
+        result_df = storage.read()
+        self.assertEqual(n, storage.count())
+        self.assertTrue((result_df["imported_at"] == 42).all())
+        assert_array_equal(df["date"].values, result_df["date"].values)
+        assert_array_equal(df["amount"].values, result_df["amount"].values)
+
+    def test_empty(self):
+        result_df = Transactions().to_dataframe()
+
+        self.assertEqual(0, len(result_df))
+        self.assertListEqual(["id", "imported_at"] + list(COLUMNS),
+                             list(result_df.columns))
+
+    def test_indexes(self):
+        storage = Storage()
+        cursor = storage._connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index'")
+        index_names = [row[0] for row in cursor.fetchall()]
+
+        for index_name in INDEXES:
+            self.assertIn(index_name, index_names)
+
+    def test_persistent(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "pynance.sqlite")
+
+            storage = Storage(path)
+            Transactions(storage).import_csv(self.cash_file,
+                                             SupportedCsvTypes.DKBCash)
+            storage.close()
+
+            transactions = Transactions(Storage(path))
+            self.assertEqual(3, len(transactions))
+            transactions.storage.close()
+        finally:
+            shutil.rmtree(directory)
+
+
+class DeduplicateTestCase(unittest.TestCase):
+    cash_file = os.path.join("pynance", "test_data", "dkb_cash_sample.csv")
+
+    def setUp(self):
+        self.cash_df = read_csv(self.cash_file, SupportedCsvTypes.DKBCash)
+
+    def test_content_hashes(self):
+        hashes = content_hashes(self.cash_df)
+
+        self.assertEqual(np.int64, hashes.dtype)
+        self.assertEqual(3, len(np.unique(hashes)))
+        # stable, also for compact frames
+        assert_array_equal(hashes, content_hashes(self.cash_df))
+        assert_array_equal(hashes,
+                           content_hashes(compact(self.cash_df)))
+
+    def test_content_hashes_identical_transactions(self):
+        df = pd.concat([self.cash_df.iloc[[1]]] * 3, ignore_index=True)
+        hashes = content_hashes(df)
+
+        # the same transaction three times gives three hashes,
+        # the first one equals the hash of the single transaction
+        self.assertEqual(3, len(np.unique(hashes)))
+        self.assertEqual(content_hashes(self.cash_df.iloc[[1]])[0],
+                         hashes[0])
+
+    def test_import_twice(self):
+        transactions = Transactions()
+
+        self.assertEqual(3, transactions.import_csv(
+            self.cash_file, SupportedCsvTypes.DKBCash))
+        self.assertEqual(0, transactions.import_csv(
+            self.cash_file, SupportedCsvTypes.DKBCash))
+        self.assertEqual(3, len(transactions))
+        self.assertListEqual(["DE95500105178154844163"] * 3,
+                             transactions.to_dataframe()["origin"].tolist())
+
+    def test_import_with_rules(self):
+        rules = RuleSet([Rule("rent", "rent", substring="miete")])
+
+        transactions = Transactions()
+        transactions.import_csv(self.cash_file, SupportedCsvTypes.DKBCash,
+                                rules=rules)
+        df = transactions.to_dataframe()
+        self.assertListEqual(["rent"], df["category"].dropna().tolist())
+
+    def test_balances_updated(self):
+        transactions = Transactions()
+        transactions.append(self.cash_df.iloc[1:], deduplicate=True)
+
+        history = transactions.balances()
+        self.assertAlmostEqual(1248.54 + 12.16,
+                               history.frame()["total"].values[-1])
+
+        transactions.append(self.cash_df, deduplicate=True)
+        self.assertIs(history, transactions.balances())
+        self.assertAlmostEqual(1248.54, history.frame()["total"].values[-1])
+
+        # made from the storage like it was updated
+        rebuilt = Transactions(transactions.storage).balances()
+        pd.testing.assert_frame_equal(history.frame(), rebuilt.frame())
+
+    def test_search_updated(self):
+        transactions = Transactions()
+        transactions.append(self.cash_df.iloc[1:], deduplicate=True)
+
+        found = transactions.search("miete")
+        self.assertListEqual(["Miete 2017"], found["text"].tolist())
+
+        transactions.append(self.cash_df, deduplicate=True)
+        found = transactions.search("flixbus", columns=["id", "amount"])
+        self.assertListEqual(["id", "amount"], list(found.columns))
+        self.assertListEqual([3], found["id"].tolist())
+        self.assertEqual(0, len(transactions.search("bahn")))
+
+    def test_overlapping_exports(self):
+        """
+        the later export covers the earlier one and one more transaction
+        """
+        earlier_df = self.cash_df.iloc[1:].reset_index(drop=True)
+        later_df = self.cash_df
+
+        transactions = Transactions()
+        self.assertEqual(2, transactions.append(earlier_df,
+                                                deduplicate=True))
+        self.assertEqual(1, transactions.append(later_df, deduplicate=True))
+
+        stored = transactions.query(columns=["date", "amount",
+                                             "total_balance"])
+        stored = stored.sort_values("total_balance").reset_index(drop=True)
+        expected = later_df[["date", "amount", "total_balance"]] \
+            .sort_values("total_balance").reset_index(drop=True)
+        assert_frame_equal(expected, stored)
+
+    def test_aggregation_updated(self):
+        transactions = Transactions()
+        transactions.append(self.cash_df.iloc[1:], deduplicate=True)
+
+        cube = transactions.aggregation()
+        self.assertEqual(-10.0 + 120.0,
+                         cube.query("A", [])["sum"].sum())
+
+        # only the new transaction is added to the cube
+        transactions.append(self.cash_df, deduplicate=True)
+        self.assertIs(cube, transactions.aggregation())
+        assert_array_almost_equal([self.cash_df["amount"].sum()],
+                                  cube.query("A", [])["sum"].values)
+
+    def test_true_duplicates_kept(self):
+        df = pd.concat([self.cash_df.iloc[[1]]] * 2, ignore_index=True)
+
+        transactions = Transactions()
+        self.assertEqual(2, transactions.append(df, deduplicate=True))
+        self.assertEqual(0, transactions.append(df, deduplicate=True))
+
+        df3 = pd.concat([self.cash_df.iloc[[1]]] * 3, ignore_index=True)
+        self.assertEqual(1, transactions.append(df3, deduplicate=True))
+
+    def test_insert_mask(self):
+        storage = Storage()
+        assert_array_equal([True, True], storage.insert(
+            self.cash_df.iloc[1:], return_mask=True))
+        assert_array_equal([True, False, False], storage.insert(
+            self.cash_df, deduplicate=True, return_mask=True))
+        self.assertEqual(0, storage.insert(self.cash_df, deduplicate=True))
+
+    def test_insert_rolled_back(self):
+        storage = Storage()
+        storage.batch_size = 1
+        df = self.cash_df.copy()
+        # the last row cannot be stored
+        df["text"] = df["text"].astype(object)
+        df.loc[df.index[-1], "text"] = object()
+        self.assertRaises(sqlite3.InterfaceError, storage.insert, df,
+                          deduplicate=True)
+        self.assertEqual(0, storage.count())
+
+        self.assertEqual(3, storage.insert(self.cash_df, deduplicate=True))
+        self.assertEqual(3, storage.count())
+
+    def test_migrate_old_database(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "old.sqlite")
+            connection = sqlite3.connect(path)
+            connection.execute(
+                "CREATE TABLE transactions (id INTEGER PRIMARY KEY "
+                "AUTOINCREMENT, imported_at INTEGER NOT NULL, %s)"
+                % ", ".join(COLUMNS))
+            connection.close()
+
+            storage = Storage(path)
+            self.assertEqual(3, storage.insert(self.cash_df,
+                                               deduplicate=True))
+            storage.close()
+        finally:
+            shutil.rmtree(directory)
+
+
+class QueryTestCase(unittest.TestCase):
+    def setUp(self):
+        n = 1000
+        self.df = pd.DataFrame({
+            "date": np.datetime64("2018-01-01") + np.arange(n) // 2,
+            "amount": np.where(np.arange(n) % 2, 10.0, -5.0),
+            "text": ["text %d" % i for i in range(n)],
+            "origin": np.where(np.arange(n) % 4 < 2, "cash", "visa"),
+            "category": np.where(np.arange(n) % 3, "food", "rent")})
+        for col_name, col_type in COLUMNS.items():
+            if col_name not in self.df:
+                self.df[col_name] = pd.Series(np.nan, index=self.df.index,
+                                              dtype=object
+                                              if col_type is str else None)
+
+        self.storage = Storage()
+        self.storage.insert(self.df)
+
+    def tearDown(self):
+        self.storage.close()
+
+    def assert_query(self, mask, **filters):
+        result_df = self.storage.query(**filters)
+        expected_df = self.df[mask].reset_index(drop=True)
+        assert_frame_equal(expected_df[list(COLUMNS)],
+                           result_df[list(COLUMNS)])
+
+    def test_query_all(self):
+        self.assert_query(np.ones(len(self.df), dtype=bool))
+
+    def test_query_date_range(self):
+        dates = self.df["date"]
+        self.assert_query((dates >= "2018-03-01") & (dates <= "2018-03-31"),
+                          start="2018-03-01",
+                          end=np.datetime64("2018-03-31"))
+        self.assert_query(dates >= "2019-05-01", start="2019-05-01")
+
+    def test_query_accounts_categories(self):
+        self.assert_query(self.df["origin"] == "visa", accounts=["visa"])
+        self.assert_query(self.df["category"] == "rent",
+                          categories=["rent"])
+        self.assert_query((self.df["origin"] == "cash") &
+                          (self.df["date"] <= "2018-01-10"),
+                          accounts=["cash"], end="2018-01-10")
+
+    def test_query_amounts(self):
+        amounts = self.df["amount"]
+        self.assert_query(amounts > 0, sign=1)
+        self.assert_query(amounts < 0, sign=-1)
+        self.assert_query(amounts >= 0, min_amount=0)
+        self.assert_query(amounts <= -5, max_amount=-5)
+
+    def test_query_columns(self):
+        result_df = self.storage.query(columns=["date", "amount"],
+                                       start="2018-01-02",
+                                       end="2018-01-02")
+
+        self.assertListEqual(["date", "amount"], list(result_df.columns))
+        self.assertEqual(2, len(result_df))
+
+    def test_query_invalid(self):
+        self.assertRaises(ValueError, self.storage.query,
+                          columns=["amount; DROP TABLE transactions"])
+        self.assertRaises(ValueError, self.storage.query, sign=0)
+
+    def test_query_uses_index(self):
+        cursor = self.storage._connection.execute(
+            "EXPLAIN QUERY PLAN SELECT amount FROM transactions "
+            "WHERE origin IN (?) AND date >= ? AND date <= ?",
+            ["cash", 17000, 17030])
+        plan = " ".join(str(row) for row in cursor.fetchall())
+
+        self.assertIn("idx_transactions_origin_date", plan)
+
+
+def test_suite():
+    suite = unittest.makeSuite(TransactionsTestCase)
+    suite.addTest(unittest.makeSuite(DeduplicateTestCase))
+    suite.addTest(unittest.makeSuite(QueryTestCase))
+    return suite
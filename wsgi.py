@@ -0,0 +1,23 @@
+"""
+Entry point for serving the dash app with several worker processes, e.g.
+
+    $> gunicorn --workers 4 --threads 4 --bind 0.0.0.0:8050 wsgi:application
+
+All workers share the parsed datasets and figures through a cache on disk,
+see pynance.dash_viz.datasets.make_cache. It is kept in PYNANCE_CACHE_DIR,
+a directory of the current user in the temp directory by default, and each
+of its caches is limited to PYNANCE_CACHE_MAX_MB. The directory must only
+be accessible by the user that runs the app, otherwise the app refuses to
+start.
+"""
+import getpass
+import os
+import tempfile
+
+# must be set before the app is imported, which creates its caches
+# a directory that another user created before is rejected by the cache
+os.environ.setdefault("PYNANCE_CACHE_DIR",
+                      os.path.join(tempfile.gettempdir(), "pynance-cache-%s"
+                                   % getpass.getuser()))
+
+from pynance.dash_viz.plot_flow import server as application  # noqa: E402,F401